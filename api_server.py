@@ -0,0 +1,53 @@
+import os
+import shutil
+import asyncio
+import threading
+
+# More than one worker only pays off if they share a cache; must be set before config loads
+os.environ.setdefault("CACHE_BACKEND", "sqlite")
+# Aggregate Prometheus samples across workers (read by metrics.render_metrics)
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.abspath("prometheus_multiproc"))
+# Keep API logs apart from the bot's so /log stays about the bot; one file per worker,
+# since each rotates its own (see config.LOG_FILE)
+os.environ.setdefault("LOG_FILE", "api_log.{pid}.txt")
+
+import uvicorn
+from config import API_HOST, API_PORT, API_WORKERS, CACHE_BACKEND, WARMUP_CACHES, logger
+
+# =========================
+# Standalone API Server
+# =========================
+
+def reset_metrics_dir():
+    """Start from an empty multiprocess directory so stale worker files are not counted."""
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+def warm_shared_cache():
+    """Fill the shared cache once for all workers, in the background."""
+    from fast_api import warm_caches
+    try:
+        asyncio.run(warm_caches())
+    except Exception as e:
+        logger.error(f"API cache warm-up failed: {e}")
+
+def main():
+    """
+    Run the FastAPI app on its own, with API_WORKERS uvicorn worker processes.
+    Pair with RUN_API_IN_BOT=false so the bot process only handles Telegram.
+    """
+    reset_metrics_dir()
+    if WARMUP_CACHES and CACHE_BACKEND == "sqlite":
+        threading.Thread(target=warm_shared_cache, daemon=True).start()
+    logger.info(f"Starting API on {API_HOST}:{API_PORT} with {API_WORKERS} worker(s), {CACHE_BACKEND} cache")
+    uvicorn.run(
+        "fast_api:api",
+        host=API_HOST,
+        port=API_PORT,
+        workers=API_WORKERS,
+        log_level="warning"
+    )
+
+if __name__ == "__main__":
+    main()
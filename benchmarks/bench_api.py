@@ -0,0 +1,113 @@
+"""
+API latency and throughput benchmark for /api/all-tmdb-files and /api/all-n-files.
+
+For each catalog size the collections are reseeded, then three scenarios run
+against an in-process uvicorn server:
+    cold  - caches cleared, every request is a distinct page (Mongo path)
+    warm  - the same pages again, served from the cache
+    deep  - caches cleared, pages near the end of the catalog (large skip)
+
+Usage:
+    python benchmarks/bench_api.py --sizes 10000 100000 --output api.json
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import bootstrap_env, seed_catalog, summarize, write_results
+
+bootstrap_env()
+
+import aiohttp
+import uvicorn
+
+API_PORT = 8766
+ENDPOINTS = {
+    "all-tmdb-files": "/api/all-tmdb-files",
+    "all-n-files": "/api/all-n-files",
+}
+
+
+async def start_server():
+    from fast_api import api
+    server = uvicorn.Server(uvicorn.Config(api, host="127.0.0.1", port=API_PORT, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+def clear_caches():
+    import fast_api
+    fast_api.all_tmdb_files_cache.clear()
+    fast_api.all_n_files_cache.clear()
+
+
+async def hit(session, path, offsets, limit, concurrency):
+    """Request every offset once with bounded concurrency; returns (latencies, elapsed)."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(offset):
+        async with semaphore:
+            start = time.perf_counter()
+            async with session.get(
+                f"http://127.0.0.1:{API_PORT}{path}", params={"offset": offset, "limit": limit}
+            ) as resp:
+                await resp.read()
+                if resp.status != 200:
+                    raise RuntimeError(f"{path} offset={offset} returned {resp.status}")
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(offset) for offset in offsets))
+    return latencies, time.perf_counter() - start
+
+
+async def run(sizes, pages=200, limit=10, concurrency=16):
+    from db import db
+    server, task = await start_server()
+    records = []
+    try:
+        for size in sizes:
+            await seed_catalog(db, size)
+            async with aiohttp.ClientSession() as session:
+                for name, path in ENDPOINTS.items():
+                    offsets = [i * limit for i in range(min(pages, size // limit))]
+                    deep = [max(0, size - (i + 1) * limit) for i in range(len(offsets))]
+
+                    clear_caches()
+                    scenarios = {"cold": await hit(session, path, offsets, limit, concurrency)}
+                    scenarios["warm"] = await hit(session, path, offsets, limit, concurrency)
+                    clear_caches()
+                    scenarios["deep"] = await hit(session, path, deep, limit, concurrency)
+
+                    for scenario, (latencies, elapsed) in scenarios.items():
+                        record = {"name": f"api.{name}.{scenario}.{size}", "size": size}
+                        record.update(summarize(latencies, elapsed))
+                        records.append(record)
+                        print(f"{record['name']:<40} p50={record['p50_ms']:>9}ms "
+                              f"p95={record['p95_ms']:>9}ms {record['throughput_rps']:>8} rps")
+    finally:
+        server.should_exit = True
+        await task
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--output", default="bench_api.json")
+    args = parser.parse_args()
+    records = asyncio.run(run(args.sizes, args.pages, args.limit, args.concurrency))
+    write_results(args.output, records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+In-memory catalog engine (catalog.py) over synthetic titles, without Mongo.
+
+Builds the engine from `--size` synthetic titles, then pages through the
+listing under several filters. "cold" is the first page after a change (masks
+and sort orders rebuilt); the percentiles are the following pages. Needs numpy.
+
+Usage:
+    python benchmarks/bench_catalog.py --size 100000 --pages 200 --output catalog.json
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import bootstrap_env, summarize, synthetic_title, write_results
+
+bootstrap_env()
+
+SCENARIOS = {
+    "unfiltered": {},
+    "genre": {"genre": "Drama"},
+    "type": {"tmdb_type": "movie"},
+    "cast": {"cast": "Actor 17"},
+    "q": {"q": "dark king"},
+}
+
+
+def run(size=100_000, pages=200, limit=10):
+    from catalog import CatalogEngine, np
+    if np is None:
+        print("catalog: numpy is not installed, skipped")
+        return []
+    rng = random.Random(42)
+    docs = []
+    for i in range(size):
+        doc, _ = synthetic_title(i, rng)
+        doc["_id"] = i
+        docs.append(doc)
+    start = time.perf_counter()
+    engine = CatalogEngine.build(docs)
+    build_seconds = time.perf_counter() - start
+    print(f"catalog.build    {size} titles in {build_seconds:.2f}s")
+
+    records = []
+    for name, filters in SCENARIOS.items():
+        for sort in ("release_date", "rating"):
+            engine.upsert_title(docs[0])  # A change drops cached masks and orders
+            start = time.perf_counter()
+            engine.query(filters, sort, True, 0, limit)
+            cold = time.perf_counter() - start
+            latencies = []
+            start = time.perf_counter()
+            for page in range(1, pages + 1):
+                t = time.perf_counter()
+                engine.query(filters, sort, True, page * limit, limit)
+                latencies.append(time.perf_counter() - t)
+            record = {
+                "name": f"catalog.{name}.{sort}",
+                "size": size,
+                "build_s": round(build_seconds, 2),
+                "cold_ms": round(cold * 1000, 3),
+                **summarize(latencies, time.perf_counter() - start),
+            }
+            records.append(record)
+            print(f"{record['name']:<32} cold {record['cold_ms']:>8}ms  p50 {record['p50_ms']}ms  p99 {record['p99_ms']}ms")
+
+    start = time.perf_counter()
+    for doc in docs[:1000]:
+        engine.upsert_title(doc)
+    records.append({"name": "catalog.upsert", "size": size, "per_upsert_us": round((time.perf_counter() - start) * 1000, 1)})
+    print(f"catalog.upsert   {records[-1]['per_upsert_us']}us per title")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--output", default="bench_catalog.json")
+    args = parser.parse_args()
+    write_results(args.output, run(args.size, args.pages, args.limit))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+File delivery throughput through DeliveryPool with rate-limited fake clients.
+
+Each fake client allows `rate` copy_message calls per second and raises
+FloodWait beyond that, like a single Telegram bot under flood control. The
+same burst of deliveries is sent through pools of increasing size; aggregate
+throughput should scale roughly linearly until the offered load is met.
+
+No Telegram or mongod needed.
+
+Usage:
+    python benchmarks/bench_delivery.py --sizes 1 2 4 8 --sends 2000 --output delivery.json
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import RateLimitedFakeClient, bootstrap_env, summarize, write_results
+
+bootstrap_env()
+
+
+async def bench_pool(size, sends, users, concurrency, rate, latency, strategy):
+    from delivery import DeliveryPool
+    pool = DeliveryPool(strategy, max_wait=600)
+    clients = [RateLimitedFakeClient(rate, latency=latency, name=f"fake_{i}") for i in range(size)]
+    for client in clients:
+        pool.add(client.name, client)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await pool.copy_message(chat_id=i % users, from_chat_id=-1001234567890, message_id=i, key=i % users)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(sends)))
+    elapsed = time.perf_counter() - start
+    return {
+        "name": f"delivery.{strategy}.pool_{size}",
+        "pool_size": size,
+        "seconds": round(elapsed, 3),
+        "floodwaits": sum(c.floodwaits for c in clients),
+        "per_client": [c.calls.get("copy_message", 0) for c in clients],
+        **summarize(latencies, elapsed),
+    }
+
+
+async def run(sizes=(1, 2, 4, 8), sends=2000, users=500, concurrency=64, rate=30, latency=0.01,
+              strategies=("least_loaded", "hash")):
+    records = []
+    for strategy in strategies:
+        for size in sizes:
+            record = await bench_pool(size, sends, users, concurrency, rate, latency, strategy)
+            records.append(record)
+            print(f"{record['name']:<32} {record['throughput_rps']:>8} sends/s "
+                  f"p95 {record['p95_ms']:>9}ms  floodwaits {record['floodwaits']}")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--sends", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--rate", type=int, default=30, help="Sends per second each fake client allows")
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--strategies", nargs="+", default=["least_loaded", "hash"])
+    parser.add_argument("--output", default="bench_delivery.json")
+    args = parser.parse_args()
+    records = asyncio.run(run(args.sizes, args.sends, args.users, args.concurrency, args.rate,
+                              args.latency, args.strategies))
+    write_results(args.output, records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Image proxy benchmark against the stub image host.
+
+    cold - first request for each poster: fetch the original, resize, cache
+    warm - the same URLs again, served from the disk cache
+    304  - revalidation with If-None-Match
+
+Also reports bytes served per poster versus the original. No mongod needed.
+
+Usage:
+    python benchmarks/bench_images.py --posters 50 --width 342 --output images.json
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import StubTmdbServer, bootstrap_env, summarize, write_results
+
+bootstrap_env()
+
+import aiohttp
+import uvicorn
+
+API_PORT = 8767
+
+
+async def start_server():
+    from fast_api import api
+    server = uvicorn.Server(uvicorn.Config(api, host="127.0.0.1", port=API_PORT, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server, task
+
+
+async def hit(session, urls, concurrency, headers=None):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, sizes, statuses = [], [], []
+
+    async def one(url):
+        async with semaphore:
+            start = time.perf_counter()
+            async with session.get(url, headers=headers or {}) as resp:
+                body = await resp.read()
+                statuses.append(resp.status)
+            latencies.append(time.perf_counter() - start)
+            sizes.append(len(body))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(url) for url in urls))
+    return latencies, sizes, statuses, time.perf_counter() - start
+
+
+async def run(posters=50, width=342, concurrency=8):
+    stub = StubTmdbServer()
+    await stub.start()
+    server, task = await start_server()
+    urls = [f"http://127.0.0.1:{API_PORT}/img/w{width}/poster{i}.jpg" for i in range(posters)]
+    accept = {"Accept": "image/webp,*/*"}
+    records = []
+    try:
+        async with aiohttp.ClientSession() as session:
+            for scenario in ("cold", "warm"):
+                latencies, sizes, statuses, elapsed = await hit(session, urls, concurrency, accept)
+                records.append({
+                    "name": f"images.{scenario}", "width": width,
+                    "avg_bytes": round(sum(sizes) / len(sizes)),
+                    "original_bytes": len(stub.poster_bytes()),
+                    "errors": sum(1 for s in statuses if s != 200),
+                    **summarize(latencies, elapsed),
+                })
+            async with session.get(urls[0], headers=accept) as resp:
+                etag = resp.headers["ETag"]
+            latencies, _, statuses, elapsed = await hit(session, urls[:1] * posters, concurrency, {**accept, "If-None-Match": etag})
+            records.append({"name": "images.304", "not_modified": statuses.count(304), **summarize(latencies, elapsed)})
+    finally:
+        server.should_exit = True
+        await task
+        await stub.stop()
+    for record in records:
+        print(f"{record['name']:<14} p50 {record['p50_ms']:>9}ms p95 {record['p95_ms']:>9}ms "
+              f"{record['throughput_rps']:>8} req/s  {record.get('avg_bytes', '-')} bytes")
+    print(f"upstream image fetches: {stub.image_requests} for {posters} posters")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posters", type=int, default=50)
+    parser.add_argument("--width", type=int, default=342)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--output", default="bench_images.json")
+    args = parser.parse_args()
+    records = asyncio.run(run(args.posters, args.width, args.concurrency))
+    write_results(args.output, records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Ingest benchmarks against a local mongod and the stub TMDB server.
+
+    writes - the old per-file find_one + update_one upsert versus the
+             coalesced UpsertBatcher used by upsert_file_with_tmdb_info
+    worker - end-to-end file_queue_worker ingest rate with a fake client
+
+Usage:
+    python benchmarks/bench_ingest.py --files 20000 --output ingest.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import FakeClient, StubTmdbServer, WORDS, bootstrap_env, write_results
+
+bootstrap_env()
+
+
+def make_files(count, titles, seed=7):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    for i in range(count):
+        tmdb_id = rng.randint(1, titles)
+        yield tmdb_id, {
+            "tmdb_id": tmdb_id,
+            "tmdb_type": "movie",
+            "title": f"Title {tmdb_id}",
+            "rating": 7.0,
+        }, {
+            "channel_id": -1001234567890,
+            "message_id": i,
+            "file_name": f"Title.{tmdb_id}.{i}.1080p",
+            "file_size": 1024 * i,
+            "file_format": "video/x-matroska",
+            "date": now,
+        }
+
+
+async def bench_legacy(col, items):
+    start = time.perf_counter()
+    for tmdb_id, tmdb_info, file_info in items:
+        await col.find_one({"tmdb_id": tmdb_id, "tmdb_type": "movie"})
+        await col.update_one(
+            {"tmdb_id": tmdb_id, "tmdb_type": "movie"},
+            {"$set": tmdb_info, "$addToSet": {"files": file_info}},
+            upsert=True
+        )
+    return time.perf_counter() - start
+
+
+async def bench_batched(col, items, concurrency):
+    from utility import UpsertBatcher
+    batcher = UpsertBatcher(col)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(tmdb_id, tmdb_info, file_info):
+        async with semaphore:
+            return await batcher.upsert(
+                {"tmdb_id": tmdb_id, "tmdb_type": "movie"},
+                {"$set": tmdb_info, "$addToSet": {"files": file_info}}
+            )
+
+    start = time.perf_counter()
+    new_flags = await asyncio.gather(*(one(*item) for item in items))
+    await batcher.flush()
+    return time.perf_counter() - start, sum(new_flags)
+
+
+async def run_writes(files, titles, concurrency):
+    from db import db
+    items = list(make_files(files, titles))
+    await db.drop_collection("bench_legacy")
+    await db.drop_collection("bench_batched")
+    await db["bench_batched"].create_index([("tmdb_id", 1), ("tmdb_type", 1)], unique=True)
+
+    legacy = await bench_legacy(db["bench_legacy"], items)
+    batched, new_titles = await bench_batched(db["bench_batched"], items, concurrency)
+    expected = await db["bench_legacy"].count_documents({})
+    if new_titles != expected:
+        print(f"WARNING: batched path reported {new_titles} new titles, legacy created {expected}")
+    return [
+        {"name": "ingest.writes.legacy", "files": files, "seconds": round(legacy, 3),
+         "files_per_s": round(files / legacy, 1)},
+        {"name": "ingest.writes.batched", "files": files, "seconds": round(batched, 3),
+         "files_per_s": round(files / batched, 1), "new_titles": new_titles},
+    ]
+
+
+async def run_worker(files, tmdb_latency):
+    import utility
+    from db import db, ensure_indexes
+    utility.API_CALL_DELAY = 0  # The fake client has its own latency; skip the flood-safety pause
+
+    from jobs import enqueue_jobs, queue_depth
+
+    rng = random.Random(11)
+    for name in ("files", "tmdb_files", "ingest_jobs", "dead_letters"):
+        await db.drop_collection(name)
+    await ensure_indexes()
+    stub = StubTmdbServer(latency=tmdb_latency)
+    await stub.start()
+    client = FakeClient(latency=0.005)
+    worker = asyncio.create_task(utility.file_queue_worker(client))
+    try:
+        start = time.perf_counter()
+        batch = []
+        for i in range(files):
+            name = f"{' '.join(rng.sample(WORDS, 2)).title()} {rng.randint(1990, 2024)} 1080p WEB-DL x264 {i}"
+            batch.append({
+                "channel_id": -1001234567890,
+                "message_id": i,
+                "file_name": name,
+                "file_size": 1024,
+                "file_format": "video/x-matroska",
+                "date": datetime.now(timezone.utc),
+            })
+        await enqueue_jobs(batch)
+        while await queue_depth():
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - start
+    finally:
+        worker.cancel()
+        await stub.stop()
+    return [{
+        "name": "ingest.worker", "files": files, "seconds": round(elapsed, 3),
+        "files_per_s": round(files / elapsed, 1), "tmdb_requests": stub.requests,
+        "titles": await db["files"].count_documents({}),
+        "dead_letters": await db["dead_letters"].count_documents({}),
+    }]
+
+
+async def run(files=5000, titles=1000, concurrency=8, worker_files=2000, tmdb_latency=0.02):
+    records = await run_writes(files, titles, concurrency)
+    records += await run_worker(worker_files, tmdb_latency)
+    for record in records:
+        print(f"{record['name']:<28} {record['seconds']:>9}s {record['files_per_s']:>10} files/s")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--titles", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--worker-files", type=int, default=2000)
+    parser.add_argument("--tmdb-latency", type=float, default=0.02)
+    parser.add_argument("--output", default="bench_ingest.json")
+    args = parser.parse_args()
+    records = asyncio.run(run(args.files, args.titles, args.concurrency, args.worker_files, args.tmdb_latency))
+    write_results(args.output, records)
+
+
+if __name__ == "__main__":
+    main()
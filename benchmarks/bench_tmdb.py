@@ -0,0 +1,86 @@
+"""
+TMDB client under a rate-limited stub server.
+
+The stub answers more than `--server-limit` requests per second with 429.
+The same burst of get_by_id lookups runs twice: once with the client-side
+limiter effectively off and once at `--client-limit` requests per second.
+Every title is looked up by two workers, so in-flight deduplication should
+halve the requests sent. No mongod needed.
+
+Usage:
+    python benchmarks/bench_tmdb.py --titles 300 --server-limit 50 --client-limit 40 --output tmdb.json
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import StubTmdbServer, bootstrap_env, summarize, write_results
+
+bootstrap_env()
+
+
+async def bench_limit(name, client_limit, titles, concurrency, server_limit):
+    import tmdb
+    tmdb.tmdb_limiter = tmdb.TokenBucket(client_limit)
+    stub = StubTmdbServer(rate_limit=server_limit)
+    await stub.start()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one(tmdb_id):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await tmdb.get_by_id("movie", tmdb_id)
+            except tmdb.TmdbUnavailable:
+                failures += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    try:
+        # Each title twice, as when several ingest workers resolve files of the same title
+        await asyncio.gather(*(one(i // 2) for i in range(titles * 2)))
+    finally:
+        elapsed = time.perf_counter() - start
+        await tmdb.close_session()
+        await stub.stop()
+    return {
+        "name": f"tmdb.{name}",
+        "client_limit": client_limit,
+        "server_limit": server_limit,
+        "lookups": titles * 2,
+        "failures": failures,
+        "requests_sent": stub.requests,
+        "throttled_429": stub.throttled,
+        **summarize(latencies, elapsed),
+    }
+
+
+async def run(titles=300, concurrency=32, server_limit=50, client_limit=40):
+    records = []
+    for name, limit in (("unlimited", 10_000), ("limited", client_limit)):
+        record = await bench_limit(name, limit, titles, concurrency, server_limit)
+        records.append(record)
+        print(f"{record['name']:<16} {record['throughput_rps']:>8} lookups/s  failures {record['failures']:>4}  "
+              f"sent {record['requests_sent']:>5}  429s {record['throttled_429']:>5}  p95 {record['p95_ms']}ms")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--titles", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--server-limit", type=int, default=50, help="Requests per second before the stub sends 429")
+    parser.add_argument("--client-limit", type=float, default=40, help="TMDB_RATE_LIMIT for the limited run")
+    parser.add_argument("--output", default="bench_tmdb.json")
+    args = parser.parse_args()
+    records = asyncio.run(run(args.titles, args.concurrency, args.server_limit, args.client_limit))
+    write_results(args.output, records)
+
+
+if __name__ == "__main__":
+    main()
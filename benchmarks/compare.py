@@ -0,0 +1,58 @@
+"""
+Compare two benchmark result files and flag regressions.
+
+Usage:
+    python benchmarks/compare.py baseline.json current.json [--threshold 0.10]
+
+Exits with status 1 if any metric regressed by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+# Metric -> True if higher is better
+METRICS = {
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "throughput_rps": True,
+    "files_per_s": True,
+}
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        payload = json.load(f)
+    return payload, {record["name"]: record for record in payload["results"]}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+
+    base_meta, base = load(args.baseline)
+    cur_meta, cur = load(args.current)
+    print(f"baseline {base_meta.get('commit')}  vs  current {cur_meta.get('commit')}")
+
+    regressions = 0
+    for name in sorted(set(base) & set(cur)):
+        for metric, higher_is_better in METRICS.items():
+            old, new = base[name].get(metric), cur[name].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION" if worse > args.threshold else ""
+            regressions += bool(flag)
+            print(f"{name:<40} {metric:<15} {old:>12} -> {new:>12} {change:+8.1%} {flag}")
+
+    for name in sorted(set(base) ^ set(cur)):
+        print(f"{name:<40} only in {'baseline' if name in base else 'current'}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
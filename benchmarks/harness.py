@@ -0,0 +1,315 @@
+"""
+Shared pieces for the offline benchmarks: environment bootstrap, synthetic
+catalog seeding, a stub TMDB HTTP server, a fake Pyrogram client and a
+machine-readable result writer.
+
+Nothing here talks to Telegram or the real TMDB API. Only a local mongod is
+required (MONGO_URI, default mongodb://localhost:27017).
+"""
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+from PIL import Image
+from pyrogram.errors import FloodWait
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BENCH_DB_NAME = "bot4index_bench"
+STUB_TMDB_PORT = 8765
+
+# =========================
+# Environment Bootstrap
+# =========================
+
+def bootstrap_env(tmdb_port=STUB_TMDB_PORT):
+    """
+    Point the bot modules at the benchmark database and the stub TMDB server.
+    Must run before config/db/utility/fast_api are imported.
+    """
+    sys.path.insert(0, ROOT)
+    for key, value in {
+        "API_ID": "1", "API_HASH": "x", "BOT_TOKEN": "x", "OWNER_ID": "1",
+        "UPDATE_CHANNEL_ID": "0", "TMDB_CHANNEL_ID": "0", "LOG_CHANNEL_ID": "0",
+        "BOT_USERNAME": "bench_bot", "MY_DOMAIN": "http://localhost",
+        "MONGO_URI": "mongodb://localhost:27017", "TMDB_API_KEY": "bench",
+        "TMDB_RATE_LIMIT": "10000",  # The stub is not rate limited unless asked to be
+    }.items():
+        os.environ.setdefault(key, value)
+    os.environ["DB_NAME"] = BENCH_DB_NAME
+    os.environ["TMDB_API_URL"] = f"http://127.0.0.1:{tmdb_port}/3"
+    os.environ["IMAGE_UPSTREAM_URL"] = f"http://127.0.0.1:{tmdb_port}/t/p"
+    os.environ.setdefault("IMAGE_CACHE_DIR", tempfile.mkdtemp(prefix="bench_images_"))
+
+# =========================
+# Synthetic Catalog
+# =========================
+
+GENRES = ["Action", "Adventure", "Animation", "Comedy", "Crime", "Drama",
+          "Fantasy", "Horror", "Mystery", "Romance", "Thriller", "Sci-Fi"]
+WORDS = ["night", "river", "shadow", "king", "last", "city", "dark", "star",
+         "storm", "blood", "silent", "broken", "lost", "golden", "wild", "iron"]
+
+
+def synthetic_title(i, rng):
+    """Returns (title document, its tmdb_files documents)."""
+    tmdb_type = "tv" if i % 4 == 0 else "movie"
+    release = datetime(1970, 1, 1) + timedelta(days=rng.randint(0, 20000))
+    files = [{
+        "channel_id": -1001000000000,
+        "message_id": i * 10 + n,
+        "file_name": f"{' '.join(rng.sample(WORDS, 3)).title()} {release.year} 1080p {i}-{n}",
+        "file_size": rng.randint(10**8, 4 * 10**9),
+        "file_format": "video/x-matroska",
+        "date": datetime.now(timezone.utc),
+        "tmdb_type": tmdb_type,
+        "tmdb_id": i,
+    } for n in range(rng.randint(1, 4))]
+    return {
+        "tmdb_id": i,
+        "tmdb_type": tmdb_type,
+        "title": " ".join(rng.sample(WORDS, 3)).title(),
+        "rating": round(rng.uniform(1, 9.5), 1),
+        "language": "English",
+        "genre": rng.sample(GENRES, 2),
+        "release_date": release.strftime("%Y-%m-%d"),
+        "story": "A synthetic story. " * 10,
+        "directors": [{"name": f"Director {rng.randint(1, 2000)}", "profile_path": None}],
+        "stars": [{"name": f"Actor {rng.randint(1, 20000)}", "profile_path": None} for _ in range(5)],
+        "trailer_url": None,
+        "poster_url": f"https://image.tmdb.org/t/p/original/poster{i}.jpg",
+    }, files
+
+
+def synthetic_n_file(i, rng):
+    return {
+        "channel_id": -1002000000000,
+        "message_id": i,
+        "file_name": f"{' '.join(rng.sample(WORDS, 4))} {i}",
+        "file_size": rng.randint(10**6, 10**9),
+        "file_format": "video/mp4",
+        "date": datetime.now(timezone.utc),
+    }
+
+
+async def seed_catalog(db, size, batch=5000, seed=42):
+    """Replace `files` and `n_files` with `size` synthetic entries each (1-4 tmdb_files per title)."""
+    from db import ensure_indexes
+    rng = random.Random(seed)
+    for name in ("files", "tmdb_files", "n_files"):
+        await db.drop_collection(name)
+    await ensure_indexes()
+    for start in range(0, size, batch):
+        end = min(start + batch, size)
+        titles = [synthetic_title(i, rng) for i in range(start, end)]
+        await db["files"].insert_many([title for title, _ in titles], ordered=False)
+        await db["tmdb_files"].insert_many([f for _, files in titles for f in files], ordered=False)
+        await db["n_files"].insert_many([synthetic_n_file(i, rng) for i in range(start, end)], ordered=False)
+
+# =========================
+# Stub TMDB Server
+# =========================
+
+class StubTmdbServer:
+    """
+    Minimal aiohttp server answering the TMDB endpoints tmdb.py uses, plus
+    the image host (/t/p/<size>/<file>) with a full-size JPEG poster.
+    `latency` adds a fixed delay per request to mimic the network.
+    `rate_limit` answers API requests beyond that many per second with 429
+    and a Retry-After header, like TMDB does.
+    """
+    def __init__(self, port=STUB_TMDB_PORT, latency=0.0, rate_limit=None):
+        self.port = port
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.requests = 0
+        self.image_requests = 0
+        self.throttled = 0
+        self._window = (0, 0)  # (second, requests in it)
+        self._runner = None
+        self._poster = None
+
+    def poster_bytes(self):
+        """A 2000x3000 JPEG, about the size of a TMDB "original" poster."""
+        if self._poster is None:
+            noise = Image.effect_noise((2000, 3000), 40)
+            gradient = Image.linear_gradient("L").resize((2000, 3000))
+            img = Image.merge("RGB", (noise, gradient, gradient.transpose(Image.FLIP_TOP_BOTTOM)))
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=90)
+            self._poster = out.getvalue()
+        return self._poster
+
+    async def _handle(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if request.path.startswith("/t/p/"):
+            self.image_requests += 1
+            return web.Response(body=self.poster_bytes(), content_type="image/jpeg")
+        if self.rate_limit:
+            second = int(time.monotonic())
+            count = self._window[1] + 1 if self._window[0] == second else 1
+            self._window = (second, count)
+            if count > self.rate_limit:
+                self.throttled += 1
+                return web.json_response({"status_code": 25}, status=429, headers={"Retry-After": "1"})
+        parts = request.path.strip("/").split("/")[1:]  # drop the "3" version prefix
+        if parts[0] == "search":
+            tmdb_id = zlib.crc32(request.query.get("query", "").encode()) % 100000
+            date_key = "release_date" if parts[1] == "movie" else "first_air_date"
+            return web.json_response({"results": [{"id": tmdb_id, date_key: ""}]})
+        tmdb_type, tmdb_id = parts[0], int(parts[1])
+        suffix = parts[2] if len(parts) > 2 else None
+        if suffix == "images":
+            return web.json_response({"backdrops": [{"file_path": f"/backdrop{tmdb_id}.jpg"}]})
+        if suffix == "credits":
+            return web.json_response({
+                "cast": [{"name": f"Actor {tmdb_id % 997 + n}", "profile_path": None} for n in range(5)],
+                "crew": [{"job": "Director", "name": f"Director {tmdb_id % 101}", "profile_path": None}],
+            })
+        if suffix == "videos":
+            return web.json_response({"results": [{"site": "YouTube", "type": "Trailer", "key": "bench"}]})
+        return web.json_response({
+            "id": tmdb_id,
+            "title": f"Stub Title {tmdb_id}",
+            "name": f"Stub Title {tmdb_id}",
+            "vote_average": 7.3,
+            "genres": [{"name": "Drama"}, {"name": "Action & Adventure"}],
+            "spoken_languages": [{"english_name": "English"}],
+            "release_date": "2020-01-01",
+            "overview": "Stub overview.",
+            "poster_path": f"/poster{tmdb_id}.jpg",
+        })
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("GET", "/{tail:.*}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+# =========================
+# Fake Pyrogram Client
+# =========================
+
+class FakeMessage:
+    def __init__(self, chat_id, message_id):
+        self.chat = type("Chat", (), {"id": chat_id})()
+        self.id = message_id
+
+
+class FakeClient:
+    """
+    Stands in for pyrogram.Client in the paths the benchmarks exercise.
+    Each call sleeps `latency` seconds and is counted per method.
+    """
+    def __init__(self, latency=0.0, name="fake"):
+        self.latency = latency
+        self.name = name
+        self.calls = {}
+        self._next_id = 1
+
+    async def _call(self, method, chat_id):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self._next_id += 1
+        return FakeMessage(chat_id, self._next_id)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self._call("send_message", chat_id)
+
+    async def send_photo(self, chat_id, photo=None, **kwargs):
+        return await self._call("send_photo", chat_id)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        return await self._call("copy_message", chat_id)
+
+    async def delete_messages(self, chat_id, message_ids, **kwargs):
+        return await self._call("delete_messages", chat_id)
+
+
+class RateLimitedFakeClient(FakeClient):
+    """
+    FakeClient that behaves like one Telegram bot under flood control: more
+    than `rate` sends in any one-second window raise FloodWait.
+    """
+    def __init__(self, rate, flood_wait=1, latency=0.0, name="fake"):
+        super().__init__(latency=latency, name=name)
+        self.rate = rate
+        self.flood_wait = flood_wait
+        self.floodwaits = 0
+        self._window_start = 0.0
+        self._window_count = 0
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        now = asyncio.get_running_loop().time()
+        if now - self._window_start >= 1:
+            self._window_start, self._window_count = now, 0
+        self._window_count += 1
+        if self._window_count > self.rate:
+            self.floodwaits += 1
+            raise FloodWait(value=self.flood_wait)
+        return await super().copy_message(chat_id, from_chat_id, message_id, **kwargs)
+
+# =========================
+# Results
+# =========================
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed):
+    """Latency percentiles in milliseconds plus throughput in requests per second."""
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def write_results(path, results):
+    """Write results with run metadata as JSON so runs can be diffed by compare.py."""
+    payload = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "host": platform.node(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+    return payload
+
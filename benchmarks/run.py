@@ -0,0 +1,54 @@
+"""
+Run the whole benchmark suite and write one results file.
+
+Usage:
+    python benchmarks/run.py --sizes 10000 100000 1000000 --output results.json
+    python benchmarks/compare.py baseline.json results.json
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from harness import BENCH_DB_NAME, write_results
+
+import bench_api
+import bench_catalog
+import bench_delivery
+import bench_images
+import bench_ingest
+import bench_tmdb
+
+
+async def run(args):
+    records = await bench_api.run(args.sizes, args.pages, args.limit, args.concurrency)
+    records += await bench_ingest.run(worker_files=args.worker_files)
+    records += await bench_delivery.run(sends=args.delivery_sends)
+    records += await bench_images.run()
+    records += await bench_tmdb.run()
+    records += bench_catalog.run(max(args.sizes))
+    if not args.keep_db:
+        from db import mongo
+        await mongo.drop_database(BENCH_DB_NAME)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--worker-files", type=int, default=2000)
+    parser.add_argument("--delivery-sends", type=int, default=2000)
+    parser.add_argument("--keep-db", action="store_true", help="Keep the seeded benchmark database")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+    records = asyncio.run(run(args))
+    write_results(args.output, records)
+    print(f"Wrote {len(records)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
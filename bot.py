@@ -1,30 +1,42 @@
 # =========================
 # Imports
 # =========================
+from startup import profiler  # First, so startup timing includes the imports below
 import asyncio
 import base64
 import os
 import re
 import sys
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from collections import defaultdict
 
 from pyrogram import Client, enums, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.errors import ListenerTimeout
-import uvicorn
 
 from config import *
 from utility import (
     add_user, is_token_valid, authorize_user, is_user_authorized,
     generate_token, shorten_url, get_token_link, extract_channel_and_msg_id,
     safe_api_call, get_allowed_channels, extract_file_info,
-    delete_after_delay, queue_file_for_processing, file_queue_worker,
-    extract_tmdb_link, file_handler, remove_unwanted
+    delete_after_delay, queue_files_for_indexing, file_queue_worker,
+    extract_tmdb_link, file_handler, remove_unwanted,
+    delete_indexed_file, delete_tmdb_entry, get_delivery_record, remember_file_id
 )
-from db import db, users_col, tokens_col, files_col, allowed_channels_col, auth_users_col
-from fast_api import api
-from utility import upsert_file_with_tmdb_info
+from migrations import migrate_embedded_files, backfill_release_fields
+from jobs import (
+    LANE_OWNER, LANE_MANUAL, enqueue_jobs, lane_depths, list_dead_letters, replay_dead_letters
+)
+from facets import rebuild_facets
+from refresher import tmdb_refresher
+from db import (
+    db, users_col, tokens_col, files_col, tmdb_files_col, allowed_channels_col,
+    auth_users_col, facets_col, dead_letters_col, ensure_indexes
+)
+from metrics import timed_handler
+from scheduler import HandlerPool, scheduled
+from delivery import DeliveryPool, build_helper_clients, start_helpers
+from logs import stop_logging, log_tail_document, log_archive_document, LOG_TAIL_LINES
 
 # =========================
 # Constants & Globals
@@ -39,20 +51,53 @@ bot = Client(
     api_id=API_ID,
     api_hash=API_HASH,
     bot_token=BOT_TOKEN,
-    workers=1000,
+    workers=BOT_WORKERS,
     parse_mode=enums.ParseMode.HTML
 )
 
+# File sends are spread over the main bot and any helper clients started later
+delivery_pool = DeliveryPool(DELIVERY_STRATEGY)
+delivery_pool.add("main", bot, file_key=BOT_ID)
+
 # Track how many files each user has accessed in the current session
 user_file_count = defaultdict(int)
 
 copy_lock = asyncio.Lock()
 
+# Handlers run in per-class pools so a backfill or a long owner command never
+# delays /start deliveries; only the user pool sheds load
+user_pool = HandlerPool(
+    "user", USER_HANDLER_CONCURRENCY, USER_HANDLER_QUEUE,
+    busy_reply="⏳ The bot is very busy right now. Please try again in a minute."
+)
+ingest_pool = HandlerPool("ingest", INGEST_HANDLER_CONCURRENCY)
+admin_pool = HandlerPool("admin", ADMIN_HANDLER_CONCURRENCY)
+
 # =========================
 # Bot Command Handlers
 # =========================
 
+@bot.on_message(group=-1)
+async def first_update_probe(client, message):
+    """Reports the time from process start to the first update, then steps aside."""
+    if profiler.mark_first_update():
+        logger.info(f"First update received {profiler.time_to_first_update:.2f}s after start")
+        # Reported in the background so the update itself is not held up
+        bot.loop.create_task(report_first_update())
+    message.continue_propagation()
+
+async def report_first_update():
+    try:
+        await safe_api_call(bot.send_message(
+            LOG_CHANNEL_ID,
+            f"📨 First update received <b>{profiler.time_to_first_update:.2f}s</b> after start."
+        ))
+    except Exception as e:
+        logger.error(f"Failed to report first update: {e}")
+
 @bot.on_message(filters.command("start") & filters.private)
+@scheduled(user_pool)
+@timed_handler("start")
 async def start_handler(client, message):
     """
     Handles the /start command.
@@ -84,7 +129,7 @@ async def start_handler(client, message):
                 "expiry": {"$gt": now}
             })
             token_id = token_doc["token_id"] if token_doc else await generate_token(user_id)
-            short_link = shorten_url(get_token_link(token_id, bot_username))
+            short_link = await shorten_url(get_token_link(token_id, bot_username))
             await safe_api_call(message.reply_text(
                 "🔒<b>You Are Not Authorized</b>",
                 reply_markup=InlineKeyboardMarkup(
@@ -111,13 +156,20 @@ async def start_handler(client, message):
             return
 
         try:
-            sent = await safe_api_call(client.copy_message(
+            # Indexed files go out by stored file_id; anything else is copied from the channel
+            record = await get_delivery_record(b64.rstrip("="), channel_id, msg_id) or {}
+            sent, sender, file_key, new_file_id = await delivery_pool.send_file(
                 chat_id=message.chat.id,
                 from_chat_id=channel_id,
-                message_id=msg_id
-            ))
+                message_id=msg_id,
+                file_ids=record.get("file_ids"),
+                caption=record.get("caption"),
+                key=user_id
+            )
             user_file_count[user_id] += 1
-            bot.loop.create_task(delete_after_delay(client, sent.chat.id, sent.id))
+            bot.loop.create_task(delete_after_delay(sender, sent.chat.id, sent.id))
+            if record and new_file_id:
+                bot.loop.create_task(remember_file_id(channel_id, msg_id, file_key, new_file_id))
         except Exception as e:
             await safe_api_call(message.reply_text(f"Failed to send file: {e}"))
         return
@@ -131,20 +183,26 @@ async def start_handler(client, message):
     ))
 
 @bot.on_message(filters.private & filters.user(OWNER_ID) & (filters.document | filters.video | filters.audio | filters.photo))
+@scheduled(ingest_pool)
+@timed_handler("owner_upload")
 async def channel_file_handler(client, message):
     media = message.video or message.document or message.audio
     caption = await remove_unwanted(message.caption if message.caption else media.file_name)
     async with copy_lock:
         cpy_msg = await safe_api_call(message.copy(TMDB_CHANNEL_ID, caption=f"<code>{caption}</code>", parse_mode=enums.ParseMode.HTML))
-    await file_handler(cpy_msg)
+    await file_handler(cpy_msg, lane=LANE_OWNER)
     await safe_api_call(message.delete())
 
 @bot.on_message(filters.channel & (filters.document | filters.video | filters.audio | filters.photo))
+@scheduled(ingest_pool)
+@timed_handler("channel_post")
 async def channel_file_handler(client, message):
     await file_handler(message)
 
 
 @bot.on_message(filters.command("index") & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("index")
 async def index_channel_files(client, message: Message):
     """
     Handles the /index command for the owner.
@@ -204,25 +262,27 @@ async def index_channel_files(client, message: Message):
         except Exception as e:
             await message.reply_text(f"Failed to get messages {batch_start}-{batch_end}: {e}")
             continue
-        for msg in messages:
-            if not msg:
-                continue
-            if msg.document or msg.video or msg.audio or msg.photo:
-                await queue_file_for_processing(
-                    msg,
-                    channel_id=channel_id,
-                    reply_func=message.reply_text
-                )
-                total_queued += 1
+        media_messages = [
+            msg for msg in messages
+            if msg and (msg.document or msg.video or msg.audio or msg.photo)
+        ]
+        # Parses the whole batch in the process pool before queueing
+        total_queued += await queue_files_for_indexing(
+            media_messages,
+            channel_id=channel_id,
+            reply_func=message.reply_text
+        )
 
     await message.reply_text(f"✅ Queued {total_queued} files from channel {channel_id} for processing.")
 
 @bot.on_message(filters.command("delete") & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("delete")
 async def delete_file_handler(client, message: Message):
     """
     Handles the /delete command for the owner.
-    - /delete file <telegram_message_link> or <channel_id> <message_id>: deletes a file from the files array.
-    - /delete tmdb <tmdb_type> <tmdb_id> or <tmdb_link>: deletes the entire TMDB document.
+    - /delete file <telegram_message_link> or <channel_id> <message_id>: deletes a single file.
+    - /delete tmdb <tmdb_type> <tmdb_id> or <tmdb_link>: deletes the TMDB document and all its files.
     """
     args = message.command
     if len(args) < 2:
@@ -260,11 +320,7 @@ async def delete_file_handler(client, message: Message):
             return
 
         try:
-            result = await files_col.update_one(
-                {"files.channel_id": channel_id, "files.message_id": message_id},
-                {"$pull": {"files": {"channel_id": channel_id, "message_id": message_id}}}
-            )
-            if result.modified_count:
+            if await delete_indexed_file(channel_id, message_id):
                 await message.reply_text(f"✅ File ({channel_id}, {message_id}) deleted from database.")
             else:
                 await message.reply_text("❌ File not found in database.")
@@ -280,15 +336,14 @@ async def delete_file_handler(client, message: Message):
             except Exception:
                 await message.reply_text("Invalid TMDB link.")
                 return
-        elif len(args) == 4:
+        elif len(args) == 4 and args[3].isdigit():
             tmdb_type = args[2]
-            tmdb_id = args[3]
+            tmdb_id = int(args[3])
         else:
             await message.reply_text("Usage: /delete tmdb tmdb_type tmdb_id or /delete tmdb tmdb_link")
             return
         try:
-            result = await files_col.delete_one({"tmdb_type": tmdb_type, "tmdb_id": tmdb_id})
-            if result.deleted_count:
+            if await delete_tmdb_entry(tmdb_type, tmdb_id):
                 await message.reply_text(f"✅ TMDB document ({tmdb_type}, {tmdb_id}) deleted from database.")
             else:
                 await message.reply_text("❌ TMDB document not found in database.")
@@ -303,21 +358,21 @@ async def delete_file_handler(client, message: Message):
         )
 
 @bot.on_message(filters.command('restart') & filters.private & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("restart")
 async def restart(client, message):
     """
     Handles the /restart command for the owner.
-    - Deletes the log file, runs update.py, and restarts the bot.
+    - Runs update.py and restarts the bot.
+    - The log file is kept; rotation bounds its size.
     """
-    log_file = "bot_log.txt"
-    if os.path.exists(log_file):
-        try:
-            os.remove(log_file)
-        except Exception as e:
-            await safe_api_call(message.reply_text(f"Failed to delete log file: {e}"))
+    stop_logging()  # Flush queued log records before the process image is replaced
     os.system("python3 update.py")
     os.execl(sys.executable, sys.executable, "bot.py")
 
 @bot.on_message(filters.command("addchannel") & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("addchannel")
 async def add_channel_handler(client, message: Message):
     """
     Handles the /addchannel command for the owner.
@@ -339,6 +394,8 @@ async def add_channel_handler(client, message: Message):
         await message.reply_text(f"Error: {e}")
 
 @bot.on_message(filters.command("removechannel") & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("removechannel")
 async def remove_channel_handler(client, message: Message):
     """
     Handles the /removechannel command for the owner.
@@ -358,6 +415,8 @@ async def remove_channel_handler(client, message: Message):
         await message.reply_text(f"Error: {e}")
 
 @bot.on_message(filters.command("broadcast") & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("broadcast")
 async def broadcast_handler(client, message: Message):
     """
     Handles the /broadcast command for the owner.
@@ -386,41 +445,189 @@ async def broadcast_handler(client, message: Message):
     await message.reply_text(f"✅ Broadcast sent to {total} users. Failed: {failed}. Removed: {removed}")
 
 @bot.on_message(filters.command("log") & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("log")
 async def send_log_file(client, message: Message):
     """
     Handles the /log command for the owner.
-    - Sends the bot.log file to the owner.
+    - /log sends the most recent lines of the log.
+    - /log full sends the live and rotated logs as a .tar.gz archive.
     """
-    log_file = "bot_log.txt"
-    if not os.path.exists(log_file):
+    if not os.path.exists(LOG_FILE):
         await safe_api_call(message.reply_text("Log file not found."))
         return
     try:
-        await safe_api_call(client.send_document(message.chat.id, log_file, caption="Here is the log file."))
+        if len(message.command) > 1 and message.command[1] == "full":
+            document = await asyncio.to_thread(log_archive_document, LOG_FILE)
+            caption = "Here are the log files."
+        else:
+            document = await asyncio.to_thread(log_tail_document, LOG_FILE)
+            caption = f"Last {LOG_TAIL_LINES} log lines. Use /log full for the archive."
+        await safe_api_call(client.send_document(message.chat.id, document, caption=caption))
     except Exception as e:
         await safe_api_call(message.reply_text(f"Failed to send log file: {e}"))
 
 @bot.on_message(filters.command("stats") & filters.private & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("stats")
 async def stats_command(client, message: Message):
     """Show statistics (only for OWNER_ID)."""
     try:
         total_auth_users = await auth_users_col.count_documents({})
         total_users = await users_col.count_documents({})
-        total_files = await files_col.count_documents({})
+        total_titles = await files_col.count_documents({})
+        total_files = await tmdb_files_col.count_documents({})
+        lanes = await lane_depths()
+        queued_jobs = sum(lanes.values())
+        lane_summary = ", ".join(f"{lane} {count}" for lane, count in lanes.items() if count)
+        dead_letters = await dead_letters_col.count_documents({})
         stats = await db.command("dbstats")  # <-- await here
         db_storage = stats.get("storageSize", 0)
 
         await safe_api_call(
             message.reply_text(
             f"👤 Total auth users: <b>{total_auth_users}/{total_users}</b>\n"
+            f"🎬 Total titles: <b>{total_titles}</b>\n"
             f"📁 Total files: <b>{total_files}</b>\n"
+            f"🧵 Waiting updates: user <b>{user_pool.queue.qsize()}</b>, ingest <b>{ingest_pool.queue.qsize()}</b>, admin <b>{admin_pool.queue.qsize()}</b>\n"
+            f"⏳ Ingest queue: <b>{queued_jobs}</b>{f' ({lane_summary})' if lane_summary else ''}, dead letters: <b>{dead_letters}</b>\n"
             f"📊 Database storage used: <b>{db_storage / (1024 * 1024):.2f} MB</b>",
             )
         )
     except Exception as e:
         await message.reply_text(f"⚠️ An error occurred while fetching stats:\n<code>{e}</code>")
 
+@bot.on_message(filters.command("migrate") & filters.private & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("migrate")
+async def migrate_command(client, message: Message):
+    """
+    Handles the /migrate command for the owner.
+    - Moves files embedded in TMDB documents into the tmdb_files collection.
+    """
+    await safe_api_call(message.reply_text("Migrating embedded files..."))
+    try:
+        titles, files = await migrate_embedded_files()
+        await safe_api_call(message.reply_text(f"✅ Migrated {titles} titles, {files} files written."))
+    except Exception as e:
+        await safe_api_call(message.reply_text(f"⚠️ Migration failed:\n<code>{e}</code>"))
+
+@bot.on_message(filters.command("rebuildfacets") & filters.private & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("rebuildfacets")
+async def rebuild_facets_command(client, message: Message):
+    """
+    Handles the /rebuildfacets command for the owner.
+    - Recomputes genre, cast, director and language counts from all titles.
+    - Run it while ingest is idle: counts changed during the rebuild are overwritten.
+    """
+    await safe_api_call(message.reply_text("Rebuilding facets..."))
+    try:
+        summary = await rebuild_facets()
+        lines = "\n".join(f"{facet}: <b>{count}</b> values" for facet, count in summary.items())
+        await safe_api_call(message.reply_text(f"✅ Facets rebuilt.\n{lines}"))
+    except Exception as e:
+        await safe_api_call(message.reply_text(f"⚠️ Facet rebuild failed:\n<code>{e}</code>"))
+
+@bot.on_message(filters.command("reparse") & filters.private & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("reparse")
+async def reparse_command(client, message: Message):
+    """
+    Handles the /reparse command for the owner.
+    - Stores resolution, quality, codec, season and episode on files parsed by an older parser.
+    - Recomputes the filter arrays of their titles.
+    """
+    status = await safe_api_call(message.reply_text("Re-parsing file names..."))
+
+    async def progress(files_done):
+        await safe_api_call(status.edit_text(f"Re-parsing file names... <b>{files_done}</b> done"))
+
+    try:
+        files, titles = await backfill_release_fields(progress=progress)
+        await safe_api_call(message.reply_text(f"✅ Re-parsed {files} files, updated filters of {titles} titles."))
+    except Exception as e:
+        await safe_api_call(message.reply_text(f"⚠️ Re-parse failed:\n<code>{e}</code>"))
+
+@bot.on_message(filters.command("deadletters") & filters.private & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("deadletters")
+async def dead_letters_command(client, message: Message):
+    """
+    Handles the /deadletters command for the owner.
+    - Lists the most recent ingest jobs that failed for good.
+    """
+    try:
+        total = await dead_letters_col.count_documents({})
+        if not total:
+            await safe_api_call(message.reply_text("✅ No dead letters."))
+            return
+        letters = await list_dead_letters(limit=10)
+        lines = [
+            f"• <code>{letter['key']}</code> {letter['file_info'].get('file_name')}\n"
+            f"  {letter['attempts']} attempt(s): <i>{letter['error'][:200]}</i>"
+            for letter in letters
+        ]
+        await safe_api_call(message.reply_text(
+            f"☠️ <b>{total}</b> dead letter(s), latest {len(letters)}:\n\n" + "\n".join(lines) +
+            "\n\nReplay with /replay &lt;key&gt; ... or /replay all"
+        ))
+    except Exception as e:
+        await safe_api_call(message.reply_text(f"⚠️ Failed to list dead letters:\n<code>{e}</code>"))
+
+@bot.on_message(filters.command("replay") & filters.private & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("replay")
+async def replay_command(client, message: Message):
+    """
+    Handles the /replay command for the owner.
+    Usage: /replay all | /replay <key> [<key> ...]
+    - Moves dead letters back into the ingest queue.
+    """
+    if len(message.command) < 2:
+        await safe_api_call(message.reply_text("Usage: /replay all | /replay &lt;key&gt; [&lt;key&gt; ...]"))
+        return
+    keys = None if message.command[1].lower() == "all" else message.command[1:]
+    try:
+        replayed = await replay_dead_letters(keys)
+        await safe_api_call(message.reply_text(f"🔁 Re-queued <b>{replayed}</b> file(s)."))
+    except Exception as e:
+        await safe_api_call(message.reply_text(f"⚠️ Replay failed:\n<code>{e}</code>"))
+
+@bot.on_message(filters.command("refresh") & filters.private & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("refresh")
+async def refresh_command(client, message: Message):
+    """
+    Handles the /refresh command for the owner.
+    Usage: /refresh [pause | resume]
+    - Pauses or resumes the background TMDB refresher and shows its progress.
+    """
+    action = message.command[1].lower() if len(message.command) > 1 else "status"
+    if action == "pause":
+        tmdb_refresher.pause()
+    elif action == "resume":
+        tmdb_refresher.resume()
+    elif action != "status":
+        await safe_api_call(message.reply_text("Usage: /refresh [pause | resume]"))
+        return
+    try:
+        status = tmdb_refresher.status()
+        stale = await files_col.count_documents(
+            {"refreshed_at": {"$not": {"$gte": datetime.now(timezone.utc) - timedelta(days=tmdb_refresher.stale_days)}}}
+        )
+        await safe_api_call(message.reply_text(
+            f"🔄 TMDB refresher: <b>{'paused' if status['paused'] else 'running'}</b>\n"
+            f"Refreshed in the last hour: <b>{status['per_hour']}</b> (budget {status['budget_per_hour']}/h)\n"
+            f"Since start: {status['changed']} changed, {status['unchanged']} unchanged, {status['error']} failed\n"
+            f"Stale titles left: <b>{stale}</b>"
+        ))
+    except Exception as e:
+        await safe_api_call(message.reply_text(f"⚠️ Failed to read refresher status:\n<code>{e}</code>"))
+
 @bot.on_message(filters.private & filters.command("tmdb") & filters.user(OWNER_ID))
+@scheduled(admin_pool)
+@timed_handler("tmdb")
 async def tmdb_command(client, message):
     """
     Manually update a file's TMDB info in the database.
@@ -463,15 +670,23 @@ async def tmdb_command(client, message):
         await safe_api_call(message.reply_text(f"Failed to process file: {e}"))
         return
 
-    # Now update the file doc with TMDB info
+    # Queue it in the manual lane, which is served ahead of /index backfill
     try:
-        await upsert_file_with_tmdb_info(
-            file_info,
-            tmdb_type,
-            tmdb_id,
-            bot
+        tmdb = {"tmdb_type": tmdb_type, "tmdb_id": tmdb_id}
+        # Kept on the job, so a retry still refreshes the title the file is moved from
+        current = await tmdb_files_col.find_one(
+            {"channel_id": file_info["channel_id"], "message_id": file_info["message_id"]},
+            {"_id": 0, "tmdb_type": 1, "tmdb_id": 1}
+        )
+        if current and (current.get("tmdb_type"), current.get("tmdb_id")) != (tmdb_type, tmdb_id):
+            tmdb["moved_from"] = [current.get("tmdb_type"), current.get("tmdb_id")]
+        await enqueue_jobs(
+            [file_info],
+            notify=True,
+            lane=LANE_MANUAL,
+            tmdb=tmdb
         )
-        await safe_api_call(message.reply_text("✅ File updated with TMDB info."))
+        await safe_api_call(message.reply_text("✅ Queued: the file will be updated with this TMDB info shortly."))
     except Exception as e:
         await safe_api_call(message.reply_text(f"Failed to update TMDB info: {e}"))
 
@@ -480,31 +695,91 @@ async def tmdb_command(client, message):
 # Main Entrypoint
 # =========================
 
+async def prepare_database():
+    """Create indexes and seed facets off the startup path."""
+    try:
+        await ensure_indexes()
+        # First run after upgrading: materialize facets from the existing catalog
+        if not await facets_col.estimated_document_count():
+            await rebuild_facets()
+    except Exception as e:
+        logger.error(f"Failed to prepare database: {e}")
+
+async def background_startup():
+    """Work that can wait until the bot is already answering updates."""
+    await prepare_database()
+    bot.loop.create_task(tmdb_refresher.run())
+    if EXPORT_DIR:
+        from exporter import catalog_exporter
+        bot.loop.create_task(catalog_exporter.run())
+    await start_helpers(delivery_pool, build_helper_clients(DELIVERY_BOT_TOKENS, DELIVERY_SESSION_STRINGS))
+    # Refresh config.env for the next restart without blocking this one
+    await asyncio.to_thread(download_config)
+    # A standalone api_server.py warms its own (shared) cache
+    if WARMUP_CACHES and RUN_API_IN_BOT:
+        with profiler.phase("cache warm-up"):
+            from fast_api import warm_caches
+            await warm_caches()
+        logger.info(f"Cache warm-up done in {profiler.phases[-1][1]:.2f}s")
+
 async def main():
     """
-    Starts the bot and FastAPI server.
+    Starts the bot and, unless RUN_API_IN_BOT is off, the FastAPI server,
+    reporting how long each phase took.
     """
-    await bot.start()
-    bot.loop.create_task(start_fastapi())
+    profiler.mark("imports")
+    with profiler.phase("telegram login"):
+        await bot.start()
     bot.loop.create_task(file_queue_worker(bot))  # Start the queue worker
+    if RUN_API_IN_BOT:
+        with profiler.phase("api server"):
+            await start_fastapi()
+    elif BOT_METRICS_PORT:
+        await start_metrics_server()
+    bot.loop.create_task(background_startup())
 
     # Send startup message to log channel
     try:
-        await bot.send_message(LOG_CHANNEL_ID, "✅ Bot started and FastAPI server running.")
+        await bot.send_message(
+            LOG_CHANNEL_ID,
+            f"✅ Bot started{' and FastAPI server running' if RUN_API_IN_BOT else ''}.\n{profiler.report()}"
+        )
     except Exception as e:
-        print(f"Failed to send startup message to log channel: {e}")
+        logger.error(f"Failed to send startup message to log channel: {e}")
 
 async def start_fastapi():
     """
-    Starts the FastAPI server using Uvicorn.
+    Starts the FastAPI server using Uvicorn and returns once it is accepting connections.
+    Imported here so the bot does not pay for the API modules before it logs in.
     """
-    try:
-        config = uvicorn.Config(api, host="0.0.0.0", port=8000, loop="asyncio", log_level="warning", reload=True)
-        server = uvicorn.Server(config)
-        await server.serve()
-    except KeyboardInterrupt:
-        pass
-        logger.info("FastAPI server stopped.")
+    import uvicorn
+    from fast_api import api
+    config = uvicorn.Config(api, host=API_HOST, port=API_PORT, loop="asyncio", log_level="warning")
+    server = uvicorn.Server(config)
+    task = bot.loop.create_task(server.serve())
+    while not server.started and not task.done():
+        await asyncio.sleep(0.05)
+    return task
+
+async def start_metrics_server():
+    """
+    Serves /metrics on BOT_METRICS_PORT when the API runs elsewhere: the ingest,
+    queue, FloodWait, TMDB and handler metrics live only in this process.
+    """
+    import uvicorn
+    from fastapi import FastAPI, HTTPException, Request, Response
+    from metrics import metrics_authorized, render_metrics
+    app = FastAPI()
+
+    @app.get("/metrics")
+    async def metrics(request: Request):
+        if not metrics_authorized(request.headers.get("authorization"), METRICS_TOKEN):
+            raise HTTPException(status_code=401, detail="Metrics token required", headers={"WWW-Authenticate": "Bearer"})
+        body, content_type = render_metrics()
+        return Response(body, media_type=content_type)
+
+    server = uvicorn.Server(uvicorn.Config(app, host=API_HOST, port=BOT_METRICS_PORT, loop="asyncio", log_level="warning"))
+    return bot.loop.create_task(server.serve())
 
 if __name__ == "__main__":
     """
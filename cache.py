@@ -0,0 +1,235 @@
+import os
+import copy
+import json
+import math
+import time
+import random
+import asyncio
+import sqlite3
+from threading import Lock
+from typing import Any, Dict
+from datetime import datetime, timedelta, timezone
+from config import CACHE_BACKEND, CACHE_DB_PATH, logger
+from metrics import API_CACHE_REQUESTS
+
+# =========================
+# Constants & Globals
+# =========================
+
+CACHE_TTL_SECONDS = 300  # 5 minutes
+SQLITE_PURGE_EVERY = 500  # Sets between sweeps of expired rows
+SQLITE_BUSY_MS = 50       # Longest a get/set on the event loop waits for a lock; then a miss
+SQLITE_CLEAR_BUSY_MS = 5000  # Invalidation must not be lost, and runs in a thread
+XFETCH_BETA = 1.0         # >1 refreshes earlier, <1 later; see get_or_compute
+
+# Caches whose contents change when files are indexed or deleted
+CATALOG_CACHES = ("all_tmdb_files", "all_n_files", "tmdb_detail", "title_files", "facets")
+
+_caches = {}  # name -> cache, for invalidation by name
+_inflight = {}  # (cache name, key) -> Future of the one computation serving all waiters
+
+# =========================
+# In-Process Cache
+# =========================
+
+class ExpiringCache:
+    def __init__(self, ttl_seconds: int, name: str = "default"):
+        self.ttl = ttl_seconds
+        self.name = name
+        self._cache: Dict[str, Any] = {}
+        self._lock = Lock()
+
+    def get(self, key: str):
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, key: str):
+        """Return (value, expires_at timestamp, compute seconds), or None on a miss."""
+        with self._lock:
+            entry = self._cache.get(key)
+            if not entry:
+                API_CACHE_REQUESTS.labels(self.name, "miss").inc()
+                return None
+            value, expires_at, delta = entry
+            if datetime.now(timezone.utc) > expires_at:
+                del self._cache[key]
+                API_CACHE_REQUESTS.labels(self.name, "miss").inc()
+                return None
+            API_CACHE_REQUESTS.labels(self.name, "hit").inc()
+            # Return a deepcopy to avoid mutation issues
+            return copy.deepcopy(value), expires_at.timestamp(), delta
+
+    def set(self, key: str, value: Any, delta: float = 0.0):
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        # Store a deepcopy to avoid mutation issues
+        with self._lock:
+            self._cache[key] = (copy.deepcopy(value), expires_at, delta)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+# =========================
+# Shared SQLite Cache
+# =========================
+
+class SqliteCache:
+    """
+    Expiring JSON cache in a WAL-mode SQLite file, so every uvicorn worker (and
+    the bot, for invalidation) sees the same entries. Each cache is a namespace
+    in one shared table. Connections are opened per process, after fork.
+    """
+    _conn = None
+    _conn_pid = None
+    _conn_lock = Lock()
+    _sets = 0
+
+    def __init__(self, ttl_seconds: int, name: str = "default", path: str = CACHE_DB_PATH):
+        self.ttl = ttl_seconds
+        self.name = name
+        self.path = path
+
+    @staticmethod
+    def _open(path, busy_ms):
+        conn = sqlite3.connect(path, timeout=busy_ms / 1000, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, delta REAL NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        try:
+            # Cache files created before entries recorded their compute time
+            conn.execute("ALTER TABLE cache ADD COLUMN delta REAL NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass
+        return conn
+
+    @classmethod
+    def _connection(cls, path):
+        if cls._conn is None or cls._conn_pid != os.getpid():
+            cls._conn, cls._conn_pid = cls._open(path, SQLITE_BUSY_MS), os.getpid()
+        return cls._conn
+
+    def get(self, key: str):
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def get_entry(self, key: str):
+        """Return (value, expires_at timestamp, compute seconds), or None on a miss."""
+        try:
+            with self._conn_lock:
+                row = self._connection(self.path).execute(
+                    "SELECT value, expires_at, delta FROM cache WHERE namespace = ? AND key = ? AND expires_at > ?",
+                    (self.name, key, time.time())
+                ).fetchone()
+        except sqlite3.OperationalError as e:
+            # Locked for longer than SQLITE_BUSY_MS: compute the value instead of stalling the loop
+            logger.warning(f"Cache {self.name} read failed: {e}")
+            row = None
+        API_CACHE_REQUESTS.labels(self.name, "hit" if row else "miss").inc()
+        return (json.loads(row[0]), row[1], row[2]) if row else None
+
+    def set(self, key: str, value: Any, delta: float = 0.0):
+        payload = json.dumps(value, separators=(",", ":"))
+        try:
+            with self._conn_lock:
+                conn = self._connection(self.path)
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at, delta) VALUES (?, ?, ?, ?, ?)",
+                    (self.name, key, payload, time.time() + self.ttl, delta)
+                )
+                SqliteCache._sets += 1
+                if SqliteCache._sets % SQLITE_PURGE_EVERY == 0:
+                    conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Cache {self.name} write skipped: {e}")
+
+    def clear(self):
+        # Its own connection, so gets and sets on the event loop never queue behind
+        # the long busy wait on _conn_lock
+        conn = self._open(self.path, SQLITE_CLEAR_BUSY_MS)
+        try:
+            conn.execute("DELETE FROM cache WHERE namespace = ?", (self.name,))
+        finally:
+            conn.close()
+
+# =========================
+# Factory & Invalidation
+# =========================
+
+def make_cache(name: str, ttl_seconds: int = CACHE_TTL_SECONDS):
+    """Create (or return) the named cache on the configured backend."""
+    if name not in _caches:
+        if CACHE_BACKEND == "sqlite":
+            _caches[name] = SqliteCache(ttl_seconds, name)
+        else:
+            _caches[name] = ExpiringCache(ttl_seconds, name)
+    return _caches[name]
+
+def invalidate_caches(*names):
+    """
+    Clear the named caches. With the sqlite backend this reaches every process
+    sharing the file, so the bot can invalidate the API after ingesting.
+    """
+    for name in names:
+        make_cache(name).clear()
+
+# =========================
+# Coalesced Loading
+# =========================
+
+def should_refresh_early(expires_at: float, delta: float, beta: float = XFETCH_BETA) -> bool:
+    """
+    Probabilistic early expiration (XFetch): true with a probability that rises
+    as expiry nears, scaled by how long the value took to compute. Keys read
+    often are almost certainly refreshed before they expire; rare keys are not.
+    """
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+async def get_or_compute(cache, key: str, compute):
+    """
+    Return the cached value for `key`, or await `compute()` to build it.
+    Concurrent misses on the same key in this process share one computation.
+    A hit that XFetch picks for early refresh is still served at once while
+    the value is recomputed in the background.
+    """
+    entry = cache.get_entry(key)
+    if entry is not None:
+        value, expires_at, delta = entry
+        if should_refresh_early(expires_at, delta):
+            API_CACHE_REQUESTS.labels(cache.name, "early_refresh").inc()
+            _start_compute(cache, key, compute).add_done_callback(_log_refresh_failure)
+        return value
+    flight = _inflight.get((cache.name, key))
+    if flight is not None:
+        API_CACHE_REQUESTS.labels(cache.name, "coalesced").inc()
+    else:
+        flight = _start_compute(cache, key, compute)
+    # Shielded so a client disconnect does not cancel the query other waiters share
+    return await asyncio.shield(flight)
+
+def _start_compute(cache, key: str, compute):
+    flight_key = (cache.name, key)
+    if flight_key not in _inflight:
+        flight = _inflight[flight_key] = asyncio.ensure_future(_compute(cache, key, compute))
+        flight.add_done_callback(lambda f: _finish_compute(flight_key, f))
+    return _inflight[flight_key]
+
+def _finish_compute(flight_key, flight):
+    _inflight.pop(flight_key, None)
+    if not flight.cancelled():
+        flight.exception()  # Mark as retrieved; waiters (if any) re-raise it themselves
+
+def _log_refresh_failure(flight):
+    # Nobody awaits a background refresh; the stale entry stays until it expires
+    if not flight.cancelled() and flight.exception() is not None:
+        logger.warning(f"Early cache refresh failed: {flight.exception()!r}")
+
+async def _compute(cache, key: str, compute):
+    start = time.perf_counter()
+    value = await compute()
+    cache.set(key, value, delta=time.perf_counter() - start)
+    return value
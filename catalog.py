@@ -0,0 +1,353 @@
+import re
+import asyncio
+from collections import OrderedDict
+from config import logger
+from db import files_col
+from changes import ChangesExpired, head_seq, read_changes
+from release_parser import TITLE_FILTER_FIELDS
+
+try:
+    import numpy as np
+except ImportError:  # Optional: without it /api/all-tmdb-files always queries Mongo
+    np = None
+
+# =========================
+# Constants & Globals
+# =========================
+
+CATALOG_SYNC_SECONDS = 2     # Change feed poll interval
+INITIAL_CAPACITY = 1024      # Rows allocated up front; doubled when full
+MASK_CACHE_SIZE = 256        # Filter masks and filtered listings kept until the next catalog change
+TOKEN_WIDTH = 8              # Initial cast/director slots per title; widened on demand
+
+# Fields a list-view card shows (fast_api.LIST_FIELDS); kept per title alongside the columns
+CARD_FIELDS = ("tmdb_id", "tmdb_type", "title", "rating", "genre", "release_date", "poster_url")
+ENGINE_PROJECTION = {
+    "_id": 1, **{field: 1 for field in CARD_FIELDS}, "stars.name": 1, "directors.name": 1,
+    **{array: 1 for array in TITLE_FILTER_FIELDS.values()},
+}
+SORT_FIELDS = ("release_date", "rating", "_id")
+
+_DATE_PATTERN = re.compile(r"^(\d{4})(?:-(\d{2}))?(?:-(\d{2}))?")
+
+def date_key(value):
+    """
+    Sortable int for a release_date string, ordered like Mongo orders the raw
+    values: missing < "" < "2020" < "2020-05-01".
+    """
+    if value is None:
+        return -2
+    match = _DATE_PATTERN.match(value)
+    if not match:
+        return -1
+    year, month, day = match.groups()
+    return int(year) * 10000 + int(month or 0) * 100 + int(day or 0)
+
+def search_pattern(value):
+    """The regex build_query sends to Mongo for a search param, compiled for Python."""
+    return re.compile(".*".join(value.strip().split()), re.IGNORECASE)
+
+# =========================
+# Set-Valued Columns
+# =========================
+
+class _SetColumn:
+    """Per-title set of values, stored as ids into a vocabulary that only grows."""
+    def __init__(self):
+        self.ids = {}     # value -> id
+        self.values = []  # id -> value
+
+    def id_of(self, value, create=True):
+        token = self.ids.get(value)
+        if token is None and create:
+            token = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return token
+
+    def ids_matching(self, pattern):
+        """Ids of the values a regex search matches, like $regex over an array field."""
+        return [token for token, value in enumerate(self.values) if isinstance(value, str) and pattern.search(value)]
+
+class BitsetColumn(_SetColumn):
+    """For small vocabularies (genres, resolutions): one bit per value, packed into uint64 words."""
+    def __init__(self, capacity):
+        super().__init__()
+        self.bits = np.zeros((capacity, 1), dtype=np.uint64)
+
+    def grow(self, capacity):
+        bits = np.zeros((capacity, self.bits.shape[1]), dtype=np.uint64)
+        bits[:len(self.bits)] = self.bits
+        self.bits = bits
+
+    def set(self, row, values):
+        tokens = [self.id_of(value) for value in values]
+        words = max(tokens, default=0) // 64 + 1
+        if words > self.bits.shape[1]:
+            self.bits = np.hstack([self.bits, np.zeros((len(self.bits), words - self.bits.shape[1]), dtype=np.uint64)])
+        self.bits[row] = 0
+        for token in tokens:
+            self.bits[row, token // 64] |= np.uint64(1 << (token % 64))
+
+    def mask(self, tokens, n):
+        """Rows holding any of `tokens`."""
+        word_masks = np.zeros(self.bits.shape[1], dtype=np.uint64)
+        for token in tokens:
+            word_masks[token // 64] |= np.uint64(1 << (token % 64))
+        return (self.bits[:n] & word_masks).any(axis=1)
+
+class TokenColumn(_SetColumn):
+    """For large vocabularies (cast, directors): a fixed-width row of ids, padded with -1."""
+    def __init__(self, capacity, width=TOKEN_WIDTH):
+        super().__init__()
+        self.tokens = np.full((capacity, width), -1, dtype=np.int32)
+
+    def grow(self, capacity):
+        tokens = np.full((capacity, self.tokens.shape[1]), -1, dtype=np.int32)
+        tokens[:len(self.tokens)] = self.tokens
+        self.tokens = tokens
+
+    def set(self, row, values):
+        tokens = list(dict.fromkeys(self.id_of(value) for value in values))
+        if len(tokens) > self.tokens.shape[1]:
+            extra = max(len(tokens), self.tokens.shape[1] * 2) - self.tokens.shape[1]
+            self.tokens = np.hstack([self.tokens, np.full((len(self.tokens), extra), -1, dtype=np.int32)])
+        self.tokens[row] = -1
+        self.tokens[row, :len(tokens)] = tokens
+
+    def mask(self, tokens, n):
+        if not tokens:
+            return np.zeros(n, dtype=bool)
+        if len(tokens) == 1:
+            return (self.tokens[:n] == tokens[0]).any(axis=1)
+        return np.isin(self.tokens[:n], tokens).any(axis=1)
+
+# =========================
+# Catalog Engine
+# =========================
+
+class CatalogEngine:
+    """
+    The `files` titles held in NumPy columns, answering /api/all-tmdb-files
+    filters, sorts, pages and totals without Mongo. Deleted titles leave a
+    free row that the next insert reuses. Built from Mongo at startup and
+    kept current by following the change feed.
+    """
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.capacity = capacity
+        self.n = 0           # Rows in use, including freed ones
+        self.rows = {}       # (tmdb_type, tmdb_id) -> row
+        self.free = []
+        self.cards = []      # row -> card dict, None when freed
+        self.titles = []     # row -> title, for q
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.type_code = np.full(capacity, -1, dtype=np.int16)
+        self.types = {}      # tmdb_type -> code
+        self.rating = np.full(capacity, -np.inf)
+        self.release = np.full(capacity, -2, dtype=np.int32)
+        self.id_rank = np.zeros(capacity, dtype=np.int64)  # Insertion order, standing in for _id
+        self.next_rank = 0
+        self.bitsets = {"genre": BitsetColumn(capacity), **{a: BitsetColumn(capacity) for a in TITLE_FILTER_FIELDS.values()}}
+        self.token_columns = {"cast": TokenColumn(capacity), "director": TokenColumn(capacity)}
+        self._orders = {}             # (sort field, descending) -> rows in order
+        self._masks = OrderedDict()   # (filter, value) -> row mask, ("hits", filters, sort...) -> rows
+        self.since = None
+        self.ready = False
+
+    def _grow(self):
+        self.capacity *= 2
+        for name, fill in (("alive", False), ("type_code", -1), ("rating", -np.inf), ("release", -2), ("id_rank", 0)):
+            old = getattr(self, name)
+            new = np.full(self.capacity, fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+        for column in (*self.bitsets.values(), *self.token_columns.values()):
+            column.grow(self.capacity)
+
+    def _changed(self):
+        self._orders.clear()
+        self._masks.clear()
+
+    def upsert_title(self, doc):
+        key = (doc["tmdb_type"], doc["tmdb_id"])
+        row = self.rows.get(key)
+        if row is None:
+            if self.free:
+                row = self.free.pop()
+            else:
+                if self.n == self.capacity:
+                    self._grow()
+                row = self.n
+                self.n += 1
+                self.cards.append(None)
+                self.titles.append(None)
+            self.rows[key] = row
+            self.id_rank[row] = self.next_rank
+            self.next_rank += 1
+        self.cards[row] = {field: doc.get(field) for field in CARD_FIELDS}
+        self.titles[row] = doc.get("title") or ""
+        self.alive[row] = True
+        self.type_code[row] = self.types.setdefault(doc["tmdb_type"], len(self.types))
+        rating = doc.get("rating")
+        self.rating[row] = rating if isinstance(rating, (int, float)) else -np.inf
+        self.release[row] = date_key(doc.get("release_date"))
+        self.bitsets["genre"].set(row, [g for g in doc.get("genre") or [] if g])
+        for array in TITLE_FILTER_FIELDS.values():
+            self.bitsets[array].set(row, doc.get(array) or [])
+        self.token_columns["cast"].set(row, [s.get("name") for s in doc.get("stars") or [] if s.get("name")])
+        self.token_columns["director"].set(row, [d.get("name") for d in doc.get("directors") or [] if d.get("name")])
+        self._changed()
+
+    def delete_title(self, tmdb_type, tmdb_id):
+        row = self.rows.pop((tmdb_type, tmdb_id), None)
+        if row is None:
+            return
+        self.alive[row] = False
+        self.cards[row] = self.titles[row] = None
+        self.free.append(row)
+        self._changed()
+
+    @classmethod
+    def build(cls, docs):
+        """A new engine over title documents, ranked by _id as Mongo would sort them."""
+        engine = cls(max(INITIAL_CAPACITY, int(len(docs) * 1.25)))
+        for doc in sorted(docs, key=lambda doc: doc["_id"]):
+            engine.upsert_title(doc)
+        return engine
+
+    # --- Queries ---
+
+    def _mask(self, field, value):
+        """Rows matching one filter; cached until the catalog changes."""
+        cache_key = (field, value)
+        mask = self._masks.get(cache_key)
+        if mask is not None:
+            self._masks.move_to_end(cache_key)
+            return mask
+        n = self.n
+        if field == "q":
+            pattern = search_pattern(value)
+            mask = np.fromiter((bool(title) and pattern.search(title) is not None for title in self.titles), dtype=bool, count=n)
+        elif field in self.token_columns:
+            column = self.token_columns[field]
+            mask = column.mask(column.ids_matching(search_pattern(value)), n)
+        elif field == "genre":
+            column = self.bitsets["genre"]
+            mask = column.mask(column.ids_matching(search_pattern(value)), n)
+        elif field == "tmdb_type":
+            mask = self.type_code[:n] == self.types.get(value, -2)
+        elif field in self.bitsets:
+            token = self.bitsets[field].id_of(value, create=False)
+            mask = self.bitsets[field].mask([token], n) if token is not None else np.zeros(n, dtype=bool)
+        else:
+            raise ValueError(f"Unknown catalog filter: {field}")
+        return self._cache(cache_key, mask)
+
+    def _cache(self, cache_key, value):
+        self._masks[cache_key] = value
+        if len(self._masks) > MASK_CACHE_SIZE:
+            self._masks.popitem(last=False)
+        return value
+
+    def _order(self, sort_field, descending):
+        """Live rows in sort order, _id descending as tie-break; cached until the catalog changes."""
+        cache_key = (sort_field, descending)
+        order = self._orders.get(cache_key)
+        if order is None:
+            rows = np.flatnonzero(self.alive[:self.n])
+            rank = self.id_rank[rows]
+            if sort_field == "_id":
+                order = rows[np.argsort(-rank if descending else rank, kind="stable")]
+            else:
+                primary = self.rating[rows] if sort_field == "rating" else self.release[rows]
+                # lexsort sorts by the last key first
+                order = rows[np.lexsort((-rank, -primary if descending else primary))]
+            self._orders[cache_key] = order
+        return order
+
+    def query(self, filters, sort_field="release_date", descending=True, offset=0, limit=10):
+        """
+        One page of cards and the total match count. `filters` maps q, cast,
+        director, genre (regex search, as build_query), tmdb_type and the title
+        filter arrays (exact) to values; empty values are ignored.
+        """
+        sort_field = sort_field if sort_field in SORT_FIELDS else "release_date"
+        active = tuple(sorted((field, value) for field, value in filters.items() if value is not None and value != ""))
+        order = self._order(sort_field, descending)
+        if not active:
+            hits = order
+        else:
+            # Paging through one filtered listing reuses its matching rows
+            cache_key = ("hits", active, sort_field, descending)
+            hits = self._masks.get(cache_key)
+            if hits is None:
+                mask = self._mask(*active[0])
+                for field, value in active[1:]:
+                    mask = mask & self._mask(field, value)
+                hits = self._cache(cache_key, order[mask[order]])
+            else:
+                self._masks.move_to_end(cache_key)
+        return [self.cards[row] for row in hits[offset:offset + limit]], len(hits)
+
+    def __len__(self):
+        return len(self.rows)
+
+    # --- Sync ---
+
+    async def load(self):
+        """Build the columns from every title. The change feed position is taken first, so nothing is missed."""
+        since = await head_seq()
+        docs = await files_col.find({}, ENGINE_PROJECTION).to_list(length=None)
+        # Built in a thread so the API keeps answering (from Mongo) meanwhile
+        fresh = await asyncio.to_thread(CatalogEngine.build, docs)
+        self.__dict__.update(fresh.__dict__)
+        self.since, self.ready = since, True
+        logger.info(f"Catalog engine built: {len(self)} titles")
+
+    async def sync(self):
+        """Apply title changes logged since the last load or sync. Returns the number applied."""
+        applied = 0
+        while True:
+            changes, next_seq, has_more = await read_changes(self.since)
+            titles = [c for c in changes if c["kind"] == "title"]
+            upserts = [c for c in titles if c["op"] == "upsert"]
+            docs = {}
+            if upserts:
+                query = {"$or": [{"tmdb_type": c["tmdb_type"], "tmdb_id": c["tmdb_id"]} for c in upserts]}
+                async for doc in files_col.find(query, ENGINE_PROJECTION):
+                    docs[(doc["tmdb_type"], doc["tmdb_id"])] = doc
+            for change in titles:
+                doc = docs.get((change["tmdb_type"], change["tmdb_id"]))
+                if change["op"] == "upsert" and doc:
+                    self.upsert_title(doc)
+                else:
+                    self.delete_title(change["tmdb_type"], change["tmdb_id"])
+            applied += len(titles)
+            self.since = next_seq
+            if not has_more:
+                return applied
+
+    async def run(self, on_change=None):
+        """
+        Build once, then follow the change feed. `on_change()` is awaited after
+        changes are applied, so response caches filled from the old state can
+        be dropped. Runs as a background task of the API.
+        """
+        while True:
+            try:
+                if self.since is None:
+                    await self.load()
+                    applied = len(self)
+                else:
+                    applied = await self.sync()
+                if applied and on_change:
+                    await on_change()
+            except ChangesExpired:
+                # Keeps serving the old columns until the rebuild swaps in
+                logger.warning("Catalog engine fell behind the change log; rebuilding")
+                self.since = None
+                continue
+            except Exception as e:
+                logger.error(f"Catalog engine sync failed: {e}")
+            await asyncio.sleep(CATALOG_SYNC_SECONDS)
+
+catalog_engine = CatalogEngine() if np is not None else None
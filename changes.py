@@ -0,0 +1,158 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+from db import changes_col, counters_col
+from config import logger
+
+# =========================
+# Constants & Globals
+# =========================
+
+CHANGE_RETENTION_DAYS = 30      # Clients idle longer than this must resync from the full listing
+CHANGE_FLUSH_INTERVAL = 0.05    # Max seconds a change waits before it is written
+CHANGE_FLUSH_SIZE = 200         # Max changes written in one insert_many
+CHANGE_TRIM_EVERY = 500         # Flushes between trims of expired changes
+CHANGES_PAGE_SIZE = 500         # Default and max changes read per /api/changes call
+COUNTER_ID = "changes"
+
+class ChangesExpired(Exception):
+    """The resume token points before the oldest retained change."""
+
+# =========================
+# Change Events
+# =========================
+
+def title_change(op, tmdb_type, tmdb_id):
+    return {"kind": "title", "op": op, "tmdb_type": tmdb_type, "tmdb_id": tmdb_id}
+
+def file_change(op, channel_id, message_id, tmdb_type=None, tmdb_id=None):
+    return {
+        "kind": "file", "op": op, "channel_id": channel_id, "message_id": message_id,
+        "tmdb_type": tmdb_type, "tmdb_id": tmdb_id,
+    }
+
+def change_key(change):
+    if change["kind"] == "title":
+        return ("title", change["tmdb_type"], change["tmdb_id"])
+    return ("file", change["channel_id"], change["message_id"])
+
+# =========================
+# Writer
+# =========================
+
+class ChangeLog:
+    """
+    Append-only log of catalog changes, numbered by a counter document.
+    Changes recorded close together are written in one insert_many. Writes are
+    serialized by a lock, so within the (single) bot process a reader never sees
+    a change before all changes with a lower seq.
+    """
+    def __init__(self, max_items=CHANGE_FLUSH_SIZE, max_delay=CHANGE_FLUSH_INTERVAL):
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self._pending = []  # (changes, future)
+        self._count = 0
+        self._timer = None
+        self._lock = asyncio.Lock()
+        self._flushes = 0
+
+    async def record(self, changes):
+        """Queue changes and wait until they are durable."""
+        if not changes:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((changes, future))
+        self._count += len(changes)
+        if self._count >= self.max_items:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, lambda: asyncio.ensure_future(self.flush()))
+        await future
+
+    async def flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending, self._count = self._pending, [], 0
+        try:
+            async with self._lock:
+                docs = [dict(change) for changes, _ in batch for change in changes]
+                counter = await counters_col.find_one_and_update(
+                    {"_id": COUNTER_ID},
+                    {"$inc": {"seq": len(docs)}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                now = datetime.now(timezone.utc)
+                first = counter["seq"] - len(docs) + 1
+                for offset, doc in enumerate(docs):
+                    doc["seq"] = first + offset
+                    doc["at"] = now
+                await changes_col.insert_many(docs, ordered=True)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+        self._flushes += 1
+        if self._flushes % CHANGE_TRIM_EVERY == 0:
+            asyncio.ensure_future(trim_changes())
+
+change_log = ChangeLog()
+
+async def trim_changes(retention_days=CHANGE_RETENTION_DAYS):
+    """
+    Delete changes older than the retention window. The trimmed seq is stored
+    first, so a reader holding an older token gets ChangesExpired instead of
+    silently missing changes.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    try:
+        last = await changes_col.find_one({"at": {"$lt": cutoff}}, {"seq": 1}, sort=[("seq", -1)])
+        if not last:
+            return 0
+        await counters_col.update_one(
+            {"_id": COUNTER_ID},
+            {"$max": {"trimmed_through": last["seq"]}}
+        )
+        result = await changes_col.delete_many({"seq": {"$lte": last["seq"]}})
+    except Exception as e:
+        logger.error(f"Failed to trim change log: {e}")
+        return 0
+    logger.info(f"Trimmed {result.deleted_count} change(s) through seq {last['seq']}")
+    return result.deleted_count
+
+# =========================
+# Reader
+# =========================
+
+async def head_seq():
+    counter = await counters_col.find_one({"_id": COUNTER_ID})
+    return (counter or {}).get("seq", 0)
+
+async def read_changes(since, limit=CHANGES_PAGE_SIZE):
+    """
+    Changes after `since`, compacted to the latest change per title/file.
+    Returns (changes, next_seq, has_more). Raises ChangesExpired if changes
+    after `since` have already been trimmed.
+    """
+    counter = await counters_col.find_one({"_id": COUNTER_ID}) or {}
+    if since < counter.get("trimmed_through", 0):
+        raise ChangesExpired(since)
+    cursor = changes_col.find({"seq": {"$gt": since}}, {"_id": 0, "at": 0}).sort("seq", 1).limit(limit + 1)
+    docs = await cursor.to_list(length=limit + 1)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    latest = {}
+    for doc in docs:
+        key = change_key(doc)
+        latest.pop(key, None)  # Re-insert so the result stays in order of the last change
+        latest[key] = doc
+    next_seq = docs[-1]["seq"] if docs else max(since, 0)
+    return list(latest.values()), next_seq, has_more
@@ -4,41 +4,47 @@ import logging
 from dotenv import load_dotenv
 from os import environ
 from requests import get as rget
+from logs import setup_logging
 
-# Logger setup
-LOG_FILE = "bot_log.txt"
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding="utf-8"),
-        logging.StreamHandler()
-    ]
-)
+# Logger setup: queued, non-blocking, rotated by size and age
+# "{pid}" in LOG_FILE gives every process its own file, as processes must not rotate a shared one
+LOG_FILE = environ.get("LOG_FILE", "bot_log.txt").replace("{pid}", str(os.getpid()))
+setup_logging(LOG_FILE)
 logger = logging.getLogger("sharing_bot")
 
+CONFIG_FILE = 'config.env'
 CONFIG_FILE_URL = environ.get('CONFIG_FILE_URL')
-try:
-    if len(CONFIG_FILE_URL) == 0:
-        raise TypeError
+
+def download_config(timeout=10):
+    """
+    Download CONFIG_FILE_URL into config.env. Returns True on success.
+    Blocking; call it from a thread once the bot is running.
+    """
+    if not CONFIG_FILE_URL:
+        return False
     try:
-        res = rget(CONFIG_FILE_URL)
+        res = rget(CONFIG_FILE_URL, timeout=timeout)
         if res.status_code == 200:
-            with open('config.env', 'wb+') as f:
+            with open(CONFIG_FILE, 'wb+') as f:
                 f.write(res.content)
-        else:
-            logger.error(f"Failed to download config.env {res.status_code}")
+            return True
+        logger.error(f"Failed to download config.env {res.status_code}")
     except Exception as e:
         logger.info(f"CONFIG_FILE_URL: {e}")
-except:
-    pass
+    return False
+
+# Only the very first boot waits for the download; afterwards the cached
+# config.env is used and refreshed in the background for the next restart.
+if not os.path.exists(CONFIG_FILE):
+    download_config()
 
-load_dotenv('config.env', override=True)
+load_dotenv(CONFIG_FILE, override=True)
 
 #TELEGRAM API
 API_ID = int(os.getenv('API_ID'))
 API_HASH = os.getenv('API_HASH')
 BOT_TOKEN = os.getenv('BOT_TOKEN')
+BOT_ID = (BOT_TOKEN or '').split(':')[0]  # Keys this bot's stored file_ids
 OWNER_ID = int(os.getenv('OWNER_ID'))
 BOT_USERNAME = os.getenv('BOT_USERNAME')
 UPDATE_CHANNEL_ID = int(os.getenv('UPDATE_CHANNEL_ID'))
@@ -51,8 +57,60 @@ MY_DOMAIN = os.getenv('MY_DOMAIN')
 TOKEN_VALIDITY_SECONDS = 24 * 60 * 60  # 24 hours
 
 MONGO_URI = os.getenv("MONGO_URI")
+DB_NAME = os.getenv("DB_NAME", "bot4index")
 
 TMDB_API_KEY = os.getenv('TMDB_API_KEY')
+TMDB_API_URL = os.getenv('TMDB_API_URL', 'https://api.themoviedb.org/3')
+TMDB_RATE_LIMIT = float(os.getenv('TMDB_RATE_LIMIT', '40'))  # Requests per second across the whole bot
+
+# Warm the API caches in the background once the bot is serving
+WARMUP_CACHES = os.getenv('WARMUP_CACHES', 'true').lower() == 'true'
+
+#TMDB REFRESH
+# Background re-fetch of title metadata (ratings, cast, trailers), stalest first
+TMDB_REFRESH_ENABLED = os.getenv('TMDB_REFRESH_ENABLED', 'true').lower() == 'true'
+TMDB_REFRESH_DAYS = int(os.getenv('TMDB_REFRESH_DAYS', '7'))  # Titles refreshed more recently are skipped
+TMDB_REFRESH_REQUESTS_PER_HOUR = int(os.getenv('TMDB_REFRESH_REQUESTS_PER_HOUR', '2000'))  # TMDB request budget
+
+#FILE DELIVERY
+# Extra bots (comma-separated tokens) and user sessions that share /start file sends.
+# Each must be a member of the file channels; a user is only served by helpers they have started.
+DELIVERY_BOT_TOKENS = [t.strip() for t in os.getenv('DELIVERY_BOT_TOKENS', '').split(',') if t.strip()]
+DELIVERY_SESSION_STRINGS = [s.strip() for s in os.getenv('DELIVERY_SESSION_STRINGS', '').split(',') if s.strip()]
+DELIVERY_STRATEGY = os.getenv('DELIVERY_STRATEGY', 'least_loaded')  # or "hash"
+
+#HANDLER POOLS
+# Pyrogram workers only hand updates to the pools below, so a few are enough
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '16'))
+USER_HANDLER_CONCURRENCY = int(os.getenv('USER_HANDLER_CONCURRENCY', '64'))  # /start deliveries at once
+USER_HANDLER_QUEUE = int(os.getenv('USER_HANDLER_QUEUE', '512'))  # Waiting /start updates before replying "busy"
+INGEST_HANDLER_CONCURRENCY = int(os.getenv('INGEST_HANDLER_CONCURRENCY', '8'))  # Channel posts and owner uploads
+ADMIN_HANDLER_CONCURRENCY = int(os.getenv('ADMIN_HANDLER_CONCURRENCY', '8'))  # Owner commands
+
+#IMAGE PROXY
+IMAGE_UPSTREAM_URL = os.getenv('IMAGE_UPSTREAM_URL', 'https://image.tmdb.org/t/p')
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', 'image_cache')
+IMAGE_CACHE_MAX_MB = int(os.getenv('IMAGE_CACHE_MAX_MB', '512'))
+
+#API SERVER
+# Set RUN_API_IN_BOT=false when the API runs on its own via api_server.py
+RUN_API_IN_BOT = os.getenv('RUN_API_IN_BOT', 'true').lower() == 'true'
+API_HOST = os.getenv('API_HOST', '0.0.0.0')
+API_PORT = int(os.getenv('API_PORT', '8000'))
+API_WORKERS = int(os.getenv('API_WORKERS', '4'))
+# Bearer token /metrics requires (Prometheus: authorization.credentials); empty leaves it open,
+# so block /metrics at the reverse proxy instead
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# With RUN_API_IN_BOT=false the bot serves its own /metrics here (0 disables)
+BOT_METRICS_PORT = int(os.getenv('BOT_METRICS_PORT', '8001'))
+# "memory" keeps caches per process; "sqlite" shares them between API workers and the bot
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory' if RUN_API_IN_BOT else 'sqlite').lower()
+CACHE_DB_PATH = os.getenv('CACHE_DB_PATH', 'api_cache.sqlite3')
+# "numpy" answers /api/all-tmdb-files from in-memory columns (needs numpy); "mongo" queries every page
+CATALOG_ENGINE = os.getenv('CATALOG_ENGINE', 'mongo').lower()
+# Directory the bot keeps a static copy of the catalog in, for a CDN (empty disables)
+EXPORT_DIR = os.getenv('EXPORT_DIR', '')
+EXPORT_INTERVAL = int(os.getenv('EXPORT_INTERVAL', '60'))  # Seconds between incremental exports
 
 #SHORTERNER API
 URLSHORTX_API_TOKEN = os.getenv('URLSHORTX_API_TOKEN')
@@ -1,12 +1,73 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from config import MONGO_URI
+from config import MONGO_URI, DB_NAME
+
+NAME_CLAIM_SECONDS = 60 * 60  # Name claims outlive their job's retries; indexed names are then found in tmdb_files
+
+# =========================
+# Lazy Client
+# =========================
+
+class LazyProxy:
+    """
+    Stands in for a Motor object that is only created on first use, so
+    importing this module never builds the client.
+    """
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+
+    def resolve(self):
+        if self._target is None:
+            self._target = self._factory()
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __getitem__(self, key):
+        return self.resolve()[key]
+
+def _collection(name):
+    return LazyProxy(lambda: db[name])
 
 # MongoDB setup with Motor (async)
-mongo = AsyncIOMotorClient(MONGO_URI)
-db = mongo["bot4index"]
-files_col = db["files"]
-n_files_col = db["n_files"]
-tokens_col = db["tokens"]
-auth_users_col = db["auth_users"]
-allowed_channels_col = db["allowed_channels"]
-users_col = db["users"]
+mongo = LazyProxy(lambda: AsyncIOMotorClient(MONGO_URI))
+db = LazyProxy(lambda: mongo[DB_NAME])
+files_col = _collection("files")            # One document per TMDB title
+tmdb_files_col = _collection("tmdb_files")  # One document per Telegram file, linked by (tmdb_type, tmdb_id)
+n_files_col = _collection("n_files")
+facets_col = _collection("facets")          # Materialized title counts per genre/cast/director/language value
+ingest_jobs_col = _collection("ingest_jobs")    # Durable ingest queue, see jobs.py
+dead_letters_col = _collection("dead_letters")  # Ingest jobs that failed for good
+ingest_names_col = _collection("ingest_names")  # File names claimed by in-flight ingest jobs, see jobs.py
+changes_col = _collection("changes")            # Catalog change log behind /api/changes, see changes.py
+counters_col = _collection("counters")          # Sequence counters, e.g. the change log seq
+tokens_col = _collection("tokens")
+auth_users_col = _collection("auth_users")
+allowed_channels_col = _collection("allowed_channels")
+users_col = _collection("users")
+
+async def ensure_indexes():
+    """Create the indexes the ingest and API paths rely on."""
+    await files_col.create_index([("tmdb_id", 1), ("tmdb_type", 1)], unique=True)
+    await files_col.create_index("refreshed_at")
+    await tmdb_files_col.create_index([("channel_id", 1), ("message_id", 1)], unique=True)
+    await tmdb_files_col.create_index([("tmdb_type", 1), ("tmdb_id", 1), ("date", -1)])
+    await tmdb_files_col.create_index("file_name")
+    await tmdb_files_col.create_index([("tmdb_type", 1), ("tmdb_id", 1), ("season", 1), ("episode", 1)])
+    await tmdb_files_col.create_index("resolution")
+    await tmdb_files_col.create_index("parsed.v")
+    # Title filter arrays (see release_parser.TITLE_FILTER_FIELDS), newest first as the grid sorts by default
+    for field in ("resolutions", "qualities", "codecs", "seasons"):
+        await files_col.create_index([(field, 1), ("release_date", -1)])
+    await tmdb_files_col.create_index("link_key", sparse=True)
+    await facets_col.create_index([("facet", 1), ("value", 1)], unique=True)
+    await facets_col.create_index([("facet", 1), ("count", -1)])
+    await ingest_jobs_col.create_index("key", unique=True)
+    await ingest_jobs_col.create_index("visible_at")
+    await ingest_jobs_col.create_index([("lane", 1), ("visible_at", 1)])
+    await dead_letters_col.create_index("key", unique=True)
+    await ingest_names_col.create_index("claimed_at", expireAfterSeconds=NAME_CLAIM_SECONDS)
+    await dead_letters_col.create_index([("failed_at", -1)])
+    await changes_col.create_index("seq", unique=True)
+    await changes_col.create_index("at")
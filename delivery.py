@@ -0,0 +1,242 @@
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from pyrogram import Client, enums
+from pyrogram.errors import (
+    FloodWait, PeerIdInvalid, UserIsBlocked, ChatWriteForbidden,
+    ChannelPrivate, ChannelInvalid, ChatAdminRequired,
+    FileIdInvalid, FileReferenceExpired, FileReferenceInvalid, MediaEmpty
+)
+from config import API_ID, API_HASH, logger
+from metrics import DELIVERY_SENDS, DELIVERY_FLOODWAIT_SECONDS, DELIVERY_IN_FLIGHT, DELIVERY_FILE_IDS
+
+# =========================
+# Constants & Globals
+# =========================
+
+DELIVERY_STRATEGIES = ("least_loaded", "hash")
+MAX_DELIVERY_WAIT = 60       # Longest we wait for a client to come out of FloodWait
+UNREACHABLE_CACHE_SIZE = 100_000  # (client, chat) pairs remembered as unusable
+
+# A helper can only send to users who have started it, and only copy from
+# channels it is a member of. These errors mean "try another client".
+# PeerIdInvalid can mean either side and is sorted out in _invalid_peer.
+USER_UNREACHABLE_ERRORS = (UserIsBlocked, ChatWriteForbidden)
+SOURCE_UNREACHABLE_ERRORS = (ChannelPrivate, ChannelInvalid, ChatAdminRequired)
+# A stored file_id no longer works for this client; copy from the channel instead
+STALE_FILE_ID_ERRORS = (FileIdInvalid, FileReferenceExpired, FileReferenceInvalid, MediaEmpty, ValueError)
+
+MEDIA_TYPES = ("document", "video", "audio", "photo")
+
+def message_media(message):
+    """The document, video, audio or photo of a message, or None."""
+    for media_type in MEDIA_TYPES:
+        media = getattr(message, media_type, None)
+        if media:
+            return media
+    return None
+
+# =========================
+# Delivery Pool
+# =========================
+
+class PooledClient:
+    """
+    One client in the pool with its load and FloodWait state. file_key is the
+    client's Telegram user id; file_ids are only valid for the client that got them.
+    """
+    def __init__(self, name, client, file_key=None):
+        self.name = name
+        self.client = client
+        self.file_key = file_key or name
+        self.in_flight = 0
+        self.sent = 0
+        self.flood_until = 0.0
+        self.resolved_sources = set()  # Channels this client is known to resolve
+
+    def available(self, now):
+        return now >= self.flood_until
+
+class DeliveryPool:
+    """
+    Spreads copy_message across several Pyrogram clients (the main bot plus
+    helper bots or user sessions). Each send tries the clients in strategy
+    order and fails over on FloodWait or when a client cannot reach the chat.
+    - least_loaded: fewest sends in flight, then fewest sends overall
+    - hash: rendezvous hash of the key (the user id), so a user keeps the same client
+    """
+    def __init__(self, strategy="least_loaded", max_wait=MAX_DELIVERY_WAIT):
+        if strategy not in DELIVERY_STRATEGIES:
+            raise ValueError(f"strategy must be one of {', '.join(DELIVERY_STRATEGIES)}")
+        self.strategy = strategy
+        self.max_wait = max_wait
+        self.clients = []
+        self._unreachable = OrderedDict()
+
+    def add(self, name, client, file_key=None):
+        self.clients.append(PooledClient(name, client, file_key))
+
+    def __len__(self):
+        return len(self.clients)
+
+    def _ordered(self, key):
+        if self.strategy == "hash" and key is not None:
+            def weight(pc):
+                return hashlib.blake2b(f"{pc.name}:{key}".encode(), digest_size=8).digest()
+            return sorted(self.clients, key=weight, reverse=True)
+        return sorted(self.clients, key=lambda pc: (pc.in_flight, pc.sent))
+
+    def _is_unreachable(self, pc, chat_id, from_chat_id):
+        return (pc.name, chat_id) in self._unreachable or (pc.name, from_chat_id) in self._unreachable
+
+    def _mark_unreachable(self, pc, peer):
+        self._unreachable[(pc.name, peer)] = True
+        self._unreachable.move_to_end((pc.name, peer))
+        if len(self._unreachable) > UNREACHABLE_CACHE_SIZE:
+            self._unreachable.popitem(last=False)
+
+    async def _invalid_peer(self, pc, chat_id, from_chat_id):
+        """
+        The peer to blame for a PeerIdInvalid, or None to just fail over. A
+        helper that has not met the source channel yet raises it too, so the
+        user is only blamed once the source resolves on this client.
+        """
+        if from_chat_id is None or from_chat_id in pc.resolved_sources:
+            return chat_id
+        try:
+            await pc.client.resolve_peer(from_chat_id)
+        except Exception:
+            return from_chat_id
+        pc.resolved_sources.add(from_chat_id)
+        return None  # Resolved only now; the next send tells which peer it was
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, key=None, **kwargs):
+        """
+        Copy a message with the first usable client. Returns (message, client) so
+        follow-up calls such as the auto-delete go through the client that sent it.
+        """
+        sent, pc = await self._dispatch(chat_id, from_chat_id, key, lambda pc: pc.client.copy_message(
+            chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id, **kwargs
+        ))
+        return sent, pc.client
+
+    async def send_file(self, chat_id, from_chat_id, message_id, file_ids=None, caption=None, key=None):
+        """
+        Send an indexed file by its stored file_id (send_cached_media), falling back
+        to copy_message when the client has none or it went stale.
+        Returns (message, client, file_key, new_file_id); new_file_id is set when the
+        copy produced a file_id worth storing for this client.
+        """
+        file_ids = file_ids or {}
+
+        async def send(pc):
+            file_id = file_ids.get(pc.file_key)
+            if file_id:
+                try:
+                    sent = await pc.client.send_cached_media(
+                        chat_id, file_id, caption=caption or "", parse_mode=enums.ParseMode.HTML
+                    )
+                    DELIVERY_FILE_IDS.labels("hit").inc()
+                    return sent, None
+                except STALE_FILE_ID_ERRORS as e:
+                    DELIVERY_FILE_IDS.labels("stale").inc()
+                    logger.warning(f"Stale file_id for {pc.name}, copying instead: {e}", extra={"message_id": message_id})
+            else:
+                DELIVERY_FILE_IDS.labels("miss").inc()
+            sent = await pc.client.copy_message(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id)
+            media = message_media(sent)
+            return sent, media.file_id if media else None
+
+        (sent, new_file_id), pc = await self._dispatch(chat_id, from_chat_id, key, send)
+        return sent, pc.client, pc.file_key, new_file_id
+
+    async def _dispatch(self, chat_id, from_chat_id, key, send):
+        """Run send(pooled_client) on the first usable client, failing over as needed."""
+        deadline = time.monotonic() + self.max_wait
+        last_error = None
+        while True:
+            now = time.monotonic()
+            candidates = [pc for pc in self._ordered(key) if not self._is_unreachable(pc, chat_id, from_chat_id)]
+            if not candidates:
+                raise last_error or RuntimeError("No delivery client can reach this chat")
+            ready = [pc for pc in candidates if pc.available(now)]
+            if not ready:
+                wake_at = min(pc.flood_until for pc in candidates)
+                if wake_at > deadline:
+                    raise last_error or RuntimeError("All delivery clients are in FloodWait")
+                await asyncio.sleep(wake_at - now)
+                continue
+
+            for pc in ready:
+                pc.in_flight += 1
+                DELIVERY_IN_FLIGHT.labels(pc.name).inc()
+                try:
+                    result = await send(pc)
+                    pc.sent += 1
+                    DELIVERY_SENDS.labels(pc.name, "sent").inc()
+                    return result, pc
+                except FloodWait as e:
+                    pc.flood_until = time.monotonic() + e.value
+                    DELIVERY_SENDS.labels(pc.name, "floodwait").inc()
+                    DELIVERY_FLOODWAIT_SECONDS.labels(pc.name).inc(e.value)
+                    logger.warning(f"Delivery client {pc.name} in FloodWait for {e.value}s", extra={"latency": float(e.value)})
+                    last_error = e
+                except PeerIdInvalid as e:
+                    peer = await self._invalid_peer(pc, chat_id, from_chat_id)
+                    if peer is not None:
+                        self._mark_unreachable(pc, peer)
+                    DELIVERY_SENDS.labels(pc.name, "unreachable").inc()
+                    last_error = e
+                except USER_UNREACHABLE_ERRORS as e:
+                    self._mark_unreachable(pc, chat_id)
+                    DELIVERY_SENDS.labels(pc.name, "unreachable").inc()
+                    last_error = e
+                except SOURCE_UNREACHABLE_ERRORS as e:
+                    self._mark_unreachable(pc, from_chat_id)
+                    DELIVERY_SENDS.labels(pc.name, "unreachable").inc()
+                    last_error = e
+                finally:
+                    pc.in_flight -= 1
+                    DELIVERY_IN_FLIGHT.labels(pc.name).dec()
+
+    def status(self):
+        now = time.monotonic()
+        return [
+            {
+                "name": pc.name,
+                "in_flight": pc.in_flight,
+                "sent": pc.sent,
+                "flood_wait": max(0.0, pc.flood_until - now),
+            }
+            for pc in self.clients
+        ]
+
+# =========================
+# Helper Clients
+# =========================
+
+def build_helper_clients(bot_tokens, session_strings):
+    """Pyrogram clients for the configured helper bots and sessions; they never receive updates."""
+    clients = []
+    for i, token in enumerate(bot_tokens, start=1):
+        clients.append((f"helper_bot_{i}", Client(
+            f"delivery_bot_{i}", api_id=API_ID, api_hash=API_HASH,
+            bot_token=token, no_updates=True
+        )))
+    for i, session in enumerate(session_strings, start=1):
+        clients.append((f"helper_session_{i}", Client(
+            f"delivery_session_{i}", api_id=API_ID, api_hash=API_HASH,
+            session_string=session, in_memory=True, no_updates=True
+        )))
+    return clients
+
+async def start_helpers(pool, helpers):
+    """Start helper clients and add each to the pool once it is logged in."""
+    for name, client in helpers:
+        try:
+            await client.start()
+            pool.add(name, client, file_key=str(client.me.id))
+            logger.info(f"Delivery client {name} ready")
+        except Exception as e:
+            logger.error(f"Failed to start delivery client {name}: {e}")
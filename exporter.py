@@ -0,0 +1,332 @@
+"""
+Static export of the catalog for a CDN or static file server.
+
+Writes, under EXPORT_DIR:
+    catalog.json                 manifest: total, and per sort the ordered shards with their counts
+    {sort}/{digest}.json         ~EXPORT_SHARD_SIZE list-view cards, named by content (cache forever)
+    tmdb/{type}/{id}.json        what /api/tmdb/{type}/{id} returns
+each with .gz and (if brotli is installed) .br variants next to it.
+
+Usage:
+    python exporter.py
+"""
+import os
+import gzip
+import json
+import bisect
+import asyncio
+import hashlib
+import itertools
+from datetime import datetime, timezone
+from config import EXPORT_DIR, EXPORT_INTERVAL, logger
+from db import files_col
+from changes import ChangesExpired, head_seq, read_changes
+from catalog import date_key
+from static import GZIP_LEVEL, brotli
+from metrics import CATALOG_EXPORT_WRITES
+from fast_api import LIST_FIELDS, get_title_files, serialize_tmdb_entry, serialize_tmdb_list_entry
+
+# =========================
+# Constants & Globals
+# =========================
+
+EXPORT_SHARD_SIZE = 100      # Target cards per shard; shards split at twice this
+EXPORT_BROTLI_QUALITY = 9    # Lower than for pages: thousands of files are compressed per run
+EXPORT_CONCURRENCY = 16      # Detail files rendered at once
+MANIFEST_NAME = "catalog.json"
+CARD_PROJECTION = {"_id": 1, **{field: 1 for field in LIST_FIELDS}}
+
+# Exported listings (all newest/best first), with the key that orders them like the API
+# does: the sort field, then _id descending
+EXPORT_SORTS = {
+    "release_date": lambda doc: (date_key(doc.get("release_date")), str(doc["_id"])),
+    "rating": lambda doc: (doc["rating"] if isinstance(doc.get("rating"), (int, float)) else -1, str(doc["_id"])),
+    "_id": lambda doc: (str(doc["_id"]),),
+}
+
+# =========================
+# Files
+# =========================
+
+def encode(payload):
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+
+def _replace(path, body):
+    # Written aside and renamed, so a static server never serves a partial file
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(body)
+    os.replace(tmp, path)
+
+def write_file(path, body, skip_unchanged=True):
+    """Write a JSON body and its precompressed variants. Returns False if it was already there."""
+    if skip_unchanged and os.path.exists(path):
+        with open(path, "rb") as f:
+            if f.read() == body:
+                return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _replace(f"{path}.gz", gzip.compress(body, GZIP_LEVEL, mtime=0))
+    if brotli is not None:
+        _replace(f"{path}.br", brotli.compress(body, quality=EXPORT_BROTLI_QUALITY))
+    _replace(path, body)  # Last, so the variants are in place when it appears
+    return True
+
+def remove_file(path):
+    for variant in (path, f"{path}.gz", f"{path}.br"):
+        try:
+            os.remove(variant)
+        except FileNotFoundError:
+            pass
+
+# =========================
+# Shard Layout
+# =========================
+
+def layout_shards(keys, starts, size=EXPORT_SHARD_SIZE):
+    """
+    Cut sort keys, in descending order, into shards returned as (lo, hi)
+    index ranges. Keys stay in the shard of the previous layout whose range
+    holds them (`starts` are the previous shards' first keys), so a new or
+    changed title only rewrites its own shard; shards over 2*size are split
+    and tiny ones merged into the one before.
+    """
+    ascending = keys[::-1]
+    bounds = [0, *(len(keys) - bisect.bisect_right(ascending, start) for start in starts[1:]), len(keys)]
+    shards = []
+    for lo, hi in zip(bounds, bounds[1:]):
+        count = hi - lo
+        if not count:
+            continue
+        if count > 2 * size:
+            step = -(-count // -(-count // size))  # Even parts of at most `size`
+            shards.extend((i, min(i + step, hi)) for i in range(lo, hi, step))
+        elif shards and count < size // 4 and hi - shards[-1][0] <= 2 * size:
+            shards[-1] = (shards[-1][0], hi)
+        else:
+            shards.append((lo, hi))
+    return shards
+
+# =========================
+# Exporter
+# =========================
+
+class CatalogExporter:
+    """
+    Keeps the exported files in step with the catalog. Listing shards are
+    re-laid from the in-memory cards on every run and only new content is
+    written; detail files are rewritten for titles the change feed touched.
+    """
+    def __init__(self, directory=EXPORT_DIR):
+        self.directory = directory
+        self.docs = {}            # (tmdb_type, tmdb_id) -> card projection incl. _id
+        self.versions = {}        # (tmdb_type, tmdb_id) -> bumped whenever the card is reloaded
+        self.sort_keys = {sort: {} for sort in EXPORT_SORTS}  # sort -> (tmdb_type, tmdb_id) -> key
+        self.shard_names = {}     # Card versions of a shard -> its file, so unchanged shards are not re-encoded
+        self._version = itertools.count()
+        self.manifest = None      # Last manifest written (or found on disk)
+        self.since = None
+        self.loaded = False
+        self.full_details = False
+        self.cards_changed = False
+
+    def path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def detail_path(self, tmdb_type, tmdb_id):
+        return self.path("tmdb", str(tmdb_type), f"{tmdb_id}.json")
+
+    async def load(self):
+        """Read the last manifest, then every card. Without a usable manifest all details are rewritten."""
+        try:
+            with open(self.path(MANIFEST_NAME), "rb") as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = None
+        self.since = self.manifest.get("seq") if self.manifest else None
+        self.full_details = self.full_details or self.since is None
+        if self.full_details:
+            self.since = await head_seq()
+        docs = await files_col.find({}, CARD_PROJECTION).to_list(length=None)
+        self.docs, self.versions = {}, {}
+        self.sort_keys = {sort: {} for sort in EXPORT_SORTS}
+        for doc in docs:
+            self.set_doc(doc)
+        self.loaded = True
+
+    def set_doc(self, doc):
+        key = (doc["tmdb_type"], doc["tmdb_id"])
+        self.docs[key] = doc
+        self.versions[key] = next(self._version)
+        for sort, sort_key in EXPORT_SORTS.items():
+            self.sort_keys[sort][key] = sort_key(doc)
+
+    async def pull_changes(self):
+        """Apply logged title changes to the cards. Returns (titles to re-render, titles deleted)."""
+        dirty, deleted = set(), set()
+        self.cards_changed = False
+        while True:
+            changes, next_seq, has_more = await read_changes(self.since)
+            refresh = set()
+            for change in changes:
+                key = (change.get("tmdb_type"), change.get("tmdb_id"))
+                if not key[0] or key[1] is None:
+                    continue
+                if change["kind"] == "title" and change["op"] == "delete":
+                    deleted.add(key)
+                    dirty.discard(key)
+                    self.cards_changed |= self.docs.pop(key, None) is not None
+                    self.versions.pop(key, None)
+                    for keys in self.sort_keys.values():
+                        keys.pop(key, None)
+                    continue
+                # Title upserts and any file change alter the detail file; only the former the card
+                dirty.add(key)
+                deleted.discard(key)
+                if change["kind"] == "title" or key not in self.docs:
+                    refresh.add(key)
+            if refresh:
+                self.cards_changed = True
+                query = {"$or": [{"tmdb_type": t, "tmdb_id": i} for t, i in refresh]}
+                async for doc in files_col.find(query, CARD_PROJECTION):
+                    self.set_doc(doc)
+            self.since = next_seq
+            if not has_more:
+                return dirty, deleted
+
+    async def write_details(self, keys):
+        semaphore = asyncio.Semaphore(EXPORT_CONCURRENCY)
+        written = 0
+
+        async def one(tmdb_type, tmdb_id):
+            nonlocal written
+            async with semaphore:
+                entry = await files_col.find_one({"tmdb_type": tmdb_type, "tmdb_id": tmdb_id}, {"_id": 0})
+                if not entry:
+                    await asyncio.to_thread(remove_file, self.detail_path(tmdb_type, tmdb_id))
+                    return
+                files, files_total = await get_title_files(tmdb_type, tmdb_id)
+                body = encode(serialize_tmdb_entry(entry, files, files_total))
+                if await asyncio.to_thread(write_file, self.detail_path(tmdb_type, tmdb_id), body):
+                    written += 1
+
+        await asyncio.gather(*(one(tmdb_type, tmdb_id) for tmdb_type, tmdb_id in keys))
+        CATALOG_EXPORT_WRITES.labels("detail").inc(written)
+        return written
+
+    def write_listings(self, relayout=True):
+        """
+        Lay out and write every sort's shards, then the manifest. Without
+        `relayout` (only files changed) the manifest is rewritten with the same
+        shards. Returns the shards written.
+        """
+        previous = (self.manifest or {}).get("sorts", {})
+        sorts, written, names = {}, 0, {}
+        for sort, keys in self.sort_keys.items():
+            if not relayout and sort in previous:
+                sorts[sort] = previous[sort]
+                continue
+            order = sorted(keys, key=keys.__getitem__, reverse=True)
+            sorted_keys = [keys[key] for key in order]
+            starts = [tuple(shard["start"]) for shard in previous.get(sort, [])]
+            entries = []
+            for lo, hi in layout_shards(sorted_keys, starts):
+                shard = order[lo:hi]
+                signature = (sort, *(self.versions[key] for key in shard))
+                name = self.shard_names.get(signature)
+                if name is None or not os.path.exists(self.path(name)):
+                    body = encode({"results": [serialize_tmdb_list_entry(self.docs[key]) for key in shard]})
+                    name = f"{sort}/{hashlib.sha256(body).hexdigest()[:16]}.json"
+                    if not os.path.exists(self.path(name)):
+                        write_file(self.path(name), body, skip_unchanged=False)
+                        written += 1
+                names[signature] = name
+                entries.append({"file": name, "count": hi - lo, "start": sorted_keys[lo]})
+            sorts[sort] = entries
+        manifest = {
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "seq": self.since,
+            "total": len(self.docs),
+            "shard_size": EXPORT_SHARD_SIZE,
+            "sorts": sorts,
+        }
+        write_file(self.path(MANIFEST_NAME), encode(manifest), skip_unchanged=False)
+        CATALOG_EXPORT_WRITES.labels("shard").inc(written)
+        self.collect_garbage(previous, sorts)
+        self.manifest = manifest
+        if relayout:
+            self.shard_names = names
+        return written
+
+    def collect_garbage(self, previous, current):
+        """
+        Delete shards no longer listed. Those of the previous manifest are kept
+        one more run, for clients still paging through it.
+        """
+        keep = {shard["file"] for shards in (*previous.values(), *current.values()) for shard in shards}
+        for sort in EXPORT_SORTS:
+            directory = self.path(sort)
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                if name.endswith(".json") and f"{sort}/{name}" not in keep:
+                    remove_file(os.path.join(directory, name))
+
+    def prune_details(self):
+        """Delete detail files of titles no longer in the catalog. Returns how many."""
+        removed = 0
+        for tmdb_type in os.listdir(self.path("tmdb")) if os.path.isdir(self.path("tmdb")) else []:
+            for name in os.listdir(self.path("tmdb", tmdb_type)):
+                tmdb_id = name.removesuffix(".json")
+                if name.endswith(".json") and tmdb_id.isdigit() and (tmdb_type, int(tmdb_id)) not in self.docs:
+                    remove_file(self.path("tmdb", tmdb_type, name))
+                    removed += 1
+        return removed
+
+    async def export(self):
+        """One incremental export. Returns (shards written, details written, details removed)."""
+        if not self.loaded:
+            await self.load()
+        dirty, deleted = await self.pull_changes()
+        if self.full_details:
+            dirty = set(self.docs)
+        if not dirty and not deleted and self.manifest is not None:
+            return 0, 0, 0
+        details = await self.write_details(dirty)
+        for tmdb_type, tmdb_id in deleted:
+            await asyncio.to_thread(remove_file, self.detail_path(tmdb_type, tmdb_id))
+        removed = len(deleted)
+        if self.full_details:
+            # Titles deleted while no export was following the change log
+            removed = await asyncio.to_thread(self.prune_details)
+        # Written after the details, so the manifest's seq never runs ahead of them
+        relayout = self.cards_changed or self.full_details or self.manifest is None
+        shards = await asyncio.to_thread(self.write_listings, relayout)
+        self.full_details = False
+        logger.info(f"Catalog export: {shards} shards, {details} details written, {removed} removed")
+        return shards, details, removed
+
+    async def run(self):
+        """Export every EXPORT_INTERVAL seconds when the catalog changed. Runs as a background task of the bot."""
+        while True:
+            try:
+                await self.export()
+            except ChangesExpired:
+                logger.warning("Catalog export fell behind the change log; re-exporting everything")
+                self.loaded = False
+                self.full_details = True  # The manifest's seq is too old to catch up from
+                continue
+            except Exception as e:
+                logger.error(f"Catalog export failed: {e}")
+            await asyncio.sleep(EXPORT_INTERVAL)
+
+catalog_exporter = CatalogExporter()
+
+async def main():
+    if not EXPORT_DIR:
+        print("Set EXPORT_DIR to export the catalog.")
+        return
+    shards, details, removed = await catalog_exporter.export()
+    print(f"Exported to {EXPORT_DIR}: {shards} shards, {details} details written, {removed} removed.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
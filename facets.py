@@ -0,0 +1,131 @@
+import re
+import asyncio
+import weakref
+from pymongo import UpdateOne
+from config import logger
+from db import db, files_col, facets_col
+
+# =========================
+# Facet Definitions
+# =========================
+
+FACETS = ("genre", "cast", "director", "language")
+FACET_REBUILD_COLLECTION = "facets_rebuild"
+FACET_PROJECTION = {"_id": 0, "genre": 1, "stars.name": 1, "directors.name": 1, "language": 1}
+
+_title_locks = weakref.WeakValueDictionary()  # (tmdb_type, tmdb_id) -> asyncio.Lock, while in use
+
+def facet_values(entry):
+    """Return {facet: set(values)} for a TMDB title document (or None)."""
+    if not entry:
+        return {facet: set() for facet in FACETS}
+    language = entry.get("language") or ""
+    return {
+        "genre": {g for g in entry.get("genre") or [] if g},
+        "cast": {s.get("name") for s in entry.get("stars") or [] if s.get("name")},
+        "director": {d.get("name") for d in entry.get("directors") or [] if d.get("name")},
+        "language": {l.strip() for l in language.split(",") if l.strip() and l.strip() != "Unknown"},
+    }
+
+# =========================
+# Incremental Maintenance
+# =========================
+
+def title_lock(tmdb_type, tmdb_id):
+    """
+    Lock held while a title's facet fields are read, rewritten and the delta
+    applied, so two writers in this process never count the same change twice.
+    """
+    key = (tmdb_type, tmdb_id)
+    lock = _title_locks.get(key)
+    if lock is None:
+        lock = _title_locks[key] = asyncio.Lock()
+    return lock
+
+async def apply_facet_delta(old_entry, new_entry):
+    """
+    Adjust facet counts for one title changing from old_entry to new_entry.
+    Pass old_entry=None for an insert and new_entry=None for a delete.
+    """
+    old_values, new_values = facet_values(old_entry), facet_values(new_entry)
+    requests = []
+    for facet in FACETS:
+        for value in new_values[facet] - old_values[facet]:
+            requests.append(UpdateOne({"facet": facet, "value": value}, {"$inc": {"count": 1}}, upsert=True))
+        for value in old_values[facet] - new_values[facet]:
+            requests.append(UpdateOne({"facet": facet, "value": value}, {"$inc": {"count": -1}}))
+    if not requests:
+        return
+    try:
+        await facets_col.bulk_write(requests, ordered=False)
+        if old_entry:
+            await facets_col.delete_many({"count": {"$lte": 0}})
+    except Exception as e:
+        # Counts drift until the next /rebuildfacets; never fail the ingest for it
+        logger.error(f"Failed to update facets: {e}", extra={"tmdb_id": (new_entry or old_entry).get("tmdb_id")})
+
+# =========================
+# Full Rebuild
+# =========================
+
+def _facet_pipeline(facet):
+    if facet == "language":
+        unwind = [
+            # Split and trimmed like facet_values, so a rebuild yields the same values as ingest
+            {"$project": {"value": {"$map": {
+                "input": {"$split": [{"$ifNull": ["$language", ""]}, ","]},
+                "in": {"$trim": {"input": "$$this"}},
+            }}}},
+            {"$unwind": "$value"},
+            {"$match": {"value": {"$nin": ["", "Unknown"]}}},
+        ]
+    else:
+        field = {"genre": "$genre", "cast": "$stars.name", "director": "$directors.name"}[facet]
+        unwind = [
+            {"$project": {"value": field}},
+            {"$unwind": "$value"},
+            {"$match": {"value": {"$nin": [None, ""]}}},
+        ]
+    return unwind + [
+        # One count per title even if a name repeats within it
+        {"$group": {"_id": {"title": "$_id", "value": "$value"}}},
+        {"$group": {"_id": "$_id.value", "count": {"$sum": 1}}},
+        {"$project": {"_id": 0, "facet": facet, "value": "$_id", "count": 1}},
+    ]
+
+async def rebuild_facets():
+    """
+    Recompute every facet count from the titles collection and atomically swap
+    the result in. Returns {facet: distinct values}.
+    Deltas applied by ingest or the refresher between the aggregation and the
+    swap are lost with the old collection; run it while ingest is idle, or run
+    it again if titles changed meanwhile.
+    """
+    staging = db[FACET_REBUILD_COLLECTION]
+    await staging.drop()
+    summary = {}
+    for facet in FACETS:
+        docs = await files_col.aggregate(_facet_pipeline(facet), allowDiskUse=True).to_list(length=None)
+        if docs:
+            await staging.insert_many(docs, ordered=False)
+        summary[facet] = len(docs)
+    await staging.create_index([("facet", 1), ("value", 1)], unique=True)
+    await staging.create_index([("facet", 1), ("count", -1)])
+    if sum(summary.values()):
+        await staging.rename(facets_col.name, dropTarget=True)
+    else:
+        await facets_col.delete_many({})
+        await staging.drop()
+    return summary
+
+# =========================
+# Queries
+# =========================
+
+async def get_facet(facet, limit=50, prefix=""):
+    """Top values of a facet by title count; optional case-insensitive prefix filter."""
+    query = {"facet": facet}
+    if prefix:
+        query["value"] = {"$regex": f"^{re.escape(prefix)}", "$options": "i"}
+    cursor = facets_col.find(query, {"_id": 0, "value": 1, "count": 1}).sort("count", -1).limit(limit)
+    return await cursor.to_list(length=limit)
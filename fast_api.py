@@ -1,52 +1,69 @@
-import copy
-from fastapi import FastAPI
+import re
+import time
+import hashlib
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from db import files_col, n_files_col
-from config import BOT_USERNAME, MY_DOMAIN
-from datetime import datetime, timedelta, timezone
+from fastapi.responses import JSONResponse, Response, FileResponse
+import asyncio
+from db import files_col, tmdb_files_col, n_files_col
+from config import BOT_USERNAME, MY_DOMAIN, CATALOG_ENGINE, METRICS_TOKEN
+from config import logger
+from datetime import datetime
 from utility import generate_telegram_link
-from typing import Any, Dict
-from threading import Lock
+from facets import FACETS, get_facet
+from release_parser import RELEASE_FIELDS, TITLE_FILTER_FIELDS
+from catalog import CARD_FIELDS, catalog_engine
+from metrics import API_REQUEST_SECONDS, metrics_authorized, render_metrics
+from cache import make_cache, get_or_compute
+from changes import CHANGES_PAGE_SIZE, ChangesExpired, head_seq, read_changes
+from suggest import TOP_K as SUGGEST_LIMIT, suggest_index
+from static import REVALIDATE, IMMUTABLE, load_pages, pages
+from images import (
+    IMAGE_WIDTHS, IMAGE_MEDIA_TYPES, IMAGE_PATH_PATTERN, ImageNotFound, UpstreamError,
+    cache_key as image_cache_key, get_variant
+)
 
 # =========================
 # Cache System
 # =========================
-CACHE_TTL_SECONDS = 300  # 5 minutes
-
-class ExpiringCache:
-    def __init__(self, ttl_seconds: int):
-        self.ttl = ttl_seconds
-        self._cache: Dict[str, Any] = {}
-        self._lock = Lock()
-
-    def get(self, key: str):
-        with self._lock:
-            entry = self._cache.get(key)
-            if not entry:
-                return None
-            value, expires_at = entry
-            if datetime.now(timezone.utc) > expires_at:
-                del self._cache[key]
-                return None
-            # Return a deepcopy to avoid mutation issues
-            return copy.deepcopy(value)
-
-    def set(self, key: str, value: Any):
-        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
-        # Store a deepcopy to avoid mutation issues
-        with self._lock:
-            self._cache[key] = (copy.deepcopy(value), expires_at)
-
-    def clear(self):
-        with self._lock:
-            self._cache.clear()
-
-all_tmdb_files_cache = ExpiringCache(CACHE_TTL_SECONDS)
-all_n_files_cache = ExpiringCache(CACHE_TTL_SECONDS)  
-
-
-api = FastAPI()
+# Backend chosen by CACHE_BACKEND (see cache.py); "sqlite" shares entries across API workers
+all_tmdb_files_cache = make_cache("all_tmdb_files")
+all_n_files_cache = make_cache("all_n_files")
+tmdb_detail_cache = make_cache("tmdb_detail")
+title_files_cache = make_cache("title_files")
+facets_cache = make_cache("facets")
+
+FILES_PAGE_SIZE = 20   # Files embedded with an entry; the rest via /api/tmdb/{type}/{id}/files
+MAX_FILES_PAGE_SIZE = 100
+MAX_TITLES_PAGE_SIZE = 500  # Titles per /api/all-tmdb-files page; mirrors page through with this
+
+# Fields the catalog grid needs to render a card; everything else comes from the detail endpoint
+LIST_FIELDS = CARD_FIELDS
+LIST_PROJECTION = {"_id": 0, **{field: 1 for field in LIST_FIELDS}}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Frontend pages are read and compressed once, not per request
+    await asyncio.to_thread(load_pages)
+    # Typeahead tries are built in the background and then follow the change feed
+    suggest_task = asyncio.create_task(suggest_index.run())
+    tasks = [suggest_task]
+    if CATALOG_ENGINE == "numpy":
+        if catalog_engine is None:
+            logger.warning("CATALOG_ENGINE=numpy but NumPy is not installed; listings are served from Mongo")
+        else:
+            # Pages cached while the engine lagged behind a change are dropped once it catches up,
+            # in a thread: with the sqlite backend the clear may wait on another process's lock
+            async def drop_cached_pages():
+                await asyncio.to_thread(all_tmdb_files_cache.clear)
+            tasks.append(asyncio.create_task(catalog_engine.run(on_change=drop_cached_pages)))
+    yield
+    for task in tasks:
+        task.cancel()
+
+api = FastAPI(lifespan=lifespan)
 api.add_middleware(
     CORSMiddleware,
     allow_origins=[f"{MY_DOMAIN}"],
@@ -55,6 +72,42 @@ api.add_middleware(
     allow_headers=["*"],
 )
 
+@api.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    # Label by route template so path parameters don't explode cardinality
+    route = request.scope.get("route")
+    endpoint = route.path if route else "unmatched"
+    API_REQUEST_SECONDS.labels(endpoint, str(response.status_code)).observe(time.perf_counter() - start)
+    return response
+
+@api.middleware("http")
+async def json_etag(request: Request, call_next):
+    """
+    Give successful JSON GET responses a strong ETag and answer a matching
+    If-None-Match with 304, so reloads and repeated scroll pages skip the body.
+    """
+    response = await call_next(request)
+    if (request.method != "GET" or response.status_code != 200
+            or response.headers.get("content-type") != "application/json"):
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    headers["ETag"] = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers["Cache-Control"] = "no-cache"  # Always revalidate; the 304 makes that cheap
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        headers.pop("content-type")
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, status_code=200, headers=headers)
+
+def etag_matches(if_none_match, etag) -> bool:
+    """True if an If-None-Match header lists `etag` (weak comparison) or is "*"."""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
 def build_query(params: dict, search_fields: dict) -> dict:
     """
     Build a MongoDB query dict from params and search_fields mapping.
@@ -71,6 +124,19 @@ def build_query(params: dict, search_fields: dict) -> dict:
                 query[db_field] = value
     return query
 
+def release_query(params: dict, db_fields: dict) -> dict:
+    """
+    Exact-match filters on parsed release fields, served by their indexes.
+    db_fields: {param_name: db_field}; labels are stored lower-cased.
+    """
+    query = {}
+    for param, db_field in db_fields.items():
+        value = params.get(param)
+        if value is None or value == "":
+            continue
+        query[db_field] = value.strip().lower() if isinstance(value, str) else value
+    return query
+
 # --- Serialization Helpers ---
 
 def serialize_file(file: dict) -> dict:
@@ -80,18 +146,19 @@ def serialize_file(file: dict) -> dict:
         "file_size": file.get("file_size"),
         "file_format": file.get("file_format"),
         "date": date_val.strftime('%Y-%m-%d %H:%M:%S') if isinstance(date_val, datetime) else date_val or "",
-        "telegram_link": file.get("telegram_link"),
+        # Precomputed at ingest; only records from before that change need a rebuild
+        "telegram_link": file.get("telegram_link") or generate_telegram_link(
+            BOT_USERNAME, file.get("channel_id"), file.get("message_id")
+        ),
         "channel_id": file.get("channel_id"),
         "message_id": file.get("message_id"),
+        **{field: file.get(field) for field in RELEASE_FIELDS},
     }
 
-def serialize_tmdb_entry(entry: dict) -> dict:
-    files = entry.get("files", [])
-    for file in files:
-        if not file.get("telegram_link"):
-            file["telegram_link"] = generate_telegram_link(
-                BOT_USERNAME, file.get("channel_id"), file.get("message_id")
-            )
+def serialize_tmdb_list_entry(entry: dict) -> dict:
+    return {field: entry.get(field) for field in LIST_FIELDS}
+
+def serialize_tmdb_entry(entry: dict, files: list, files_total: int) -> dict:
     return {
         "tmdb_id": entry.get("tmdb_id"),
         "tmdb_type": entry.get("tmdb_type"),
@@ -105,7 +172,10 @@ def serialize_tmdb_entry(entry: dict) -> dict:
         "stars": entry.get("stars"),
         "trailer_url": entry.get("trailer_url"),
         "poster_url": entry.get("poster_url"),
-        "files": [serialize_file(f) for f in files]
+        **{array: entry.get(array) or [] for array in TITLE_FILTER_FIELDS.values()},
+        "files": [serialize_file(f) for f in files],
+        "files_total": files_total,
+        "files_has_more": len(files) < files_total
     }
 
 def serialize_n_file(file: dict) -> dict:
@@ -115,7 +185,7 @@ def serialize_n_file(file: dict) -> dict:
         "file_size": file.get("file_size"),
         "file_format": file.get("file_format"),
         "date": date_val.strftime('%Y-%m-%d %H:%M:%S') if isinstance(date_val, datetime) else date_val or "",
-        "telegram_link": generate_telegram_link(
+        "telegram_link": file.get("telegram_link") or generate_telegram_link(
             BOT_USERNAME, file.get("channel_id"), file.get("message_id")
         ),
         "channel_id": file.get("channel_id"),
@@ -124,6 +194,51 @@ def serialize_n_file(file: dict) -> dict:
         "thumb_url": file.get("thumb_url", "")
     }
 
+async def get_title_files(tmdb_type: str, tmdb_id: int, offset: int = 0, limit: int = FILES_PAGE_SIZE, filters: dict = None):
+    """One page of a title's files, newest first, plus the title's total (matching) file count."""
+    query = {"tmdb_type": tmdb_type, "tmdb_id": tmdb_id, **(filters or {})}
+    cursor = tmdb_files_col.find(query, {"_id": 0}).sort("date", -1).skip(offset).limit(limit)
+    files, total = await asyncio.gather(
+        cursor.to_list(length=limit),
+        tmdb_files_col.count_documents(query)
+    )
+    return files, total
+
+async def get_full_entries(cards: list) -> list:
+    """Full title documents for catalog engine cards, in the cards' order."""
+    if not cards:
+        return []
+    query = {"$or": [{"tmdb_type": c["tmdb_type"], "tmdb_id": c["tmdb_id"]} for c in cards]}
+    docs = {(d["tmdb_type"], d["tmdb_id"]): d async for d in files_col.find(query, {"_id": 0})}
+    return [docs[key] for key in ((c["tmdb_type"], c["tmdb_id"]) for c in cards) if key in docs]
+
+async def serialize_tmdb_entries_with_files(entries: list) -> list:
+    """Full serialization for a page of entries, each with its first page of files."""
+    pages = await asyncio.gather(*(
+        get_title_files(e.get("tmdb_type"), e.get("tmdb_id")) for e in entries
+    ))
+    return [serialize_tmdb_entry(e, files, total) for e, (files, total) in zip(entries, pages)]
+
+WARMUP_PAGES = 5  # Pages per default sort warmed at startup
+
+async def warm_caches():
+    """
+    Fill the caches with what the frontend asks for first: the opening pages of
+    the default sorts and the facet lists. Runs in the background after startup.
+    """
+    try:
+        for sort in ("release_date", "rating"):
+            for page in range(WARMUP_PAGES):
+                await api_all_tmdb_files(
+                    q="", cast="", director="", genre="", tmdb_type="",
+                    offset=page * 10, limit=10, sort=sort, order="desc", view="list"
+                )
+        for facet in FACETS:
+            await api_facets(facet=facet, prefix="", limit=50)
+        await api_all_n_files(q="", offset=0, limit=10)
+    except Exception as e:
+        logger.error(f"Cache warm-up failed: {e}")
+
 def make_cache_key(*args, **kwargs) -> str:
     """Create a cache key from args and kwargs."""
     key = ":".join(map(str, args))
@@ -134,8 +249,46 @@ def make_cache_key(*args, **kwargs) -> str:
 # --- API Endpoints ---
 
 @api.get("/")
-async def root():
-    return JSONResponse({"message": "👋 Hello! Welcome to the Sharing Bot"})
+async def root(request: Request):
+    # Browsers get the frontend; health checks and scripts keep the JSON greeting
+    if "text/html" in request.headers.get("accept", ""):
+        response = page_response(request, "index.html")
+        response.headers["Vary"] = "Accept, Accept-Encoding"
+        return response
+    return JSONResponse({"message": "👋 Hello! Welcome to the Sharing Bot"}, headers={"Vary": "Accept"})
+
+@api.get("/{page_name}.html")
+async def frontend_page(page_name: str, request: Request):
+    """
+    Serve index.html / nfiles.html, or their content-hashed names
+    (e.g. index.3f2a9c0d1e4b5a6f.html), which are cacheable forever.
+    """
+    return page_response(request, f"{page_name}.html")
+
+def page_response(request: Request, name: str) -> Response:
+    """Precompressed page in the best encoding the client accepts, or 304 if unchanged."""
+    page = pages.get(name)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Page not found")
+    encoding, body = page.negotiate(request.headers.get("accept-encoding", ""))
+    headers = {
+        "ETag": f'"{page.digest}-{encoding}"',
+        "Cache-Control": IMMUTABLE if name == page.versioned_name else REVALIDATE,
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=page.media_type, headers=headers)
+
+@api.get("/metrics")
+async def metrics(request: Request):
+    """Prometheus metrics; with METRICS_TOKEN set, only for `Authorization: Bearer <token>`."""
+    if not metrics_authorized(request.headers.get("authorization"), METRICS_TOKEN):
+        raise HTTPException(status_code=401, detail="Metrics token required", headers={"WWW-Authenticate": "Bearer"})
+    body, content_type = render_metrics()
+    return Response(body, media_type=content_type)
 
 @api.get("/api/all-tmdb-files")
 async def api_all_tmdb_files(
@@ -147,16 +300,36 @@ async def api_all_tmdb_files(
     offset: int = 0,
     limit: int = 10,
     sort: str = "date",
-    order: str = "desc"
+    order: str = "desc",
+    view: str = "full",
+    resolution: str = "",
+    quality: str = "",
+    codec: str = "",
+    season: int = None
 ):
     """
     Return TMDB entries with their files, sorted and filtered.
+    view=list returns only the card fields (LIST_FIELDS); use /api/tmdb/{type}/{id} for the rest.
+    limit is capped at MAX_TITLES_PAGE_SIZE and a negative offset counts as 0.
+    resolution, quality, codec and season keep titles with at least one such file.
     """
-    cache_key = make_cache_key(q, cast, director, genre, tmdb_type, offset, limit, sort, order)
-    cached = all_tmdb_files_cache.get(cache_key)
-    if cached:
-        return JSONResponse(cached)
+    list_view = view == "list"
+    release = dict(resolution=resolution, quality=quality, codec=codec, season=season)
+    cache_key = make_cache_key(
+        q, cast, director, genre, tmdb_type, offset, limit, sort, order, "list" if list_view else "full", **release
+    )
+
+    async def load():
+        return await query_tmdb_files(q, cast, director, genre, tmdb_type, offset, limit, sort, order, list_view, release)
 
+    # Concurrent misses on a popular page share one Mongo query
+    return JSONResponse(await get_or_compute(all_tmdb_files_cache, cache_key, load))
+
+async def query_tmdb_files(q, cast, director, genre, tmdb_type, offset, limit, sort, order, list_view, release=None) -> dict:
+    """One uncached /api/all-tmdb-files page: the find plus the total count."""
+    # Bounded here so the engine (a NumPy slice) and Mongo see the same page
+    offset = max(offset, 0)
+    limit = min(max(limit, 1), MAX_TITLES_PAGE_SIZE)
     search_fields = {
         "q": ("title", True),
         "cast": ("stars.name", True),
@@ -166,29 +339,195 @@ async def api_all_tmdb_files(
     }
     params = dict(q=q, cast=cast, director=director, genre=genre, tmdb_type=tmdb_type)
     query = build_query(params, search_fields)
+    release_filters = release_query(release or {}, TITLE_FILTER_FIELDS)
+    query.update(release_filters)
 
     sort_field = sort if sort in ["rating", "_id", "release_date"] else "release_date"
     sort_order = -1 if order == "desc" else 1
 
+    if catalog_engine is not None and catalog_engine.ready:
+        try:
+            cards, total = catalog_engine.query({**params, **release_filters}, sort_field, sort_order == -1, offset, limit)
+        except re.error:
+            pass  # Not a valid Python regex; let Mongo answer (or reject) it as before
+        else:
+            if list_view:
+                results = [serialize_tmdb_list_entry(c) for c in cards]
+            else:
+                results = await serialize_tmdb_entries_with_files(await get_full_entries(cards))
+            return {"results": results, "has_more": offset + limit < total, "total": total}
+
     # Compound sort: always add _id as secondary
     sort_list = [(sort_field, sort_order)]
     if sort_field != "_id":
         sort_list.append(("_id", -1))  # Always descending for _id for stability
 
-    cursor = files_col.find(query, {"_id": 0}).sort(sort_list).skip(offset).limit(limit)
+    projection = LIST_PROJECTION if list_view else {"_id": 0}
+    cursor = files_col.find(query, projection).sort(sort_list).skip(offset).limit(limit)
     tmdb_entries = await cursor.to_list(length=limit)
 
     total = await files_col.count_documents(query)
     has_more = offset + limit < total
 
-    response_data = {
-        "results": [serialize_tmdb_entry(e) for e in tmdb_entries],
+    if list_view:
+        results = [serialize_tmdb_list_entry(e) for e in tmdb_entries]
+    else:
+        results = await serialize_tmdb_entries_with_files(tmdb_entries)
+
+    return {
+        "results": results,
         "has_more": has_more,
         "total": total
     }
-    all_tmdb_files_cache.set(cache_key, response_data)
+
+@api.get("/api/tmdb/{tmdb_type}/{tmdb_id}")
+async def api_tmdb_detail(tmdb_type: str, tmdb_id: int):
+    """
+    Return one TMDB entry with all its fields and its first page of files, for when a card is opened.
+    """
+    async def load():
+        entry = await files_col.find_one({"tmdb_type": tmdb_type, "tmdb_id": tmdb_id}, {"_id": 0})
+        if not entry:
+            raise HTTPException(status_code=404, detail="TMDB entry not found")
+        files, files_total = await get_title_files(tmdb_type, tmdb_id)
+        return serialize_tmdb_entry(entry, files, files_total)
+
+    cache_key = make_cache_key("detail", tmdb_type, tmdb_id)
+    return JSONResponse(await get_or_compute(tmdb_detail_cache, cache_key, load))
+
+@api.get("/api/tmdb/{tmdb_type}/{tmdb_id}/files")
+async def api_tmdb_files(
+    tmdb_type: str,
+    tmdb_id: int,
+    offset: int = 0,
+    limit: int = FILES_PAGE_SIZE,
+    resolution: str = "",
+    quality: str = "",
+    codec: str = "",
+    season: int = None,
+    episode: int = None
+):
+    """
+    Return a page of one title's files, newest first, optionally only those
+    with the given resolution, quality, codec, season and episode.
+    """
+    offset = max(offset, 0)
+    limit = min(max(limit, 1), MAX_FILES_PAGE_SIZE)
+    release = dict(resolution=resolution, quality=quality, codec=codec, season=season, episode=episode)
+    filters = release_query(release, {field: field for field in RELEASE_FIELDS})
+
+    async def load():
+        files, total = await get_title_files(tmdb_type, tmdb_id, offset, limit, filters)
+        return {
+            "results": [serialize_file(f) for f in files],
+            "has_more": offset + limit < total,
+            "total": total
+        }
+
+    cache_key = make_cache_key("files", tmdb_type, tmdb_id, offset, limit, **release)
+    return JSONResponse(await get_or_compute(title_files_cache, cache_key, load))
+
+@api.get("/api/facets")
+async def api_facets(facet: str = "genre", prefix: str = "", limit: int = 50):
+    """
+    Return the values of a facet (genre, cast, director, language) with their
+    title counts, most common first. Served from the materialized facets collection.
+    """
+    if facet not in FACETS:
+        raise HTTPException(status_code=400, detail=f"facet must be one of {', '.join(FACETS)}")
+    limit = min(max(limit, 1), 500)
+
+    async def load():
+        values = await get_facet(facet, limit=limit, prefix=prefix.strip())
+        return {"facet": facet, "results": values}
+
+    cache_key = make_cache_key("facets", facet, prefix, limit)
+    return JSONResponse(await get_or_compute(facets_cache, cache_key, load))
+
+@api.get("/api/suggest")
+async def api_suggest(prefix: str = "", limit: int = 8):
+    """
+    Typeahead: titles (by rating), cast and directors (by title count) with a
+    word starting with `prefix`. Answered from in-memory tries, never Mongo.
+    """
+    if not suggest_index.ready:
+        raise HTTPException(status_code=503, detail="Suggestions are still loading")
+    limit = min(max(limit, 1), SUGGEST_LIMIT)
+    return JSONResponse({"prefix": prefix, **suggest_index.search(prefix, limit)})
+
+@api.get("/api/changes")
+async def api_changes(since: int = None, limit: int = CHANGES_PAGE_SIZE):
+    """
+    Titles and files added, updated or deleted after the resume token `since`.
+    Without `since`, returns only the current token: take it before a full sync
+    via /api/all-tmdb-files, then poll with it. Upserts carry the current
+    document, so applying a page is idempotent. Responds 410 once the token is
+    older than the change log's retention; the client must then resync.
+    """
+    if since is None:
+        return JSONResponse({"titles": [], "files": [], "deleted_titles": [], "deleted_files": [],
+                             "next": await head_seq(), "has_more": False})
+    limit = min(max(limit, 1), CHANGES_PAGE_SIZE)
+    try:
+        changes, next_seq, has_more = await read_changes(since, limit)
+    except ChangesExpired:
+        raise HTTPException(status_code=410, detail="Resume token expired, resync from /api/all-tmdb-files")
+
+    title_keys = [(c["tmdb_type"], c["tmdb_id"]) for c in changes if c["kind"] == "title" and c["op"] == "upsert"]
+    file_keys = [(c["channel_id"], c["message_id"]) for c in changes if c["kind"] == "file" and c["op"] == "upsert"]
+    titles, files = await asyncio.gather(
+        files_col.find(
+            {"$or": [{"tmdb_type": t, "tmdb_id": i} for t, i in title_keys]}, LIST_PROJECTION
+        ).to_list(length=None) if title_keys else asyncio.sleep(0, []),
+        tmdb_files_col.find(
+            {"$or": [{"channel_id": c, "message_id": m} for c, m in file_keys]}, {"_id": 0}
+        ).to_list(length=None) if file_keys else asyncio.sleep(0, []),
+    )
+    # A document gone since its upsert was logged is reported by its own delete change
+    response_data = {
+        "titles": [serialize_tmdb_list_entry(t) for t in titles],
+        "files": [{**serialize_file(f), "tmdb_type": f.get("tmdb_type"), "tmdb_id": f.get("tmdb_id")} for f in files],
+        "deleted_titles": [
+            {"tmdb_type": c["tmdb_type"], "tmdb_id": c["tmdb_id"]}
+            for c in changes if c["kind"] == "title" and c["op"] == "delete"
+        ],
+        "deleted_files": [
+            {"channel_id": c["channel_id"], "message_id": c["message_id"]}
+            for c in changes if c["kind"] == "file" and c["op"] == "delete"
+        ],
+        "next": next_seq,
+        "has_more": has_more
+    }
     return JSONResponse(response_data)
 
+@api.get("/img/w{width}/{path}")
+async def image_proxy(width: int, path: str, request: Request):
+    """
+    Serve a TMDB image resized to `width` px, as WebP when the browser accepts it.
+    Variants are built once and kept in the disk cache; URLs never change content,
+    so responses are cacheable forever.
+    """
+    if width not in IMAGE_WIDTHS:
+        raise HTTPException(status_code=400, detail=f"width must be one of {', '.join(map(str, IMAGE_WIDTHS))}")
+    if not IMAGE_PATH_PATTERN.match(path):
+        raise HTTPException(status_code=400, detail="Invalid image path")
+    fmt = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
+    headers = {
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Vary": "Accept",
+        "ETag": f'"{image_cache_key("variant", path, width, fmt)}"',
+    }
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    try:
+        _, file_path = await get_variant(path, width, fmt)
+    except ImageNotFound:
+        raise HTTPException(status_code=404, detail="Image not found")
+    except UpstreamError as e:
+        logger.error(f"Image proxy upstream error: {e}")
+        raise HTTPException(status_code=502, detail="Image upstream error")
+    return FileResponse(file_path, media_type=IMAGE_MEDIA_TYPES[fmt], headers=headers)
+
 @api.get("/api/all-n-files")
 async def api_all_n_files(
     q: str = "",
@@ -198,27 +537,24 @@ async def api_all_n_files(
     """
     Return entries from n_files_col, paginated and filtered by search query.
     """
-    cache_key = make_cache_key("nfiles", q, offset, limit)
-    cached = all_n_files_cache.get(cache_key)  # Use the new cache here
-    if cached:
-        return JSONResponse(cached)
+    async def load():
+        search_fields = {
+            "q": ("file_name", True),
+        }
+        params = dict(q=q)
+        query = build_query(params, search_fields)
 
-    search_fields = {
-        "q": ("file_name", True),
-    }
-    params = dict(q=q)
-    query = build_query(params, search_fields)
+        cursor = n_files_col.find(query, {"_id": 0}).sort("_id", -1).skip(offset).limit(limit)
+        n_files = await cursor.to_list(length=limit)
 
-    cursor = n_files_col.find(query, {"_id": 0}).sort("_id", -1).skip(offset).limit(limit)
-    n_files = await cursor.to_list(length=limit)
+        total = await n_files_col.count_documents(query)
+        has_more = offset + limit < total
 
-    total = await n_files_col.count_documents(query)
-    has_more = offset + limit < total
+        return {
+            "results": [serialize_n_file(f) for f in n_files],
+            "has_more": has_more,
+            "total": total
+        }
 
-    response_data = {
-        "results": [serialize_n_file(f) for f in n_files],
-        "has_more": has_more,
-        "total": total
-    }
-    all_n_files_cache.set(cache_key, response_data)  # Use the new cache here
-    return JSONResponse(response_data)
\ No newline at end of file
+    cache_key = make_cache_key("nfiles", q, offset, limit)
+    return JSONResponse(await get_or_compute(all_n_files_cache, cache_key, load))
\ No newline at end of file
@@ -0,0 +1,191 @@
+import io
+import os
+import re
+import time
+import asyncio
+import hashlib
+import aiohttp
+from PIL import Image, UnidentifiedImageError
+from config import IMAGE_UPSTREAM_URL, IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_MB, logger
+from tmdb import get_session
+
+# =========================
+# Constants & Globals
+# =========================
+
+IMAGE_WIDTHS = (92, 154, 185, 342, 500, 780)  # Variant widths the proxy will produce
+IMAGE_QUALITY = {"webp": 80, "jpeg": 82}
+IMAGE_MEDIA_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+IMAGE_SOURCE_SIZE = "original"                # TMDB size fetched once per image
+EVICT_TO_RATIO = 0.9                          # Evict down to 90% of the budget, not just under it
+MAX_SOURCE_BYTES = 20 * 1024 * 1024          # Larger upstream images are refused, with or without Content-Length
+SOURCE_CHUNK_BYTES = 64 * 1024
+# TMDB file names, e.g. "kqjL17yufvn9OVLyXYpvtyrFfak.jpg"; anything else is refused
+IMAGE_PATH_PATTERN = re.compile(r"^[A-Za-z0-9_-]+\.(?:jpe?g|png|webp)$")
+
+_inflight = {}  # cache key -> Future, so concurrent misses fetch/resize once
+
+class ImageNotFound(Exception):
+    pass
+
+class UpstreamError(Exception):
+    pass
+
+# =========================
+# Disk LRU Cache
+# =========================
+
+class DiskLRU:
+    """
+    Size-bounded directory of cached blobs. A hit touches the file's mtime, so
+    eviction removes the least recently used files first. Safe to share between
+    processes: writes are atomic renames and eviction re-scans the directory.
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+
+    def path_for(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """Path of a cached blob, touched as recently used; None on a miss. Blocks on disk."""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        if self._size is None:
+            self._size = self._scan_size()
+        else:
+            self._size += len(data)
+        if self._size > self.max_bytes:
+            self.evict()
+        return path
+
+    def _entries(self):
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Delete least recently used files until the cache is under EVICT_TO_RATIO of its budget."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TO_RATIO
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except FileNotFoundError:
+                pass
+        self._size = total
+        if removed:
+            logger.info(f"Image cache evicted {removed} file(s), {total / 1024 / 1024:.1f} MB left")
+
+image_cache = DiskLRU(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_MB * 1024 * 1024)
+
+# =========================
+# Fetch & Resize
+# =========================
+
+def cache_key(*parts):
+    return hashlib.sha1("|".join(map(str, parts)).encode()).hexdigest()
+
+def resize_image(data, width, fmt):
+    """Downscale to `width` (never upscale) and re-encode. Runs in a worker thread."""
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert("RGB")
+        if img.width > width:
+            height = round(img.height * width / img.width)
+            img = img.resize((width, height), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format=fmt.upper(), quality=IMAGE_QUALITY[fmt], optimize=True)
+        return out.getvalue()
+
+def _coalesce(key, factory):
+    """Share one run of factory() between concurrent callers for the same cache key."""
+    if key not in _inflight:
+        _inflight[key] = asyncio.ensure_future(factory())
+        _inflight[key].add_done_callback(lambda _: _inflight.pop(key, None))
+    return asyncio.shield(_inflight[key])
+
+async def fetch_source(path):
+    """
+    Original image bytes for a TMDB file path, downloaded once and kept in the
+    disk cache. Concurrent misses (e.g. several widths of one poster) share one download.
+    """
+    key = cache_key("source", path)
+    cached = await asyncio.to_thread(image_cache.get, key)
+    if cached:
+        return await asyncio.to_thread(_read, cached)
+    return await _coalesce(key, lambda: _download_source(key, path))
+
+async def _download_source(key, path):
+    url = f"{IMAGE_UPSTREAM_URL}/{IMAGE_SOURCE_SIZE}/{path}"
+    start = time.perf_counter()
+    try:
+        async with get_session().get(url) as resp:
+            if resp.status == 404:
+                raise ImageNotFound(path)
+            if resp.status != 200:
+                raise UpstreamError(f"{resp.status} from {url}")
+            if (resp.content_length or 0) > MAX_SOURCE_BYTES:
+                raise UpstreamError(f"{url} is larger than {MAX_SOURCE_BYTES} bytes")
+            # Counted as it arrives: a chunked response has no Content-Length to check
+            chunks, size = [], 0
+            async for chunk in resp.content.iter_chunked(SOURCE_CHUNK_BYTES):
+                size += len(chunk)
+                if size > MAX_SOURCE_BYTES:
+                    raise UpstreamError(f"{url} is larger than {MAX_SOURCE_BYTES} bytes")
+                chunks.append(chunk)
+            data = b"".join(chunks)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise UpstreamError(f"{url}: {e}")
+    logger.info(f"Fetched image source {path} ({len(data)} bytes)", extra={"latency": time.perf_counter() - start})
+    await asyncio.to_thread(image_cache.put, key, data)
+    return data
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+async def _build_variant(key, path, width, fmt):
+    source = await fetch_source(path)
+    try:
+        data = await asyncio.to_thread(resize_image, source, width, fmt)
+    except (UnidentifiedImageError, OSError):
+        raise UpstreamError(f"{path} is not a readable image")
+    return await asyncio.to_thread(image_cache.put, key, data)
+
+async def get_variant(path, width, fmt="webp"):
+    """
+    Path of the cached `width`px `fmt` variant of a TMDB image, building it on
+    first request. Concurrent requests for the same variant share one build.
+    """
+    key = cache_key("variant", path, width, fmt)
+    cached = await asyncio.to_thread(image_cache.get, key)
+    if cached:
+        return key, cached
+    return key, await _coalesce(key, lambda: _build_variant(key, path, width, fmt))
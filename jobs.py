@@ -0,0 +1,253 @@
+import os
+import re
+import time
+import uuid
+import random
+import socket
+import asyncio
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from db import ingest_jobs_col, dead_letters_col, ingest_names_col
+from config import logger
+from metrics import INGEST_QUEUE_WAIT_SECONDS
+
+# =========================
+# Constants & Globals
+# =========================
+
+JOB_LEASE_SECONDS = 5 * 60       # A claimed job reappears if not finished within this time
+JOB_MAX_ATTEMPTS = 6             # Attempts before a failing job is dead-lettered
+JOB_BACKOFF_BASE = 30            # Seconds before the first retry; doubles each attempt
+JOB_BACKOFF_MAX = 60 * 60        # Retry delay cap
+JOB_POLL_INTERVAL = 5            # Seconds between polls when the queue looks empty
+
+# Lanes and their share of claims while several have work: a live post waits behind
+# at most a few other jobs however large the /index backfill, and backfill never starves
+LANE_LIVE = "live"          # New posts in indexed channels
+LANE_OWNER = "owner"        # Files the owner sends to the bot
+LANE_MANUAL = "manual"      # /tmdb corrections and /replay
+LANE_BACKFILL = "backfill"  # /index
+LANE_WEIGHTS = {LANE_LIVE: 8, LANE_OWNER: 8, LANE_MANUAL: 4, LANE_BACKFILL: 1}
+
+# One bot process per host consumes the queue; the pid tells restarts apart in the logs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+jobs_available = asyncio.Event()  # Set on enqueue so an idle worker wakes up at once
+_lane_credit = {lane: 0 for lane in LANE_WEIGHTS}  # Smooth weighted round-robin state
+_lane_idle_until = {lane: 0.0 for lane in LANE_WEIGHTS}  # Skip lanes found empty until then
+
+class PermanentIngestError(Exception):
+    """The file can never be resolved (e.g. no TMDB match); it is dead-lettered without retries."""
+
+# =========================
+# Queue Operations
+# =========================
+
+def job_key(file_info):
+    return f"{file_info['channel_id']}:{file_info['message_id']}"
+
+def now_utc():
+    return datetime.now(timezone.utc)
+
+async def enqueue_jobs(file_infos, notify=False, lane=LANE_BACKFILL, tmdb=None):
+    """
+    Persist files to index in `lane`. A file already waiting in the queue is not
+    added twice. `notify` marks jobs whose outcome should be reported to the log
+    channel; `tmdb` ({"tmdb_type", "tmdb_id"}) skips the name search, for /tmdb,
+    and moves an already queued job to `lane`, due now. A lease held on that job
+    is revoked, so a worker still processing the old copy cannot complete it.
+    Returns the number of new jobs.
+    """
+    if not file_infos:
+        return 0
+    now = now_utc()
+    requests_ = []
+    for file_info in file_infos:
+        update = {"$setOnInsert": {
+            "key": job_key(file_info),
+            "file_info": file_info,
+            "notify": notify,
+            "attempts": 0,
+            "visible_at": now,
+            "created_at": now,
+        }}
+        if tmdb:
+            del update["$setOnInsert"]["visible_at"]
+            update["$set"] = {"tmdb": tmdb, "lane": lane, "visible_at": now}
+            update["$unset"] = {"lease_owner": "", "lease_token": ""}
+        else:
+            update["$setOnInsert"]["lane"] = lane
+        requests_.append(UpdateOne({"key": job_key(file_info)}, update, upsert=True))
+    result = await ingest_jobs_col.bulk_write(requests_, ordered=False)
+    _lane_idle_until[lane] = 0.0
+    jobs_available.set()
+    return result.upserted_count
+
+def lane_query(lane):
+    # Jobs queued before lanes existed count as backfill
+    return {"lane": {"$in": [LANE_BACKFILL, None]}} if lane == LANE_BACKFILL else {"lane": lane}
+
+def next_lanes():
+    """
+    Lanes to try, in smooth weighted round-robin order among those not known to
+    be empty. The first lane is charged for the pick; the rest are fallbacks so
+    a claim never waits while any lane has work.
+    """
+    now = time.monotonic()
+    active = [lane for lane in LANE_WEIGHTS if _lane_idle_until[lane] <= now] or list(LANE_WEIGHTS)
+    for lane in active:
+        _lane_credit[lane] += LANE_WEIGHTS[lane]
+    picked = max(active, key=lambda lane: _lane_credit[lane])
+    _lane_credit[picked] -= sum(LANE_WEIGHTS[lane] for lane in active)
+    return [picked] + sorted((l for l in active if l != picked), key=lambda l: -LANE_WEIGHTS[l])
+
+async def claim_job():
+    """
+    Lease the oldest visible job of the next lane to this worker. The job stays
+    invisible to other claims until it is completed, retried or its lease runs
+    out. Returns None if every lane is idle.
+    """
+    for lane in next_lanes():
+        now = now_utc()
+        lease_token = uuid.uuid4().hex
+        job = await ingest_jobs_col.find_one_and_update(
+            {**lane_query(lane), "visible_at": {"$lte": now}},
+            {
+                "$set": {
+                    "visible_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    "lease_owner": WORKER_ID,
+                    "lease_token": lease_token,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("visible_at", 1)],
+            return_document=ReturnDocument.BEFORE
+        )
+        if job is None:
+            _lane_idle_until[lane] = time.monotonic() + JOB_POLL_INTERVAL
+            continue
+        # visible_at is when the job last became claimable, so this is pure queueing time
+        waited = now - job["visible_at"].replace(tzinfo=timezone.utc)
+        INGEST_QUEUE_WAIT_SECONDS.labels(lane).observe(waited.total_seconds())
+        job.update(lease_owner=WORKER_ID, lease_token=lease_token, attempts=job["attempts"] + 1, lane=lane)
+        return job
+    return None
+
+async def complete_job(job):
+    await ingest_jobs_col.delete_one({"_id": job["_id"], "lease_token": job["lease_token"]})
+
+def backoff_seconds(attempts):
+    """Exponential backoff with +-20% jitter so retried batches spread out."""
+    delay = min(JOB_BACKOFF_BASE * 2 ** (attempts - 1), JOB_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+async def fail_job(job, error, permanent=False):
+    """
+    Schedule a retry with backoff, or move the job to dead letters when the error
+    is permanent or the attempts are used up. Returns True if dead-lettered.
+    """
+    if permanent or job["attempts"] >= JOB_MAX_ATTEMPTS:
+        await dead_letters_col.update_one(
+            {"key": job["key"]},
+            {"$set": {
+                "key": job["key"],
+                "file_info": job["file_info"],
+                "notify": job.get("notify", False),
+                "tmdb": job.get("tmdb"),
+                "attempts": job["attempts"],
+                "error": str(error),
+                "permanent": permanent,
+                "failed_at": now_utc(),
+            }},
+            upsert=True
+        )
+        await complete_job(job)
+        return True
+    delay = backoff_seconds(job["attempts"])
+    await ingest_jobs_col.update_one(
+        {"_id": job["_id"], "lease_token": job["lease_token"]},
+        {
+            "$set": {"visible_at": now_utc() + timedelta(seconds=delay), "last_error": str(error)},
+            "$unset": {"lease_owner": "", "lease_token": ""},
+        }
+    )
+    logger.warning(
+        f"Ingest job {job['key']} failed (attempt {job['attempts']}), retrying in {delay:.0f}s: {error}",
+        extra={"channel_id": job["file_info"]["channel_id"], "message_id": job["file_info"]["message_id"]}
+    )
+    return False
+
+async def release_leases():
+    """
+    Make jobs leased by an earlier bot process on this host visible again, so
+    work interrupted by /restart or a crash resumes immediately.
+    """
+    result = await ingest_jobs_col.update_many(
+        {"lease_owner": {"$regex": f"^{re.escape(socket.gethostname())}:"}, "visible_at": {"$gt": now_utc()}},
+        {"$set": {"visible_at": now_utc()}, "$unset": {"lease_owner": "", "lease_token": ""}}
+    )
+    if result.modified_count:
+        logger.info(f"Released {result.modified_count} interrupted ingest job(s)")
+        jobs_available.set()
+    return result.modified_count
+
+async def queue_depth():
+    return await ingest_jobs_col.count_documents({})
+
+async def lane_depths():
+    """Waiting jobs per lane."""
+    depths = {lane: 0 for lane in LANE_WEIGHTS}
+    async for row in ingest_jobs_col.aggregate([{"$group": {"_id": "$lane", "count": {"$sum": 1}}}]):
+        depths[row["_id"] or LANE_BACKFILL] += row["count"]
+    return depths
+
+# =========================
+# File Name Claims
+# =========================
+
+async def claim_file_name(file_info):
+    """
+    Reserve a file name for this job before its TMDB lookup, so two messages
+    with the same name processed at once cannot both be indexed. Returns False
+    if another message holds the name. A retry of the same job keeps its claim.
+    """
+    key = job_key(file_info)
+    while True:
+        try:
+            await ingest_names_col.insert_one({"_id": file_info["file_name"], "key": key, "claimed_at": now_utc()})
+            return True
+        except DuplicateKeyError:
+            claim = await ingest_names_col.find_one({"_id": file_info["file_name"]})
+            if claim is not None:  # Otherwise it expired in between; claim again
+                return claim.get("key") == key
+
+async def release_file_name(file_name, file_info=None):
+    """Drop a name claim, only if held by file_info's job when given."""
+    query = {"_id": file_name}
+    if file_info:
+        query["key"] = job_key(file_info)
+    await ingest_names_col.delete_one(query)
+
+# =========================
+# Dead Letters
+# =========================
+
+async def list_dead_letters(limit=10):
+    cursor = dead_letters_col.find({}, {"file_info.parsed": 0}).sort("failed_at", -1).limit(limit)
+    return await cursor.to_list(length=limit)
+
+async def replay_dead_letters(keys=None):
+    """
+    Move dead letters (all, or those with the given keys) back into the queue
+    with a fresh attempt count. Returns the number replayed.
+    """
+    query = {"key": {"$in": list(keys)}} if keys else {}
+    replayed = 0
+    async for letter in dead_letters_col.find(query):
+        file_info = letter["file_info"]
+        file_info.pop("parsed", None)  # Re-parse in case the parser has improved since
+        await enqueue_jobs([file_info], notify=letter.get("notify", False), lane=LANE_MANUAL, tmdb=letter.get("tmdb"))
+        await dead_letters_col.delete_one({"_id": letter["_id"]})
+        replayed += 1
+    return replayed
@@ -0,0 +1,128 @@
+import io
+import os
+import time
+import glob
+import queue
+import atexit
+import tarfile
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# =========================
+# Constants & Globals
+# =========================
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+LOG_MAX_BYTES = 5 * 1024 * 1024        # Rotate when the file reaches 5 MB...
+LOG_ROTATE_SECONDS = 24 * 60 * 60      # ...or once a day, whichever comes first
+LOG_BACKUP_COUNT = 7                   # Rotated files kept next to the live log
+LOG_TAIL_LINES = 300                   # Lines sent by /log
+
+# Extra attributes rendered as key=value after the message, e.g.
+# logger.error("TMDB lookup failed", extra={"tmdb_id": 603, "latency": 1.2})
+STRUCTURED_FIELDS = ("user_id", "tmdb_id", "tmdb_type", "channel_id", "message_id", "latency")
+
+_listener = None
+
+# =========================
+# Handlers & Formatting
+# =========================
+
+class StructuredFormatter(logging.Formatter):
+    """Standard text format followed by any structured fields set on the record."""
+    def format(self, record):
+        message = super().format(record)
+        fields = []
+        for name in STRUCTURED_FIELDS:
+            value = getattr(record, name, None)
+            if value is None:
+                continue
+            if name == "latency" and isinstance(value, float):
+                value = f"{value:.3f}s"
+            fields.append(f"{name}={value}")
+        return f"{message} | {' '.join(fields)}" if fields else message
+
+class SizedTimedRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that also rolls over every `interval` seconds."""
+    def __init__(self, filename, max_bytes, interval, backup_count, encoding="utf-8"):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding=encoding)
+        self.interval = interval
+        self.rollover_at = time.time() + interval
+
+    def shouldRollover(self, record):
+        if time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+# =========================
+# Setup
+# =========================
+
+def setup_logging(log_file, level=logging.INFO):
+    """
+    Route all logging through a queue so callers on the event loop never touch
+    the disk. A background listener thread writes to a size- and time-rotated
+    file and to stderr.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = StructuredFormatter(LOG_FORMAT)
+    file_handler = SizedTimedRotatingFileHandler(log_file, LOG_MAX_BYTES, LOG_ROTATE_SECONDS, LOG_BACKUP_COUNT)
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers[:] = [QueueHandler(log_queue)]
+
+    _listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+# =========================
+# Log Retrieval
+# =========================
+
+def read_log_tail(log_file, lines=LOG_TAIL_LINES, block_size=8192):
+    """Return the last `lines` lines of the log without reading the whole file."""
+    with open(log_file, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= lines:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+    return b"\n".join(data.splitlines()[-lines:]).decode("utf-8", errors="replace")
+
+def log_tail_document(log_file, lines=LOG_TAIL_LINES):
+    """In-memory text file with the log tail, ready for send_document."""
+    document = io.BytesIO(read_log_tail(log_file, lines).encode("utf-8"))
+    document.name = "bot_log_tail.txt"
+    return document
+
+def log_archive_document(log_file):
+    """In-memory .tar.gz of the live log and its rotated backups."""
+    document = io.BytesIO()
+    with tarfile.open(fileobj=document, mode="w:gz") as tar:
+        for path in sorted(glob.glob(f"{log_file}*")):
+            tar.add(path, arcname=os.path.basename(path))
+    document.seek(0)
+    document.name = "bot_logs.tar.gz"
+    return document
@@ -0,0 +1,159 @@
+import os
+import hmac
+import time
+import logging
+import functools
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+)
+
+# =========================
+# Metric Definitions
+# =========================
+
+# Ingest pipeline (utility.file_queue_worker)
+INGEST_QUEUE_DEPTH = Gauge(
+    "bot_ingest_queue_depth", "Files waiting in the ingest queue"
+)
+INGEST_IN_FLIGHT = Gauge(
+    "bot_ingest_in_flight", "Files currently being processed by the ingest worker"
+)
+INGEST_FILES = Counter(
+    "bot_ingest_files_total", "Files processed by the ingest worker", ["status"]
+)
+INGEST_QUEUE_WAIT_SECONDS = Histogram(
+    "bot_ingest_queue_wait_seconds", "Time a job waited in its lane before being claimed", ["lane"],
+    buckets=(1, 5, 15, 60, 300, 900, 3600, 4 * 3600, 12 * 3600)
+)
+INGEST_SECONDS = Histogram(
+    "bot_ingest_file_seconds", "Time to resolve and store one queued file",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+# TMDB client (tmdb.py)
+TMDB_REQUEST_SECONDS = Histogram(
+    "tmdb_request_seconds", "TMDB API request latency", ["endpoint"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10)
+)
+TMDB_ERRORS = Counter(
+    "tmdb_errors_total", "TMDB API errors", ["endpoint"]
+)
+
+TMDB_THROTTLE_SECONDS = Histogram(
+    "tmdb_throttle_seconds", "Time a TMDB request waited for the client-side rate limiter",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+TMDB_RETRIES = Counter(
+    "tmdb_retries_total", "TMDB requests retried", ["endpoint", "reason"]
+)
+TMDB_DEDUPLICATED = Counter(
+    "tmdb_deduplicated_total", "TMDB requests served by an identical request already in flight", ["endpoint"]
+)
+TMDB_REFRESHED = Counter(
+    "tmdb_refreshed_titles_total", "Titles re-fetched by the TMDB refresher", ["result"]
+)
+
+# Telegram API (utility.safe_api_call)
+FLOODWAIT_TOTAL = Counter(
+    "telegram_floodwait_total", "FloodWait errors raised by Telegram"
+)
+FLOODWAIT_SLEEP_SECONDS = Counter(
+    "telegram_floodwait_sleep_seconds_total", "Seconds slept because of FloodWait"
+)
+
+# File delivery pool (delivery.py)
+DELIVERY_SENDS = Counter(
+    "delivery_sends_total", "copy_message attempts by delivery client", ["client", "result"]
+)
+DELIVERY_FLOODWAIT_SECONDS = Counter(
+    "delivery_floodwait_seconds_total", "FloodWait seconds imposed per delivery client", ["client"]
+)
+DELIVERY_IN_FLIGHT = Gauge(
+    "delivery_in_flight", "Sends in flight per delivery client", ["client"]
+)
+DELIVERY_FILE_IDS = Counter(
+    "delivery_file_id_total", "Stored file_id lookups on send (hit, miss, stale)", ["result"]
+)
+
+# FastAPI (fast_api.py)
+API_CACHE_REQUESTS = Counter(
+    "api_cache_requests_total", "API cache lookups", ["cache", "result"]
+)
+API_REQUEST_SECONDS = Histogram(
+    "api_request_seconds", "API endpoint latency", ["endpoint", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+# Bot command handlers (bot.py)
+BOT_HANDLER_SECONDS = Histogram(
+    "bot_handler_seconds", "Bot handler latency", ["handler"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 3, 5, 10, 30, 60)
+)
+BOT_HANDLER_ERRORS = Counter(
+    "bot_handler_errors_total", "Bot handler exceptions", ["handler"]
+)
+
+# Bot handler pools (scheduler.py)
+BOT_HANDLER_QUEUE_SECONDS = Histogram(
+    "bot_handler_queue_seconds", "Time an update waited for a free slot in its handler pool", ["pool"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+BOT_HANDLER_QUEUE_DEPTH = Gauge(
+    "bot_handler_queue_depth", "Updates waiting in a handler pool", ["pool"]
+)
+BOT_HANDLER_SHED = Counter(
+    "bot_handler_shed_total", "Updates dropped because their handler pool was full", ["pool"]
+)
+CATALOG_EXPORT_WRITES = Counter(
+    "catalog_export_writes_total", "Files (re)written by the static catalog export", ["kind"]
+)
+
+SLOW_HANDLER_SECONDS = 10  # Handlers slower than this are logged with their latency
+
+logger = logging.getLogger("sharing_bot")
+
+# =========================
+# Helpers
+# =========================
+
+def timed_handler(name):
+    """Decorator recording latency and uncaught errors of a bot handler."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                BOT_HANDLER_ERRORS.labels(name).inc()
+                raise
+            finally:
+                latency = time.perf_counter() - start
+                BOT_HANDLER_SECONDS.labels(name).observe(latency)
+                if latency > SLOW_HANDLER_SECONDS:
+                    message = args[1] if len(args) > 1 else None
+                    user = getattr(message, "from_user", None)
+                    logger.warning(
+                        f"Slow handler: {name}",
+                        extra={"user_id": getattr(user, "id", None), "latency": latency}
+                    )
+        return wrapper
+    return decorator
+
+def render_metrics():
+    """
+    Return the Prometheus exposition body and its content type. Under api_server.py
+    (PROMETHEUS_MULTIPROC_DIR set) the samples of every worker are aggregated.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+def metrics_authorized(authorization, token):
+    """True if no token is required, or `authorization` is `Bearer <token>`."""
+    if not token:
+        return True
+    supplied = (authorization or "").removeprefix("Bearer ").strip()
+    return hmac.compare_digest(supplied.encode(), token.encode())
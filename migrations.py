@@ -0,0 +1,114 @@
+"""
+One-shot data migrations. Each migration is idempotent and resumable, so it is
+safe to run again after an interruption.
+
+Usage:
+    python migrations.py
+"""
+import asyncio
+from pymongo import UpdateOne
+from config import BOT_USERNAME, logger
+from db import files_col, tmdb_files_col, ensure_indexes
+from utility import generate_telegram_link, refresh_title_filters
+from release_parser import PARSER_VERSION, parse_batch, release_fields
+from changes import change_log, title_change, file_change
+from cache import CATALOG_CACHES, invalidate_caches
+
+MIGRATION_BATCH_SIZE = 200  # Title documents per batch
+RELEASE_BATCH_SIZE = 1000   # File documents re-parsed per batch
+
+async def migrate_embedded_files(batch_size=MIGRATION_BATCH_SIZE):
+    """
+    Move files embedded in each title's `files` array into tmdb_files, keyed by
+    (channel_id, message_id), then unset the array. Files that appear more than
+    once (the old $addToSet compared whole dicts) collapse into one document.
+    Returns (titles_migrated, files_written).
+    """
+    await ensure_indexes()
+    titles_migrated = files_written = 0
+    while True:
+        titles = await files_col.find(
+            {"files": {"$exists": True}},
+            {"_id": 1, "tmdb_type": 1, "tmdb_id": 1, "files": 1}
+        ).limit(batch_size).to_list(length=batch_size)
+        if not titles:
+            break
+
+        requests = []
+        for title in titles:
+            for file in title.get("files") or []:
+                if file.get("channel_id") is None or file.get("message_id") is None:
+                    continue
+                file = dict(file)
+                file.setdefault("telegram_link", generate_telegram_link(
+                    BOT_USERNAME, file["channel_id"], file["message_id"]
+                ))
+                file["tmdb_type"] = title["tmdb_type"]
+                file["tmdb_id"] = title["tmdb_id"]
+                requests.append(UpdateOne(
+                    {"channel_id": file["channel_id"], "message_id": file["message_id"]},
+                    {"$set": file},
+                    upsert=True
+                ))
+        if requests:
+            result = await tmdb_files_col.bulk_write(requests, ordered=False)
+            files_written += result.upserted_count + result.modified_count
+
+        await files_col.update_many(
+            {"_id": {"$in": [title["_id"] for title in titles]}},
+            {"$unset": {"files": ""}}
+        )
+        titles_migrated += len(titles)
+        logger.info(f"Migrated files of {titles_migrated} titles ({files_written} files written)")
+    return titles_migrated, files_written
+
+async def backfill_release_fields(batch_size=RELEASE_BATCH_SIZE, progress=None):
+    """
+    Parse the file name of every file not parsed by the current PARSER_VERSION,
+    store its release fields (resolution, quality, codec, season, episode) and
+    recompute the filter arrays of the affected titles. Batches are parsed in
+    the process pool. `progress(files_done)` is awaited after each batch.
+    Returns (files_parsed, titles_updated).
+    """
+    await ensure_indexes()
+    files_parsed = titles_updated = 0
+    while True:
+        docs = await tmdb_files_col.find(
+            {"parsed.v": {"$ne": PARSER_VERSION}},
+            {"_id": 1, "file_name": 1, "channel_id": 1, "message_id": 1, "tmdb_type": 1, "tmdb_id": 1}
+        ).limit(batch_size).to_list(length=batch_size)
+        if not docs:
+            break
+
+        parsed_list = await parse_batch([doc.get("file_name") or "" for doc in docs])
+        await tmdb_files_col.bulk_write([
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"parsed": parsed, **release_fields(parsed)}})
+            for doc, parsed in zip(docs, parsed_list)
+        ], ordered=False)
+        titles = list(dict.fromkeys(
+            (doc["tmdb_type"], doc["tmdb_id"]) for doc in docs if doc.get("tmdb_type") and doc.get("tmdb_id")
+        ))
+        await refresh_title_filters(titles)
+        # API clients following /api/changes re-fetch the titles and files that gained fields
+        await change_log.record(
+            [title_change("upsert", tmdb_type, tmdb_id) for tmdb_type, tmdb_id in titles]
+            + [file_change("upsert", doc.get("channel_id"), doc.get("message_id"), doc.get("tmdb_type"), doc.get("tmdb_id"))
+               for doc in docs]
+        )
+        files_parsed += len(docs)
+        titles_updated += len(titles)
+        logger.info(f"Re-parsed {files_parsed} files ({titles_updated} title updates)")
+        if progress:
+            await progress(files_parsed)
+    if files_parsed:
+        await asyncio.to_thread(invalidate_caches, *CATALOG_CACHES)
+    return files_parsed, titles_updated
+
+async def main():
+    titles, files = await migrate_embedded_files()
+    print(f"Migrated {titles} titles, {files} files written to tmdb_files.")
+    files, titles = await backfill_release_fields()
+    print(f"Re-parsed {files} files, updated filters of {titles} titles.")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,151 @@
+import time
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from db import files_col
+from config import TMDB_REFRESH_ENABLED, TMDB_REFRESH_DAYS, TMDB_REFRESH_REQUESTS_PER_HOUR, logger
+from tmdb import get_by_id
+from facets import FACET_PROJECTION, apply_facet_delta, title_lock
+from changes import change_log, title_change
+from cache import CATALOG_CACHES, invalidate_caches
+from metrics import TMDB_REFRESHED
+
+# =========================
+# Constants & Globals
+# =========================
+
+REFRESH_CONCURRENCY = 4        # Titles re-fetched at once
+REFRESH_BATCH_SIZE = 100       # Stale titles read per query
+REFRESH_IDLE_SECONDS = 60 * 60  # Sleep when every title is fresh
+REQUESTS_PER_TITLE = 4         # get_by_id: details, images, credits, videos
+
+# =========================
+# Refresher
+# =========================
+
+class TmdbRefresher:
+    """
+    Re-fetches TMDB metadata for titles, stalest `refreshed_at` first, and
+    writes back only the fields that changed. Title starts are paced so the
+    refresher stays within `requests_per_hour` TMDB requests.
+    """
+    def __init__(self, requests_per_hour=TMDB_REFRESH_REQUESTS_PER_HOUR, stale_days=TMDB_REFRESH_DAYS,
+                 concurrency=REFRESH_CONCURRENCY, enabled=TMDB_REFRESH_ENABLED):
+        self.interval = 3600 * REQUESTS_PER_TITLE / max(requests_per_hour, 1)
+        self.stale_days = stale_days
+        self.concurrency = concurrency
+        self._running = asyncio.Event()
+        if enabled:
+            self._running.set()
+        self._done = deque()  # Finish times of refreshes in the last hour
+        self.counts = {"changed": 0, "unchanged": 0, "error": 0}
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def per_hour(self):
+        cutoff = time.monotonic() - 3600
+        while self._done and self._done[0] < cutoff:
+            self._done.popleft()
+        return len(self._done)
+
+    async def stale_titles(self, limit=REFRESH_BATCH_SIZE):
+        """Titles not refreshed within stale_days, never-refreshed ones first."""
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.stale_days)
+        cursor = files_col.find({"refreshed_at": {"$not": {"$gte": cutoff}}}, {"_id": 0})
+        return await cursor.sort("refreshed_at", 1).limit(limit).to_list(length=limit)
+
+    async def refresh_title(self, entry):
+        """
+        Re-fetch one title and $set the fields that differ. Returns the result label.
+        refreshed_at moves only once the change is logged: until then the title stays
+        stale and marked refresh_pending, so the next pass logs it even with no diff.
+        """
+        tmdb_type, tmdb_id = entry["tmdb_type"], entry["tmdb_id"]
+        query = {"tmdb_type": tmdb_type, "tmdb_id": tmdb_id}
+        now = datetime.now(timezone.utc)
+        result = await get_by_id(tmdb_type, tmdb_id)
+        fresh = result.get("mongo_dict")
+        if not fresh or not fresh.get("title"):
+            # Keep the stored metadata; try again after the next stale_days
+            await files_col.update_one(query, {"$set": {"refreshed_at": now, "refresh_error": result.get("message")}})
+            return "error"
+        diff = {field: value for field, value in fresh.items() if entry.get(field) != value}
+        if diff:
+            async with title_lock(tmdb_type, tmdb_id):
+                # Diff the facets against the document as written over, not the batch's earlier read
+                before = await files_col.find_one_and_update(
+                    query, {"$set": {**diff, "refresh_pending": True}}, projection=FACET_PROJECTION
+                )
+                if before is None:
+                    return "unchanged"
+                await apply_facet_delta(before, {**before, **diff})
+        changed = bool(diff) or entry.get("refresh_pending", False)
+        if changed:
+            await change_log.record([title_change("upsert", tmdb_type, tmdb_id)])
+        update = {"$set": {"refreshed_at": now}, "$unset": {"refresh_pending": ""}}
+        if "refresh_error" in entry:
+            update["$unset"]["refresh_error"] = ""
+        await files_col.update_one(query, update)
+        if not changed:
+            return "unchanged"
+        logger.info(f"Refreshed {', '.join(sorted(diff)) or 'pending change'}", extra={"tmdb_id": tmdb_id, "tmdb_type": tmdb_type})
+        return "changed"
+
+    async def _refresh(self, entry, semaphore):
+        try:
+            outcome = await self.refresh_title(entry)
+        except Exception as e:
+            logger.error(f"TMDB refresh failed: {e}", extra={"tmdb_id": entry.get("tmdb_id"), "tmdb_type": entry.get("tmdb_type")})
+            outcome = "error"
+        finally:
+            semaphore.release()
+        self.counts[outcome] += 1
+        self._done.append(time.monotonic())
+        TMDB_REFRESHED.labels(outcome).inc()
+        return outcome
+
+    async def run(self):
+        """Refresh stale titles forever, pausing while paused and idling when all are fresh."""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        next_start = time.monotonic()
+        while True:
+            await self._running.wait()
+            try:
+                batch = await self.stale_titles()
+            except Exception as e:
+                logger.error(f"Failed to read stale titles: {e}")
+                await asyncio.sleep(REFRESH_IDLE_SECONDS / 60)
+                continue
+            if not batch:
+                await asyncio.sleep(REFRESH_IDLE_SECONDS)
+                continue
+            tasks = []
+            for entry in batch:
+                await self._running.wait()
+                delay = next_start - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                next_start = max(next_start, time.monotonic()) + self.interval
+                await semaphore.acquire()
+                tasks.append(asyncio.create_task(self._refresh(entry, semaphore)))
+            outcomes = await asyncio.gather(*tasks)
+            if "changed" in outcomes:
+                await asyncio.to_thread(invalidate_caches, *CATALOG_CACHES)
+
+    def status(self):
+        return {
+            "paused": self.paused,
+            "per_hour": self.per_hour(),
+            "budget_per_hour": round(3600 / self.interval),
+            **self.counts,
+        }
+
+tmdb_refresher = TmdbRefresher()
@@ -0,0 +1,186 @@
+import re
+import sys
+import types
+import asyncio
+import multiprocessing
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import PTN
+
+# =========================
+# Constants & Globals
+# =========================
+
+PARSER_VERSION = 2              # Bump when parse output changes so stored results are re-parsed
+PARSE_CACHE_SIZE = 50_000       # Memoized file names kept in this process
+PARSE_POOL_WORKERS = 2          # Processes used for bulk parsing
+PARSE_POOL_MIN_BATCH = 32       # Smaller batches are parsed inline
+PARSE_POOL_CHUNK = 256          # File names sent to a pool worker per task
+
+# Compiled once at import; remove_redandent used to rebuild these on every call
+USERNAME_PATTERNS = [
+    re.compile(r"^@[\w\.-]+?(?=_)"),
+    re.compile(r"_@[A-Za-z]+_|@[A-Za-z]+_|[\[\]\s@]*@[^.\s\[\]]+[\]\[\s@]*"),
+    re.compile(r"^[\w\.-]+?(?=_Uploads_)"),
+    re.compile(r"^(?:by|from)[\s_-]+[\w\.-]+?(?=_)"),
+    re.compile(r"^\[[\w\.-]+?\][\s_-]*"),
+    re.compile(r"^\([\w\.-]+?\)[\s_-]*"),
+]
+EDGE_PATTERN = re.compile(r"^[_\s-]+|[_\s-]+$")
+EXTENSION_PATTERN = re.compile(r"\.mkv|\.mp4|\.webm")
+EXTENSION_SPLIT_PATTERN = re.compile(r"(\.mkv|\.mp4)")
+
+# Parsed fields stored on each file document, and the title-level arrays they roll up into
+RELEASE_FIELDS = ("resolution", "quality", "codec", "season", "episode")
+TITLE_FILTER_FIELDS = {"resolution": "resolutions", "quality": "qualities", "codec": "codecs", "season": "seasons"}
+
+_memo = OrderedDict()
+_pool = None
+
+# =========================
+# Name Cleaning
+# =========================
+
+def remove_redandent(filename):
+    """
+    Remove common username patterns from a filename while preserving the content title.
+
+    Args:
+        filename (str): The input filename
+
+    Returns:
+        str: Filename with usernames removed
+    """
+    result = filename.replace("\n", "\\n")
+    for pattern in USERNAME_PATTERNS:
+        if pattern.search(result):
+            result = pattern.sub(" ", result)
+            break
+    return EDGE_PATTERN.sub(" ", result)
+
+def strip_extension(name):
+    """Remove .mkv, .mp4 and .webm extensions."""
+    return EXTENSION_PATTERN.sub("", name)
+
+def cut_after_extension(name):
+    """Drop everything after the first .mkv or .mp4 extension."""
+    return "".join(EXTENSION_SPLIT_PATTERN.split(name)[:2])
+
+# =========================
+# Parsing
+# =========================
+
+def _label(value):
+    """Lower-cased PTN label ("1080p", "web-dl", "h.265"), so filters are exact matches."""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if value is None:
+        return None
+    return str(value).strip().lower() or None
+
+def _parse(file_name):
+    """Parse one cleaned file name into the fields the ingest worker and the filters need."""
+    parsed_data = PTN.parse(remove_redandent(file_name))
+    title = (parsed_data.get("title") or "").replace("_", " ").replace("-", " ").replace(":", " ")
+    return {
+        "title": " ".join(title.split()),
+        "year": parsed_data.get("year"),
+        "season": parsed_data.get("season"),    # int, or a list for multi-season packs
+        "episode": parsed_data.get("episode"),  # int, or a list for multi-episode files
+        "resolution": _label(parsed_data.get("resolution")),
+        "quality": _label(parsed_data.get("quality")),
+        "codec": _label(parsed_data.get("codec")),
+        "v": PARSER_VERSION,
+    }
+
+def _parse_many(file_names):
+    """Pool entry point: parse a chunk of names in a worker process."""
+    return [_parse(name) for name in file_names]
+
+def _remember(file_name, parsed):
+    _memo[file_name] = parsed
+    _memo.move_to_end(file_name)
+    if len(_memo) > PARSE_CACHE_SIZE:
+        _memo.popitem(last=False)
+
+def parse_filename(file_name):
+    """Parse a file name, memoizing the result. Returns a fresh dict."""
+    parsed = _memo.get(file_name)
+    if parsed is None:
+        parsed = _parse(file_name)
+        _remember(file_name, parsed)
+    else:
+        _memo.move_to_end(file_name)
+    return dict(parsed)
+
+def is_current(parsed):
+    """True if a stored parse result was produced by this parser version."""
+    return bool(parsed) and parsed.get("v") == PARSER_VERSION
+
+def release_fields(parsed):
+    """The filterable fields of a parse result, as stored on the file document."""
+    return {field: parsed.get(field) for field in RELEASE_FIELDS}
+
+def title_filter_values(releases):
+    """
+    Roll the release fields of a title's files up into its filter arrays,
+    e.g. {"resolutions": ["1080p", "720p"], "seasons": [1, 2], ...}.
+    """
+    values = {array: set() for array in TITLE_FILTER_FIELDS.values()}
+    for release in releases:
+        for field, array in TITLE_FILTER_FIELDS.items():
+            value = release.get(field)
+            for item in value if isinstance(value, list) else [value]:
+                if item is not None:
+                    values[array].add(item)
+    return {array: sorted(items) for array, items in values.items()}
+
+@contextmanager
+def _bare_main():
+    # A child re-runs the entry script (bot.py: config, logging, clients) unless
+    # __main__ has neither __spec__ nor __file__ when it is started
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        # Not fork: the logging listener and Motor threads may hold locks at fork time.
+        # The fork server and workers import only this module
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        _pool = ProcessPoolExecutor(max_workers=PARSE_POOL_WORKERS, mp_context=context)
+        with _bare_main():
+            # Workers start on submit, one per call until the pool is full
+            for _ in range(PARSE_POOL_WORKERS):
+                _pool.submit(int)
+    return _pool
+
+async def parse_batch(file_names):
+    """
+    Parse many file names, returning results in the same order.
+    Repeated and memoized names are not parsed again; large batches of new
+    names are split across the process pool so the event loop stays free.
+    """
+    missing = list(dict.fromkeys(name for name in file_names if name not in _memo))
+    if len(missing) >= PARSE_POOL_MIN_BATCH:
+        loop = asyncio.get_running_loop()
+        chunks = [missing[i:i + PARSE_POOL_CHUNK] for i in range(0, len(missing), PARSE_POOL_CHUNK)]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(get_pool(), _parse_many, chunk) for chunk in chunks
+        ))
+        for chunk, parsed_chunk in zip(chunks, results):
+            for name, parsed in zip(chunk, parsed_chunk):
+                _remember(name, parsed)
+    return [parse_filename(name) for name in file_names]
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
@@ -0,0 +1,73 @@
+import time
+import asyncio
+import functools
+from config import logger
+from metrics import BOT_HANDLER_QUEUE_SECONDS, BOT_HANDLER_QUEUE_DEPTH, BOT_HANDLER_SHED
+
+# =========================
+# Handler Pools
+# =========================
+
+class HandlerPool:
+    """
+    Runs bot handlers of one class (user delivery, ingest, admin) on its own
+    `concurrency` worker tasks, fed by a queue of at most `max_queue` updates
+    (0 = unbounded). Pyrogram's dispatcher only hands the update over, so a
+    slow class never holds up the others.
+    """
+    def __init__(self, name, concurrency, max_queue=0, busy_reply=None):
+        self.name = name
+        self.concurrency = concurrency
+        self.busy_reply = busy_reply  # Sent to the user when an update is shed
+        self.queue = asyncio.Queue(max_queue)
+        self._workers = []
+
+    def _start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    def submit(self, func, *args):
+        """Queue a handler call. Returns False if the queue is full."""
+        self._start()
+        try:
+            self.queue.put_nowait((time.monotonic(), func, args))
+        except asyncio.QueueFull:
+            BOT_HANDLER_SHED.labels(self.name).inc()
+            return False
+        BOT_HANDLER_QUEUE_DEPTH.labels(self.name).set(self.queue.qsize())
+        return True
+
+    async def _worker(self):
+        while True:
+            queued_at, func, args = await self.queue.get()
+            BOT_HANDLER_QUEUE_DEPTH.labels(self.name).set(self.queue.qsize())
+            BOT_HANDLER_QUEUE_SECONDS.labels(self.name).observe(time.monotonic() - queued_at)
+            try:
+                await func(*args)
+            except Exception as e:
+                # Pyrogram would have logged it; the worker must survive it
+                logger.error(f"Handler {getattr(func, '__name__', func)} failed in pool {self.name}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def status(self):
+        return {"queued": self.queue.qsize(), "max_queue": self.queue.maxsize, "concurrency": self.concurrency}
+
+def scheduled(pool):
+    """
+    Decorator that hands a (client, update) handler to `pool` and returns at
+    once. When the pool is saturated the update is dropped and, if the pool has
+    a busy_reply, the user is told to retry.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(client, update):
+            if pool.submit(func, client, update) or not pool.busy_reply:
+                return
+            try:
+                # No FloodWait retry: under load the reply is best effort
+                await update.reply_text(pool.busy_reply)
+            except Exception as e:
+                logger.warning(f"Failed to send busy reply from pool {pool.name}: {e}")
+        return wrapper
+    return decorator
@@ -0,0 +1,57 @@
+import time
+from contextlib import contextmanager
+
+# Imported first by bot.py so the clock covers module imports too
+PROCESS_START = time.perf_counter()
+
+# =========================
+# Startup Profiling
+# =========================
+
+class StartupProfiler:
+    """Records how long each startup phase takes, in the order they ran."""
+    def __init__(self, started_at=PROCESS_START):
+        self.started_at = started_at
+        self.phases = []
+        self.first_update_at = None
+        self._last_mark = started_at
+
+    def mark(self, name):
+        """Close a phase that started at the previous mark (or process start)."""
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last_mark))
+        self._last_mark = now
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            self.phases.append((name, now - start))
+            self._last_mark = now
+
+    def mark_first_update(self):
+        """Record the first update received; returns True only the first time."""
+        if self.first_update_at is not None:
+            return False
+        self.first_update_at = time.perf_counter()
+        return True
+
+    @property
+    def total(self):
+        return self._last_mark - self.started_at
+
+    @property
+    def time_to_first_update(self):
+        if self.first_update_at is None:
+            return None
+        return self.first_update_at - self.started_at
+
+    def report(self):
+        lines = [f"• {name}: <b>{seconds:.2f}s</b>" for name, seconds in self.phases]
+        lines.append(f"⏱ Ready after <b>{self.total:.2f}s</b>")
+        return "\n".join(lines)
+
+profiler = StartupProfiler()
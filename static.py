@@ -0,0 +1,67 @@
+import os
+import gzip
+import hashlib
+from config import logger
+
+try:
+    import brotli
+except ImportError:  # Optional: without it pages are offered as gzip only
+    brotli = None
+
+# =========================
+# Constants & Globals
+# =========================
+
+STATIC_DIR = os.path.dirname(os.path.abspath(__file__))
+FRONTEND_PAGES = ("index.html", "nfiles.html")
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# Unversioned URLs must be revalidated (cheap with the ETag); versioned URLs never change
+REVALIDATE = "public, max-age=0, must-revalidate"
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+pages = {}  # name -> StaticPage
+
+# =========================
+# Precompressed Pages
+# =========================
+
+class StaticPage:
+    """A frontend file held in memory with its gzip/brotli variants and a content hash."""
+    def __init__(self, name, body, media_type="text/html; charset=utf-8"):
+        self.name = name
+        self.media_type = media_type
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {"identity": body, "gzip": gzip.compress(body, GZIP_LEVEL, mtime=0)}
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+
+    @property
+    def versioned_name(self):
+        stem, ext = os.path.splitext(self.name)
+        return f"{stem}.{self.digest}{ext}"
+
+    def negotiate(self, accept_encoding):
+        """Pick the smallest variant the client accepts; returns (encoding, body)."""
+        accepted = {token.split(";")[0].strip() for token in accept_encoding.lower().split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.variants:
+                return encoding, self.variants[encoding]
+        return "identity", self.variants["identity"]
+
+def load_pages(directory=STATIC_DIR, names=FRONTEND_PAGES):
+    """Read and precompress the frontend pages. Called once when the API starts."""
+    for name in names:
+        path = os.path.join(directory, name)
+        try:
+            with open(path, "rb") as f:
+                page = StaticPage(name, f.read())
+        except OSError as e:
+            logger.error(f"Failed to load frontend page {name}: {e}")
+            continue
+        pages[name] = page
+        pages[page.versioned_name] = page
+        sizes = ", ".join(f"{enc} {len(body)}" for enc, body in page.variants.items())
+        logger.info(f"Loaded {name} as {page.versioned_name} ({sizes} bytes)")
+    return pages
@@ -0,0 +1,309 @@
+import re
+import heapq
+import asyncio
+import unicodedata
+from bisect import bisect_left, insort
+from db import files_col
+from config import logger
+from changes import ChangesExpired, head_seq, read_changes
+
+# =========================
+# Constants & Globals
+# =========================
+
+BURST_SIZE = 128          # A trie leaf holding more keys than this is split by the next character
+TOP_K = 10                # Best entries kept per node, and the most /api/suggest returns
+MAX_KEY_LENGTH = 40       # Suffix keys are truncated to this many characters
+MAX_WORD_KEYS = 6         # A name is findable from each of its first this many words
+SUGGEST_SYNC_SECONDS = 5  # Change feed poll interval
+SUGGEST_FIELDS = {"_id": 0, "tmdb_type": 1, "tmdb_id": 1, "title": 1, "rating": 1,
+                  "release_date": 1, "poster_url": 1, "stars.name": 1, "directors.name": 1}
+
+_NON_WORD = re.compile(r"[^\w]+")
+
+def normalize(text):
+    """Casefold, strip accents and punctuation, collapse whitespace."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(_NON_WORD.sub(" ", text.casefold()).split())
+
+def word_keys(text):
+    """'The Dark Knight' -> ['the dark knight', 'dark knight', 'knight'], so any word start matches."""
+    words = normalize(text).split()
+    keys = {" ".join(words[i:])[:MAX_KEY_LENGTH] for i in range(min(len(words), MAX_WORD_KEYS))}
+    return sorted(keys)
+
+# =========================
+# Burst Trie
+# =========================
+
+class _Node:
+    __slots__ = ("children", "bucket", "top")
+
+    def __init__(self):
+        self.children = None  # char -> _Node once this node has burst
+        self.bucket = []      # Sorted (key, entry_id): all keys below a leaf, or keys ending at a burst node
+        self.top = []         # Up to TOP_K (score, entry_id) for the whole subtree, best first
+
+class PrefixTrie:
+    """
+    Burst trie: a leaf keeps its keys in one sorted bucket and splits into
+    child nodes by the next character once it holds more than BURST_SIZE.
+    Every node keeps the TOP_K best entries of its subtree, so a prefix that
+    reaches a node is answered without scanning; a longer prefix bisects one
+    small bucket.
+    """
+    def __init__(self):
+        self.root = _Node()
+        self.entries = {}  # entry_id -> (score, keys, payload)
+
+    def _path(self, key, create=True):
+        """Nodes from the root to the one that stores `key`; the list index is the node's depth."""
+        node, path = self.root, [self.root]
+        while node.children is not None and len(key) > len(path) - 1:
+            ch = key[len(path) - 1]
+            child = node.children.get(ch)
+            if child is None:
+                if not create:
+                    break
+                child = node.children[ch] = _Node()
+            node = child
+            path.append(node)
+        return path
+
+    def _score(self, entry_id):
+        return self.entries[entry_id][0]
+
+    def _best(self, candidates):
+        """Top TOP_K distinct entries from (score, entry_id) pairs."""
+        best = {}
+        for score, entry_id in candidates:
+            if best.get(entry_id, float("-inf")) < score:
+                best[entry_id] = score
+        return heapq.nlargest(TOP_K, ((score, entry_id) for entry_id, score in best.items()))
+
+    def _recompute(self, node):
+        candidates = [(self._score(entry_id), entry_id) for _, entry_id in node.bucket]
+        for child in (node.children or {}).values():
+            candidates.extend(child.top)
+        node.top = self._best(candidates)
+
+    def _burst(self, node, depth, rebuild_tops):
+        """Move the keys longer than `depth` from a full leaf into per-character children."""
+        node.children = {}
+        keep = []
+        for key, entry_id in node.bucket:
+            if len(key) > depth:
+                node.children.setdefault(key[depth], _Node()).bucket.append((key, entry_id))
+            else:
+                keep.append((key, entry_id))
+        node.bucket = keep
+        if rebuild_tops:
+            for child in node.children.values():
+                self._recompute(child)
+
+    def add(self, entry_id, text, score, payload, rebuild_tops=True):
+        """Insert or replace an entry. Bulk loads pass rebuild_tops=False and call rebuild() once."""
+        if entry_id in self.entries:
+            self.remove(entry_id, rebuild_tops)
+        keys = word_keys(text)
+        if not keys:
+            return
+        self.entries[entry_id] = (score, keys, payload)
+        for key in keys:
+            path = self._path(key)
+            leaf = path[-1]
+            insort(leaf.bucket, (key, entry_id))
+            if rebuild_tops:
+                for node in path:
+                    node.top = self._best(node.top + [(score, entry_id)])
+            if leaf.children is None and len(leaf.bucket) > BURST_SIZE and len(path) - 1 < MAX_KEY_LENGTH:
+                self._burst(leaf, len(path) - 1, rebuild_tops)
+
+    def remove(self, entry_id, rebuild_tops=True):
+        entry = self.entries.get(entry_id)
+        if entry is None:
+            return
+        paths = [self._path(key, create=False) for key in entry[1]]
+        for key, path in zip(entry[1], paths):
+            bucket = path[-1].bucket
+            index = bisect_left(bucket, (key, entry_id))
+            if index < len(bucket) and bucket[index] == (key, entry_id):
+                del bucket[index]
+        del self.entries[entry_id]
+        if rebuild_tops:
+            stale = {}
+            for path in paths:
+                for depth, node in enumerate(path):
+                    if any(e == entry_id for _, e in node.top):
+                        stale[id(node)] = (depth, node)
+            # Deepest first, so parents merge already-corrected child tops
+            for _, node in sorted(stale.values(), key=lambda item: -item[0]):
+                self._recompute(node)
+
+    def rebuild(self):
+        """Recompute every node's top entries bottom-up, after a bulk load."""
+        stack, order = [self.root], []
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            stack.extend((node.children or {}).values())
+        for node in reversed(order):
+            self._recompute(node)
+
+    def search(self, prefix, limit=TOP_K):
+        """Payloads of the best entries with a key starting with `prefix`."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        node, depth = self.root, 0
+        while depth < len(prefix) and node.children is not None:
+            node = node.children.get(prefix[depth])
+            if node is None:
+                return []
+            depth += 1
+        if depth == len(prefix):
+            top = node.top
+        else:
+            bucket = node.bucket
+            start = bisect_left(bucket, (prefix,))
+            end = bisect_left(bucket, (prefix + "\uffff",), start)
+            top = self._best((self._score(entry_id), entry_id) for _, entry_id in bucket[start:end])
+        return [self.entries[entry_id][2] for _, entry_id in top[:limit]]
+
+    def __len__(self):
+        return len(self.entries)
+
+# =========================
+# Catalog Suggestions
+# =========================
+
+class SuggestIndex:
+    """
+    Tries over title, cast and director names, built from `files` at startup
+    and kept current by following the change feed. Titles rank by rating,
+    people by how many titles they appear in.
+    """
+    def __init__(self):
+        self.titles = PrefixTrie()
+        self.cast = PrefixTrie()
+        self.directors = PrefixTrie()
+        self._people = {"cast": {}, "directors": {}}  # field -> name -> set of title keys
+        self._title_people = {}                       # title key -> {"cast": names, "directors": names}
+        self.since = None
+        self.ready = False
+
+    def _set_person(self, field, name, rebuild_tops):
+        if not rebuild_tops:
+            return  # Bulk load: load() adds every person once at the end
+        trie = self.cast if field == "cast" else self.directors
+        titles = self._people[field].get(name)
+        if titles:
+            trie.add(name, name, len(titles), {"name": name, "titles": len(titles)}, rebuild_tops)
+        else:
+            self._people[field].pop(name, None)
+            trie.remove(name, rebuild_tops)
+
+    def upsert_title(self, doc, rebuild_tops=True):
+        key = (doc["tmdb_type"], doc["tmdb_id"])
+        release_date = doc.get("release_date") or ""
+        payload = {
+            "tmdb_type": doc["tmdb_type"], "tmdb_id": doc["tmdb_id"], "title": doc.get("title"),
+            "rating": doc.get("rating"), "year": release_date[:4], "poster_url": doc.get("poster_url"),
+        }
+        self.titles.add(key, doc.get("title") or "", doc.get("rating") or 0, payload, rebuild_tops)
+        new_people = {
+            "cast": {s.get("name") for s in doc.get("stars") or [] if s.get("name")},
+            "directors": {d.get("name") for d in doc.get("directors") or [] if d.get("name")},
+        }
+        old_people = self._title_people.get(key, {"cast": set(), "directors": set()})
+        self._title_people[key] = new_people
+        for field in ("cast", "directors"):
+            for name in old_people[field] - new_people[field]:
+                self._people[field].get(name, set()).discard(key)
+                self._set_person(field, name, rebuild_tops)
+            for name in new_people[field] - old_people[field]:
+                self._people[field].setdefault(name, set()).add(key)
+                self._set_person(field, name, rebuild_tops)
+
+    @classmethod
+    def build(cls, docs):
+        """A new index over title documents, ranked once at the end instead of per insert."""
+        index = cls()
+        for doc in docs:
+            index.upsert_title(doc, rebuild_tops=False)
+        for field, trie in (("cast", index.cast), ("directors", index.directors)):
+            for name, titles in index._people[field].items():
+                trie.add(name, name, len(titles), {"name": name, "titles": len(titles)}, rebuild_tops=False)
+        for trie in (index.titles, index.cast, index.directors):
+            trie.rebuild()
+        return index
+
+    def delete_title(self, tmdb_type, tmdb_id):
+        key = (tmdb_type, tmdb_id)
+        self.titles.remove(key)
+        old_people = self._title_people.pop(key, None)
+        if not old_people:
+            return
+        for field in ("cast", "directors"):
+            for name in old_people[field]:
+                self._people[field].get(name, set()).discard(key)
+                self._set_person(field, name, True)
+
+    def search(self, prefix, limit=TOP_K):
+        return {
+            "titles": self.titles.search(prefix, limit),
+            "cast": self.cast.search(prefix, limit),
+            "directors": self.directors.search(prefix, limit),
+        }
+
+    async def load(self):
+        """Build the tries from every title. The change feed position is taken first, so nothing is missed."""
+        since = await head_seq()
+        docs = await files_col.find({}, SUGGEST_FIELDS).to_list(length=None)
+        # Built in a thread so the API keeps answering meanwhile
+        fresh = await asyncio.to_thread(SuggestIndex.build, docs)
+        self.__dict__.update(fresh.__dict__)
+        self.since, self.ready = since, True
+        logger.info(f"Suggest index built: {len(self.titles)} titles, {len(self.cast)} cast, {len(self.directors)} directors")
+
+    async def sync(self):
+        """Apply title changes logged since the last load or sync."""
+        while True:
+            changes, next_seq, has_more = await read_changes(self.since)
+            upserts = [c for c in changes if c["kind"] == "title" and c["op"] == "upsert"]
+            docs = {}
+            if upserts:
+                query = {"$or": [{"tmdb_type": c["tmdb_type"], "tmdb_id": c["tmdb_id"]} for c in upserts]}
+                async for doc in files_col.find(query, SUGGEST_FIELDS):
+                    docs[(doc["tmdb_type"], doc["tmdb_id"])] = doc
+            for change in changes:
+                if change["kind"] != "title":
+                    continue
+                doc = docs.get((change["tmdb_type"], change["tmdb_id"]))
+                if change["op"] == "upsert" and doc:
+                    self.upsert_title(doc)
+                else:
+                    self.delete_title(change["tmdb_type"], change["tmdb_id"])
+            self.since = next_seq
+            if not has_more:
+                return
+
+    async def run(self):
+        """Build once, then follow the change feed. Runs as a background task of the API."""
+        while True:
+            try:
+                if self.since is None:
+                    await self.load()
+                else:
+                    await self.sync()
+            except ChangesExpired:
+                # Keeps serving the old tries until the rebuild swaps in
+                logger.warning("Suggest index fell behind the change log; rebuilding")
+                self.since = None
+                continue
+            except Exception as e:
+                logger.error(f"Suggest index sync failed: {e}")
+            await asyncio.sleep(SUGGEST_SYNC_SECONDS)
+
+suggest_index = SuggestIndex()
@@ -1,11 +1,142 @@
 import re
+import time
+import random
 import aiohttp
 import asyncio
-from config import TMDB_API_KEY, logger
+from email.utils import parsedate_to_datetime
+from config import TMDB_API_KEY, TMDB_API_URL, TMDB_RATE_LIMIT, logger
+from metrics import (
+    TMDB_REQUEST_SECONDS, TMDB_ERRORS, TMDB_THROTTLE_SECONDS, TMDB_RETRIES, TMDB_DEDUPLICATED
+)
+
+TMDB_MAX_CONNECTIONS = 20
+TMDB_TIMEOUT_SECONDS = 15
+TMDB_MAX_RETRIES = 4            # Retries per request on 429, 5xx and network errors
+TMDB_RETRY_BASE = 1             # Seconds before the first retry without Retry-After; doubles each time
+TMDB_RETRY_MAX = 60             # Cap on any single retry delay, including Retry-After
+
+_session = None
+_inflight = {}  # url -> Future, so identical concurrent requests go out once
+
+class TmdbUnavailable(Exception):
+    """TMDB kept failing (429, 5xx, network) after retries; the caller should try again later."""
+
+class TokenBucket:
+    """
+    Client-side rate limit: `rate` requests per second with bursts up to
+    `burst`. Callers reserve a token and sleep off any debt, so waiting
+    requests are served in arrival order without a lock.
+    """
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        """Wait for a token. Returns the seconds waited."""
+        now = time.monotonic()
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        self.tokens -= 1
+        wait = (self.updated - now) + max(0.0, -self.tokens) / self.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return max(wait, 0.0)
+
+    def block_for(self, seconds):
+        """Hold every request for `seconds` (TMDB answered 429), then resume at `rate`."""
+        until = time.monotonic() + seconds
+        if until > self.updated:
+            self.tokens = min(self.tokens, 0)
+            self.updated = until
+
+tmdb_limiter = TokenBucket(TMDB_RATE_LIMIT)
+
+def get_session():
+    """Shared TMDB HTTP session, created on first use so connections are reused across calls."""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=TMDB_MAX_CONNECTIONS),
+            timeout=aiohttp.ClientTimeout(total=TMDB_TIMEOUT_SECONDS)
+        )
+    return _session
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
 
 POSTER_BASE_URL = 'https://image.tmdb.org/t/p/original'
 PROFILE_BASE_URL = 'https://image.tmdb.org/t/p/w500'
 
+def retry_delay(retry_after, attempt):
+    """Seconds to wait before a retry: the server's Retry-After if given, else jittered backoff."""
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(retry_after).timestamp() - time.time()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0.0), TMDB_RETRY_MAX)
+    return min(TMDB_RETRY_BASE * 2 ** attempt, TMDB_RETRY_MAX) * random.uniform(0.8, 1.2)
+
+async def fetch_json(session, url, endpoint):
+    """
+    GET a TMDB url and decode its JSON body. Requests pass the shared rate
+    limiter, identical concurrent requests share one response, and 429, 5xx
+    and network errors are retried. Raises TmdbUnavailable when retries run out.
+    """
+    flight = _inflight.get(url)
+    if flight is not None:
+        TMDB_DEDUPLICATED.labels(endpoint).inc()
+    else:
+        flight = _inflight[url] = asyncio.ensure_future(_fetch_with_retries(session, url, endpoint))
+        flight.add_done_callback(lambda _: _inflight.pop(url, None))
+    return await asyncio.shield(flight)
+
+async def _fetch_with_retries(session, url, endpoint):
+    error = None
+    for attempt in range(TMDB_MAX_RETRIES + 1):
+        TMDB_THROTTLE_SECONDS.observe(await tmdb_limiter.acquire())
+        start = time.perf_counter()
+        delay = None
+        try:
+            async with session.get(url) as resp:
+                if resp.status == 429 or resp.status >= 500:
+                    TMDB_ERRORS.labels(endpoint).inc()
+                    reason = "429" if resp.status == 429 else "5xx"
+                    delay = retry_delay(resp.headers.get("Retry-After"), attempt)
+                    error = f"HTTP {resp.status}"
+                    if resp.status == 429:
+                        # Everyone waits, not just this request
+                        tmdb_limiter.block_for(delay)
+                        delay = 0
+                else:
+                    if resp.status != 200:
+                        TMDB_ERRORS.labels(endpoint).inc()
+                    return resp.status, await resp.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            TMDB_ERRORS.labels(endpoint).inc()
+            reason = "network"
+            delay = retry_delay(None, attempt)
+            error = repr(e)
+        finally:
+            TMDB_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+        if attempt == TMDB_MAX_RETRIES:
+            break
+        TMDB_RETRIES.labels(endpoint, reason).inc()
+        logger.warning(f"TMDB {endpoint} failed ({error}), retry {attempt + 1}/{TMDB_MAX_RETRIES}")
+        if delay:
+            await asyncio.sleep(delay)
+    raise TmdbUnavailable(f"TMDB {endpoint} failed after {TMDB_MAX_RETRIES + 1} attempts: {error}")
+
 def profile_url(path):
     return f"{PROFILE_BASE_URL}{path}" if path else None
 
@@ -91,93 +222,93 @@ def get_backdrop_url(movie_images):
     return None
 
 async def get_trailer_url(session, tmdb_type, tmdb_id):
-    video_url = f'https://api.themoviedb.org/3/{tmdb_type}/{tmdb_id}/videos?api_key={TMDB_API_KEY}'
-    async with session.get(video_url) as video_response:
-        if video_response.status == 200:
-            data = await video_response.json()
-            results = data.get('results', [])
-            if results:
-                for video in results:
-                    if video.get('site') == 'YouTube' and video.get('type') == 'Trailer':
-                        return f"https://www.youtube.com/watch?v={video.get('key')}"
+    video_url = f'{TMDB_API_URL}/{tmdb_type}/{tmdb_id}/videos?api_key={TMDB_API_KEY}'
+    status, data = await fetch_json(session, video_url, "videos")
+    if status == 200:
+        results = data.get('results', [])
+        if results:
+            for video in results:
+                if video.get('site') == 'YouTube' and video.get('type') == 'Trailer':
+                    return f"https://www.youtube.com/watch?v={video.get('key')}"
     return None
 
 async def get_by_id(tmdb_type, tmdb_id):
-    api_url = f"https://api.themoviedb.org/3/{tmdb_type}/{tmdb_id}?api_key={TMDB_API_KEY}&language=en-US"
-    images_url = f'https://api.themoviedb.org/3/{tmdb_type}/{tmdb_id}/images?api_key={TMDB_API_KEY}&language=en-US&include_image_language=en,hi'
-    credits_url = f"https://api.themoviedb.org/3/{tmdb_type}/{tmdb_id}/credits?api_key={TMDB_API_KEY}&language=en-US"
+    api_url = f"{TMDB_API_URL}/{tmdb_type}/{tmdb_id}?api_key={TMDB_API_KEY}&language=en-US"
+    images_url = f'{TMDB_API_URL}/{tmdb_type}/{tmdb_id}/images?api_key={TMDB_API_KEY}&language=en-US&include_image_language=en,hi'
+    credits_url = f"{TMDB_API_URL}/{tmdb_type}/{tmdb_id}/credits?api_key={TMDB_API_KEY}&language=en-US"
     try:
-        async with aiohttp.ClientSession() as session:
-            detail_resp, images_resp, credits_resp = await asyncio.gather(
-                session.get(api_url), session.get(images_url), session.get(credits_url)
-            )
-            data = await detail_resp.json()
-            movie_images = await images_resp.json()
-            credits = await credits_resp.json()
+        session = get_session()
+        (_, data), (_, movie_images), (_, credits) = await asyncio.gather(
+            fetch_json(session, api_url, "details"),
+            fetch_json(session, images_url, "images"),
+            fetch_json(session, credits_url, "credits")
+        )
 
-            poster_url = get_poster_url(data)
-            backdrop_url = get_backdrop_url(movie_images)
-            trailer_url = await get_trailer_url(session, tmdb_type, tmdb_id)
+        poster_url = get_poster_url(data)
+        backdrop_url = get_backdrop_url(movie_images)
+        trailer_url = await get_trailer_url(session, tmdb_type, tmdb_id)
 
-            directors_list = extract_directors(tmdb_type, data, credits)
-            stars_list = extract_stars(credits)
+        directors_list = extract_directors(tmdb_type, data, credits)
+        stars_list = extract_stars(credits)
 
-            try:
-                directors_str = ", ".join([d["name"] for d in directors_list]) if directors_list else "Unknown"
-            except Exception as e:
-                logger.error(f"Error joining directors_list: {directors_list}, error: {e}")
-                directors_str = "Unknown"
+        try:
+            directors_str = ", ".join([d["name"] for d in directors_list]) if directors_list else "Unknown"
+        except Exception as e:
+            logger.error(f"Error joining directors_list: {directors_list}, error: {e}")
+            directors_str = "Unknown"
 
-            try:
-                stars_str = ", ".join([s["name"] for s in stars_list]) if stars_list else "Unknown"
-            except Exception as e:
-                logger.error(f"Error joining stars_list: {stars_list}, error: {e}")
-                stars_str = "Unknown"
+        try:
+            stars_str = ", ".join([s["name"] for s in stars_list]) if stars_list else "Unknown"
+        except Exception as e:
+            logger.error(f"Error joining stars_list: {stars_list}, error: {e}")
+            stars_str = "Unknown"
 
-            language = extract_language(data)
-            genres = extract_genres(data)
-            release_date = extract_release_date(data)
+        language = extract_language(data)
+        genres = extract_genres(data)
+        release_date = extract_release_date(data)
 
-            try:
-                message = await format_tmdb_info(directors_str, stars_str, data)
-            except IndexError as e:
-                logger.error(f"IndexError in format_tmdb_info: {e}, data: {data}")
-                message = "Error formatting TMDB info."
-            except Exception as e:
-                logger.error(f"Error in format_tmdb_info: {e}, data: {data}")
-                message = "Error formatting TMDB info."
-
-            mongo_dict = {
-                "tmdb_id": tmdb_id,
-                "tmdb_type": tmdb_type,
-                "title": data.get('title') or data.get('name'),
-                "rating": round(float(data.get('vote_average', 0)), 1),
-                "language": language,
-                "genre": genres,
-                "release_date": release_date,
-                "story": data.get('overview'),
-                "directors": directors_list,
-                "stars": stars_list,
-                "trailer_url": trailer_url,
-                "poster_url": poster_url
-            }
-
-            return {
-                "message": message,
-                "poster_url": poster_url,
-                "backdrop_url": backdrop_url,
-                "trailer_url": trailer_url,
-                "mongo_dict": mongo_dict
-            }
+        try:
+            message = await format_tmdb_info(directors_str, stars_str, data)
+        except IndexError as e:
+            logger.error(f"IndexError in format_tmdb_info: {e}, data: {data}")
+            message = "Error formatting TMDB info."
+        except Exception as e:
+            logger.error(f"Error in format_tmdb_info: {e}, data: {data}")
+            message = "Error formatting TMDB info."
+
+        mongo_dict = {
+            "tmdb_id": tmdb_id,
+            "tmdb_type": tmdb_type,
+            "title": data.get('title') or data.get('name'),
+            "rating": round(float(data.get('vote_average', 0)), 1),
+            "language": language,
+            "genre": genres,
+            "release_date": release_date,
+            "story": data.get('overview'),
+            "directors": directors_list,
+            "stars": stars_list,
+            "trailer_url": trailer_url,
+            "poster_url": poster_url
+        }
 
+        return {
+            "message": message,
+            "poster_url": poster_url,
+            "backdrop_url": backdrop_url,
+            "trailer_url": trailer_url,
+            "mongo_dict": mongo_dict
+        }
+
+    except TmdbUnavailable:
+        raise  # Transient; ingest jobs retry it later
     except aiohttp.ClientError as e:
-        logger.error(f"Error fetching TMDB data: {e}")
+        logger.error(f"Error fetching TMDB data: {e}", extra={"tmdb_id": tmdb_id, "tmdb_type": tmdb_type})
         return {"message": f"Error: {str(e)}", "poster_url": None}
     except IndexError as e:
-        logger.error(f"IndexError (list out of range) in get_by_id: {e}")
+        logger.error(f"IndexError (list out of range) in get_by_id: {e}", extra={"tmdb_id": tmdb_id, "tmdb_type": tmdb_type})
         return {"message": f"IndexError: {str(e)}", "poster_url": None}
     except Exception as e:
-        logger.error(f"Unknown error in get_by_id: {e}")
+        logger.error(f"Unknown error in get_by_id: {e}", extra={"tmdb_id": tmdb_id, "tmdb_type": tmdb_type})
         return {"message": f"Error: {str(e)}", "poster_url": None}
     return {"message": "Unknown error occurred.", "poster_url": None}
 
@@ -236,51 +367,53 @@ def format_duration(duration):
         return str(duration) if duration else ""
 
 async def get_movie_by_name(movie_name, release_year=None):
-    tmdb_search_url = f'https://api.themoviedb.org/3/search/movie?api_key={TMDB_API_KEY}&query={movie_name}'
+    tmdb_search_url = f'{TMDB_API_URL}/search/movie?api_key={TMDB_API_KEY}&query={movie_name}'
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(tmdb_search_url) as search_response:
-                search_data = await search_response.json()
-                if search_data.get('results'):
-                    results = search_data['results']
-                    if release_year:
-                        # Filter by release year if provided
-                        results = [
-                            result for result in results
-                            if 'release_date' in result and result['release_date'] and result['release_date'][:4] == str(release_year)
-                        ]
-                    if results:
-                        result = results[0]
-                        return {
-                            "id": result['id'],
-                            "media_type": "movie"
-                        }
+        session = get_session()
+        _, search_data = await fetch_json(session, tmdb_search_url, "search_movie")
+        if search_data.get('results'):
+            results = search_data['results']
+            if release_year:
+                # Filter by release year if provided
+                results = [
+                    result for result in results
+                    if 'release_date' in result and result['release_date'] and result['release_date'][:4] == str(release_year)
+                ]
+            if results:
+                result = results[0]
+                return {
+                    "id": result['id'],
+                    "media_type": "movie"
+                }
         return None
+    except TmdbUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error fetching TMDb movie by name: {e}")
         return
 
 async def get_tv_by_name(tv_name, first_air_year=None):
-    tmdb_search_url = f'https://api.themoviedb.org/3/search/tv?api_key={TMDB_API_KEY}&query={tv_name}'
+    tmdb_search_url = f'{TMDB_API_URL}/search/tv?api_key={TMDB_API_KEY}&query={tv_name}'
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(tmdb_search_url) as search_response:
-                search_data = await search_response.json()
-                if search_data.get('results'):
-                    results = search_data['results']
-                    if first_air_year:
-                        # Filter by first air year if provided
-                        results = [
-                            result for result in results
-                            if 'first_air_date' in result and result['first_air_date'] and result['first_air_date'][:4] == str(first_air_year)
-                        ]
-                    if results:
-                        result = results[0]
-                        return {
-                            "id": result['id'],
-                            "media_type": "tv"
-                        }
+        session = get_session()
+        _, search_data = await fetch_json(session, tmdb_search_url, "search_tv")
+        if search_data.get('results'):
+            results = search_data['results']
+            if first_air_year:
+                # Filter by first air year if provided
+                results = [
+                    result for result in results
+                    if 'first_air_date' in result and result['first_air_date'] and result['first_air_date'][:4] == str(first_air_year)
+                ]
+            if results:
+                result = results[0]
+                return {
+                    "id": result['id'],
+                    "media_type": "tv"
+                }
         return None
+    except TmdbUnavailable:
+        raise
     except Exception as e:
         logger.error(f"Error fetching TMDb TV by name: {e}")
         return
@@ -1,9 +1,11 @@
 import re
-import PTN
 import base64
 import asyncio
 import uuid
-import requests
+import time
+import aiohttp
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from datetime import datetime, timezone, timedelta
 from pyrogram.errors import FloodWait
 from pyrogram import enums
@@ -15,11 +17,29 @@ from db import (
     tokens_col,
     auth_users_col,
     files_col,
+    tmdb_files_col,
 )
 from config import (SHORTERNER_URL, URLSHORTX_API_TOKEN, 
                     UPDATE_CHANNEL_ID, EXCLUDE_CHANNEL_ID,
-                    LOG_CHANNEL_ID)
+                    LOG_CHANNEL_ID, BOT_USERNAME, BOT_ID)
 from tmdb import get_movie_by_name, get_tv_by_name, get_by_id
+from release_parser import (
+    RELEASE_FIELDS, strip_extension, cut_after_extension, parse_filename, parse_batch, is_current,
+    release_fields, title_filter_values
+)
+from facets import FACET_PROJECTION, apply_facet_delta, facet_values, title_lock
+from changes import change_log, title_change, file_change
+from cache import CATALOG_CACHES, invalidate_caches
+from jobs import (
+    PermanentIngestError, JOB_POLL_INTERVAL, LANE_LIVE, LANE_BACKFILL, jobs_available,
+    enqueue_jobs, claim_job, complete_job, fail_job, release_leases, queue_depth,
+    claim_file_name, release_file_name
+)
+from delivery import message_media
+from metrics import (
+    INGEST_QUEUE_DEPTH, INGEST_IN_FLIGHT, INGEST_FILES, INGEST_SECONDS,
+    FLOODWAIT_TOTAL, FLOODWAIT_SLEEP_SECONDS
+)
 
 
 
@@ -30,6 +50,10 @@ from tmdb import get_movie_by_name, get_tv_by_name, get_by_id
 
 TOKEN_VALIDITY_SECONDS = 24 * 60 * 60  # 24 hours
 AUTO_DELETE_SECONDS = 5 * 60
+API_CALL_DELAY = 3              # Seconds to wait before every bot API call
+INGEST_CONCURRENCY = 8          # Files processed concurrently by the queue worker
+BULK_FLUSH_SIZE = 100           # Max upserts coalesced into one bulk_write
+BULK_FLUSH_INTERVAL = 0.05      # Max seconds an upsert waits before a flush
 channel_files_cache = {}
 all_tmdb_files_cache = {}
 
@@ -45,12 +69,11 @@ def generate_telegram_link(bot_username, channel_id, message_id):
     return f"https://telegram.dog/{bot_username}?start=file_{b64}"
 
 
-async def file_handler(message):
+async def file_handler(message, lane=LANE_LIVE):
     allowed_channels = await get_allowed_channels()
     if message.chat.id not in allowed_channels:
         return
-    await queue_file_for_processing(message, reply_func=message.reply_text)
-    await file_queue.join()
+    await queue_file_for_processing(message, reply_func=message.reply_text, lane=lane)
 
 
 async def get_allowed_channels():
@@ -132,11 +155,14 @@ def get_token_link(token_id, bot_username):
 # Link & URL Utilities
 # =========================
 
+def make_link_key(channel_id, message_id):
+    """The unpadded base64 key carried by a file deep link (start=file_<key>)."""
+    raw = f"{channel_id}_{message_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
 def generate_telegram_link(bot_username, channel_id, message_id):
     """Generate a base64-encoded Telegram deep link for a file."""
-    raw = f"{channel_id}_{message_id}".encode()
-    b64 = base64.urlsafe_b64encode(raw).decode().rstrip("=")
-    return f"https://telegram.dog/{bot_username}?start=file_{b64}"
+    return f"https://telegram.dog/{bot_username}?start=file_{make_link_key(channel_id, message_id)}"
 
 def generate_c_link(channel_id, message_id):
     # channel_id must be like -1001234567890
@@ -151,17 +177,26 @@ def extract_channel_and_msg_id(link):
         return channel_id, msg_id
     raise ValueError("Invalid Telegram message link format. Only /c/ links are supported.")
 
-def shorten_url(long_url):
+_shortener_session = None
+
+def get_shortener_session():
+    """Shortener HTTP session, created the first time a link is shortened."""
+    global _shortener_session
+    if _shortener_session is None or _shortener_session.closed:
+        _shortener_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5))
+    return _shortener_session
+
+async def shorten_url(long_url):
     """Shorten a URL using the configured shortener."""
     try:
-        resp = requests.get(
-            f"https://{SHORTERNER_URL}/api?api={URLSHORTX_API_TOKEN}&url={long_url}",
-            timeout=5
-        )
-        if resp.status_code == 200:
-            data = resp.json()
-            if data.get("status") == "success" and data.get("shortenedUrl"):
-                return data["shortenedUrl"]
+        async with get_shortener_session().get(
+            f"https://{SHORTERNER_URL}/api",
+            params={"api": URLSHORTX_API_TOKEN, "url": long_url}
+        ) as resp:
+            if resp.status == 200:
+                data = await resp.json(content_type=None)
+                if data.get("status") == "success" and data.get("shortenedUrl"):
+                    return data["shortenedUrl"]
         return long_url
     except Exception:
         return long_url
@@ -209,6 +244,15 @@ async def extract_file_info(message, channel_id=None):
     # Remove extension from file_name if present
     if file_info["file_name"]:
         file_info["file_name"] = await remove_extension(file_info["file_name"])
+    # Stored once here so the API never has to rebuild it per request
+    file_info["telegram_link"] = generate_telegram_link(BOT_USERNAME, file_info["channel_id"], file_info["message_id"])
+    # Lets /start send the file by file_id, without reading the channel
+    media = message_media(message)
+    if media:
+        file_info["link_key"] = make_link_key(file_info["channel_id"], file_info["message_id"])
+        file_info["file_unique_id"] = media.file_unique_id
+        file_info["file_ids"] = {BOT_ID: media.file_id}  # file_ids are per bot; helpers add theirs on first send
+        file_info["caption"] = getattr(message.caption, "html", message.caption)
     return file_info
 
 async def human_readable_size(size):
@@ -225,16 +269,13 @@ async def invalidate_channel_cache(channel_id):
 
 
 async def remove_unwanted(input_string):
-    # Use regex to match .mkv or .mp4 and everything that follows
-    result = re.split(r'(\.mkv|\.mp4)', input_string)
-    # Join the first two parts to get the string up to the extension
-    return ''.join(result[:2])
+    # Keep the string up to the .mkv/.mp4 extension and drop everything that follows
+    return cut_after_extension(input_string)
 
 async def remove_extension(caption):
     try:
         # Remove .mkv and .mp4 extensions if present
-        cleaned_caption = re.sub(r'\.mkv|\.mp4|\.webm', '', caption)
-        return cleaned_caption
+        return strip_extension(caption)
     except Exception as e:
         logger.error(e)
         return None
@@ -247,10 +288,12 @@ async def safe_api_call(coro):
     """Utility wrapper to add delay before every bot API call."""
     while True:
         try:
-            await asyncio.sleep(3)
+            await asyncio.sleep(API_CALL_DELAY)
             return await coro
         except FloodWait as e:
-            print(f"FloodWait: Sleeping for {e.value} seconds")
+            logger.warning(f"FloodWait: Sleeping for {e.value} seconds", extra={"latency": float(e.value)})
+            FLOODWAIT_TOTAL.inc()
+            FLOODWAIT_SLEEP_SECONDS.inc(e.value)
             await asyncio.sleep(e.value)
         except Exception:
             raise
@@ -278,154 +321,393 @@ async def extract_tmdb_link(tmdb_url):
         tmdb_id = int(re.search(collection_pattern, tmdb_url).group(1)) 
     return tmdb_type, tmdb_id
 
-def remove_redandent(filename):
-    """
-    Remove common username patterns from a filename while preserving the content title.
-
-    Args:
-        filename (str): The input filename
+# =========================
+# Write Coalescing
+# =========================
 
-    Returns:
-        str: Filename with usernames removed
+class UpsertBatcher:
     """
-    filename = filename.replace("\n", "\\n")
-
-    patterns = [
-        r"^@[\w\.-]+?(?=_)",
-        r"_@[A-Za-z]+_|@[A-Za-z]+_|[\[\]\s@]*@[^.\s\[\]]+[\]\[\s@]*",  
-        r"^[\w\.-]+?(?=_Uploads_)",  
-        r"^(?:by|from)[\s_-]+[\w\.-]+?(?=_)",  
-        r"^\[[\w\.-]+?\][\s_-]*",  
-        r"^\([\w\.-]+?\)[\s_-]*",  
-    ]
-
-    result = filename
-    for pattern in patterns:
-        match = re.search(pattern, result)
-        if match:
-            result = re.sub(pattern, " ", result)
-            break  
-
-    
-    result = re.sub(r"^[_\s-]+|[_\s-]+$", " ", result)
+    Buffers upserts against one collection and flushes them with a single
+    unordered bulk_write, either every `max_items` upserts or after `max_delay`
+    seconds. Upserts that target the same filter within a batch are merged into
+    one operation so concurrent files of the same title cannot race each other
+    into duplicate documents.
+    """
+    def __init__(self, collection, max_items=BULK_FLUSH_SIZE, max_delay=BULK_FLUSH_INTERVAL):
+        self.collection = collection
+        self.max_items = max_items
+        self.max_delay = max_delay
+        self._pending = {}  # filter key -> [filter, update, [futures]]
+        self._count = 0
+        self._timer = None
+
+    @staticmethod
+    def _filter_key(flt):
+        return tuple(sorted((k, str(v)) for k, v in flt.items()))
+
+    @staticmethod
+    def _merge(update, new):
+        for op, fields in new.items():
+            target = update.setdefault(op, {})
+            for field, value in fields.items():
+                if op == "$addToSet":
+                    values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                    existing = target.get(field)
+                    if existing is None:
+                        target[field] = {"$each": list(values)}
+                    else:
+                        current = existing["$each"] if isinstance(existing, dict) and "$each" in existing else [existing]
+                        target[field] = {"$each": current + list(values)}
+                elif op == "$setOnInsert":
+                    target.setdefault(field, value)
+                else:
+                    target[field] = value
+
+    async def upsert(self, flt, update):
+        """
+        Queue an upsert and wait for its batch to be written.
+        Returns True if the document was inserted, False if it already existed.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        key = self._filter_key(flt)
+        entry = self._pending.get(key)
+        if entry:
+            self._merge(entry[1], update)
+            entry[2].append(future)
+        else:
+            self._pending[key] = [flt, {op: dict(fields) for op, fields in update.items()}, [future]]
+        self._count += 1
+
+        if self._count >= self.max_items:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, lambda: asyncio.ensure_future(self.flush()))
+        return await future
+
+    async def flush(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch = list(self._pending.values())
+        self._pending = {}
+        self._count = 0
+
+        requests_ = [UpdateOne(flt, update, upsert=True) for flt, update, _ in batch]
+        upserted, failed = set(), {}
+        try:
+            result = await self.collection.bulk_write(requests_, ordered=False)
+            upserted = set(result.upserted_ids)
+        except BulkWriteError as e:
+            upserted = {u["index"] for u in e.details.get("upserted", [])}
+            failed = {err["index"]: err.get("errmsg") for err in e.details.get("writeErrors", [])}
+        except Exception as e:
+            for _, _, futures in batch:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        for index, (_, _, futures) in enumerate(batch):
+            for position, future in enumerate(futures):
+                if future.done():
+                    continue
+                if index in failed:
+                    future.set_exception(RuntimeError(failed[index]))
+                else:
+                    # Only the first waiter of a merged upsert sees the insert
+                    future.set_result(index in upserted and position == 0)
 
-    return result
 # =========================
 # Queue System for File Processing
 # =========================
 
-file_queue = asyncio.Queue()
+tmdb_upserts = UpsertBatcher(files_col)
+file_upserts = UpsertBatcher(tmdb_files_col)
+
+async def process_queued_file(bot, file_info, notify=False, tmdb=None):
+    """
+    Resolve one queued file against TMDB and store it. `tmdb` ({"tmdb_type",
+    "tmdb_id"}, from /tmdb) stores the file under that title without a search.
+    Returns the outcome: indexed, duplicate or skipped. Raises PermanentIngestError
+    for files that can never resolve; any other exception is retried by the queue.
+    """
+    if tmdb:
+        await upsert_file_with_tmdb_info(file_info, tmdb["tmdb_type"], tmdb["tmdb_id"], bot, tmdb.get("moved_from"))
+        return "indexed"
+
+    async def duplicate():
+        if notify:
+            telegram_link = generate_c_link(file_info["channel_id"], file_info["message_id"])
+            await safe_api_call(
+                bot.send_message(
+                    LOG_CHANNEL_ID,
+                    f"⚠️ Duplicate File (by name).\nLink: {telegram_link}",
+                    parse_mode=enums.ParseMode.HTML
+                )
+            )
+        return "duplicate"
+
+    # Check for duplicate by file name among indexed files. The job's own record is
+    # not one: a retry after the write must still get its change logged
+    existing = await tmdb_files_col.find_one(
+        {
+            "file_name": file_info["file_name"],
+            "$nor": [{"channel_id": file_info["channel_id"], "message_id": file_info["message_id"]}],
+        },
+        {"_id": 1}
+    )
+    if existing:
+        return await duplicate()
+    if str(file_info["channel_id"]) in EXCLUDE_CHANNEL_ID:
+        return "skipped"
+    # ...and among files other jobs are indexing right now
+    if not await claim_file_name(file_info):
+        return await duplicate()
+
+    try:
+        # /index parses in bulk ahead of time; live posts are parsed here
+        parsed = file_info.get("parsed")
+        if not is_current(parsed):
+            parsed = file_info["parsed"] = parse_filename(file_info["file_name"])
+        title, year, season = parsed["title"], parsed["year"], parsed["season"]
+        if season is None:
+            result = await get_movie_by_name(title, year)
+        else:
+            result = await get_tv_by_name(title, year)
+        if not result:
+            raise PermanentIngestError(f"No TMDB match for {title} ({year})")
+        await upsert_file_with_tmdb_info(file_info, result['media_type'], result['id'], bot)
+    except Exception:
+        # Let another message with this name be indexed; a retry claims it again
+        await release_file_name(file_info["file_name"], file_info)
+        raise
+    return "indexed"
 
 async def file_queue_worker(bot):
+    """
+    Claim jobs from the durable ingest queue (jobs.py), processing up to
+    INGEST_CONCURRENCY at once so their TMDB upserts can be coalesced into
+    shared bulk writes. Failures are retried with backoff, then dead-lettered.
+    """
+    semaphore = asyncio.Semaphore(INGEST_CONCURRENCY)
+    in_flight = set()
     processing_count = 0  # Track how many files processed in this batch
-    while True:
-        item = await file_queue.get()
-        file_info, reply_func = item
-        processing_count += 1
+
+    async def run(job):
+        nonlocal processing_count
+        file_info = job["file_info"]
+        start = time.perf_counter()
+        status = "error"
+        INGEST_IN_FLIGHT.inc()
         try:
-            # Check for duplicate by file name in any TMDB document
-            existing = await files_col.find_one({
-                "files": {
-                    "$elemMatch": {
-                        "file_name": file_info["file_name"]
-                    }
-                }
-            })
-            if existing:
-                telegram_link = generate_c_link(file_info["channel_id"], file_info["message_id"])
-                if reply_func:
-                    await safe_api_call(
-                        bot.send_message(
-                            LOG_CHANNEL_ID,
-                            f"⚠️ Duplicate File (by name).\nLink: {telegram_link}",
-                            parse_mode=enums.ParseMode.HTML
-                        )
+            status = await process_queued_file(bot, file_info, job.get("notify", False), job.get("tmdb"))
+            await complete_job(job)
+        except Exception as e:
+            status = "retry"
+            try:
+                if await fail_job(job, e, permanent=isinstance(e, PermanentIngestError)):
+                    status = "dead_letter"
+                    logger.error(
+                        f"Ingest job dead-lettered: {e}",
+                        extra={"channel_id": file_info["channel_id"], "message_id": file_info["message_id"]}
                     )
-            else:
-                try:
-                    if str(file_info["channel_id"]) not in EXCLUDE_CHANNEL_ID:
-                        title = remove_redandent(file_info["file_name"])
-                        parsed_data = PTN.parse(title)
-                        title = parsed_data.get("title").replace("_", " ").replace("-", " ").replace(":", " ")
-                        title = ' '.join(title.split())
-                        year = parsed_data.get("year")
-                        season = parsed_data.get("season")
-                        episode = parsed_data.get("episode")
-                        if season is None:
-                            result = await get_movie_by_name(title, year)
-                        else:
-                            result = await get_tv_by_name(title, year)
-                        tmdb_id, tmdb_type = result['id'], result['media_type'] 
-                        await upsert_file_with_tmdb_info(file_info, tmdb_type, tmdb_id, bot)
-                except Exception as e:
-                    logger.error(f"Error processing TMDB info:{e}")
-                    if reply_func:
+                    if job.get("notify"):
                         await safe_api_call(
                             bot.send_message(
                                 LOG_CHANNEL_ID,
-                                f'❌ Error processing TMDB info: {file_info["file_name"]}\n{title} - {year}\n\n{e}',
+                                f'❌ Could not index: {file_info["file_name"]}\n\n{e}\n\nSee /deadletters',
                                 parse_mode=enums.ParseMode.HTML
                             )
                         )
-        except Exception as e:
-            if reply_func:
-                await safe_api_call(reply_func(f"❌ Error saving file: {e}"))
+            except Exception as fail_error:
+                # The lease runs out and the job is retried anyway
+                logger.error(f"Failed to record ingest failure for {job['key']}: {fail_error}")
         finally:
-            file_queue.task_done()
-            if file_queue.empty():
-                if processing_count > 1:
-                    # Notify only if more than one file was processed
-                    try:
-                        await safe_api_call(
-                            bot.send_message(
-                                LOG_CHANNEL_ID,
-                                f"✅ Done processing {processing_count} file(s) in the queue.",
-                                parse_mode=enums.ParseMode.HTML
-                            )
-                        )
-                    except Exception:
-                        pass
-            processing_count = 0  # Reset for next batch
+            INGEST_IN_FLIGHT.dec()
+            INGEST_FILES.labels(status).inc()
+            INGEST_SECONDS.observe(time.perf_counter() - start)
+            in_flight.discard(asyncio.current_task())
+            semaphore.release()
+            processing_count += 1
+            if not in_flight:
+                jobs_available.set()  # Wake the claim loop so an idle queue finishes the batch
+
+    async def finish_batch():
+        nonlocal processing_count
+        await asyncio.gather(tmdb_upserts.flush(), file_upserts.flush())
+        # Let the API (possibly another process) serve the new files right away
+        await asyncio.to_thread(invalidate_caches, *CATALOG_CACHES)
+        INGEST_QUEUE_DEPTH.set(await queue_depth())
+        if processing_count > 1:
+            # Notify only if more than one file was processed
+            try:
+                await safe_api_call(
+                    bot.send_message(
+                        LOG_CHANNEL_ID,
+                        f"✅ Done processing {processing_count} file(s) in the queue.",
+                        parse_mode=enums.ParseMode.HTML
+                    )
+                )
+            except Exception:
+                pass
+        processing_count = 0  # Reset for next batch
+
+    try:
+        await release_leases()
+    except Exception as e:
+        logger.error(f"Failed to release interrupted ingest jobs: {e}")
+
+    while True:
+        await semaphore.acquire()
+        # Cleared before claiming, so an enqueue that lands after an empty claim still wakes us
+        jobs_available.clear()
+        try:
+            job = await claim_job()
+        except Exception as e:
+            semaphore.release()
+            logger.error(f"Failed to claim ingest job: {e}")
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            continue
+        if job is None:
+            semaphore.release()
+            if processing_count and not in_flight:
+                await finish_batch()
+            try:
+                await asyncio.wait_for(jobs_available.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        task = asyncio.create_task(run(job))
+        in_flight.add(task)
 
 # =========================
 # Unified File Queueing
 # =========================
 
-async def queue_file_for_processing(message, channel_id=None, reply_func=None):
+async def queue_files_for_indexing(messages, channel_id, reply_func=None):
+    """
+    Queue a batch of channel messages for /index.
+    Messages already indexed under the same file name are skipped, so re-running
+    /index neither parses nor looks them up again; the rest are parsed up front
+    in one process-pool batch. Returns the number of files queued.
+    """
+    file_infos = []
+    for message in messages:
+        try:
+            file_info = await extract_file_info(message, channel_id=channel_id)
+        except Exception as e:
+            if reply_func:
+                await safe_api_call(reply_func(f"❌ Error queuing file: {e}"))
+            continue
+        if file_info["file_name"]:
+            file_infos.append(file_info)
+    if not file_infos:
+        return 0
+
+    indexed = set()
+    cursor = tmdb_files_col.find(
+        {
+            "channel_id": {"$in": list({f["channel_id"] for f in file_infos})},
+            "message_id": {"$in": [f["message_id"] for f in file_infos]},
+        },
+        {"_id": 0, "channel_id": 1, "message_id": 1, "file_name": 1}
+    )
+    async for doc in cursor:
+        indexed.add((doc["channel_id"], doc["message_id"], doc.get("file_name")))
+    file_infos = [
+        f for f in file_infos
+        if (f["channel_id"], f["message_id"], f["file_name"]) not in indexed
+    ]
+    if not file_infos:
+        return 0
+
+    parsed_list = await parse_batch([f["file_name"] for f in file_infos])
+    for file_info, parsed in zip(file_infos, parsed_list):
+        file_info["parsed"] = parsed
+    await enqueue_jobs(file_infos, notify=reply_func is not None, lane=LANE_BACKFILL)
+    INGEST_QUEUE_DEPTH.set(await queue_depth())
+    return len(file_infos)
+
+async def queue_file_for_processing(message, channel_id=None, reply_func=None, lane=LANE_LIVE, tmdb=None):
     try:
         file_info = await extract_file_info(message, channel_id=channel_id)
         if file_info["file_name"]:
-            await file_queue.put((file_info, reply_func))
+            await enqueue_jobs([file_info], notify=reply_func is not None, lane=lane, tmdb=tmdb)
+            INGEST_QUEUE_DEPTH.set(await queue_depth())
     except Exception as e:
         if reply_func:
             await safe_api_call(reply_func(f"❌ Error queuing file: {e}"))
 
-async def upsert_file_with_tmdb_info(file_info, tmdb_type, tmdb_id, bot):
+async def upsert_file_with_tmdb_info(file_info, tmdb_type, tmdb_id, bot, moved_from=None):
     """
-    Upserts a document by tmdb_id and tmdb_type, adding file_info to the files array.
-    This is an asynchronous version using Motor.
+    Upserts the title document by tmdb_id and tmdb_type and the file document by
+    (channel_id, message_id), linked to the title by tmdb_type and tmdb_id.
+    Both writes go through UpsertBatchers, which batch them into unordered bulk_writes.
     The 'message' field from tmdb_info is not saved to the database.
     Only sends a message if this tmdb_id and tmdb_type is not already in the database.
+    `moved_from` is the (tmdb_type, tmdb_id) the file was under when /tmdb queued the move.
     """
     result = await get_by_id(tmdb_type, tmdb_id)
-    tmdb_info = result['mongo_dict']
-    if not tmdb_info:
-        return None
+    tmdb_info = result.get('mongo_dict')
+    if not tmdb_info or not tmdb_info.get('title'):
+        # TmdbUnavailable was raised above for anything worth retrying
+        raise PermanentIngestError(f"TMDB lookup failed for {tmdb_type}/{tmdb_id}: {result.get('message', 'no title')}")
+
+    # /tmdb corrections skip the name search, so they may not be parsed yet
+    if not is_current(file_info.get("parsed")):
+        file_info["parsed"] = parse_filename(file_info["file_name"])
+    release = release_fields(file_info["parsed"])
+    title_update = {"$set": {**tmdb_info, "refreshed_at": datetime.now(timezone.utc)}}
+    filter_values = {array: {"$each": values} for array, values in title_filter_values([release]).items() if values}
+    if filter_values:
+        title_update["$addToSet"] = filter_values
+
+    title_query = {"tmdb_id": tmdb_id, "tmdb_type": tmdb_type}
+    file_query = {"channel_id": file_info["channel_id"], "message_id": file_info["message_id"]}
+    # /tmdb may move an indexed file to another title, which then loses its release values.
+    # The job carries the old title too: a retry after the file write finds the new one here
+    previous = await tmdb_files_col.find_one(file_query, {"_id": 0, "tmdb_type": 1, "tmdb_id": 1})
+    old_titles = {tuple(moved_from)} if moved_from else set()
+    if previous:
+        old_titles.add((previous.get("tmdb_type"), previous.get("tmdb_id")))
+    old_titles.discard((tmdb_type, tmdb_id))
+
+    async def write():
+        # Coalesced bulk upserts; the title result tells us whether the entry was newly created
+        return await asyncio.gather(
+            tmdb_upserts.upsert(title_query, title_update),
+            file_upserts.upsert(
+                file_query,
+                {"$set": {**file_info, **release, "tmdb_type": tmdb_type, "tmdb_id": tmdb_id}}
+            )
+        )
 
-    # Check if tmdb_id and tmdb_type already exist in the database
-    existing = await files_col.find_one({"tmdb_id": tmdb_id, "tmdb_type": tmdb_type})
+    async with title_lock(tmdb_type, tmdb_id):
+        prior = await files_col.find_one(title_query, FACET_PROJECTION)
+        updated = {**(prior or {}), **tmdb_info}
+        facets_changed = facet_values(prior) != facet_values(updated)
+        if facets_changed:
+            # Written under the lock, so other files of the title diff against the new values
+            is_new, _ = await write()
+            await apply_facet_delta(prior, updated)
+    if not facets_changed:
+        is_new, _ = await write()
+    changes = [
+        title_change("upsert", tmdb_type, tmdb_id),
+        file_change("upsert", file_info["channel_id"], file_info["message_id"], tmdb_type, tmdb_id),
+    ]
+    if old_titles:
+        await refresh_title_filters(old_titles)
+        changes.extend(title_change("upsert", *title) for title in old_titles)
+    # Awaited so a failure to log the change fails the job; its retry rewrites the
+    # same documents (the duplicate check skips the job's own record) and logs it
+    await change_log.record(changes)
 
-    await files_col.update_one(
-        {"tmdb_id": tmdb_id, "tmdb_type": tmdb_type},
-        {
-            "$set": tmdb_info,
-            "$addToSet": {"files": file_info}
-        },
-        upsert=True
-    )
-    
     # Only send message if this is a new tmdb_id/tmdb_type entry
-    if not existing and tmdb_info:
+    if is_new and tmdb_info:
         try:
             poster_url = result['backdrop_url']
             trailer = result['trailer_url']
@@ -451,8 +733,96 @@ async def upsert_file_with_tmdb_info(file_info, tmdb_type, tmdb_id, bot):
                         reply_markup=keyboard
                     )
                 )
-                await asyncio.sleep(3)
+                await asyncio.sleep(API_CALL_DELAY)
         except Exception as e:
-            logger.error(f" info error {e}")
+            logger.error(f" info error {e}", extra={"tmdb_id": tmdb_id, "tmdb_type": tmdb_type})
+
 
 
+# =========================
+# File Delivery
+# =========================
+
+async def get_delivery_record(link_key, channel_id, message_id):
+    """
+    Stored file_ids and caption for a deep link, or None if the file is not indexed.
+    Records indexed before link_key existed are found by (channel_id, message_id).
+    """
+    return await tmdb_files_col.find_one(
+        {"$or": [{"link_key": link_key}, {"channel_id": channel_id, "message_id": message_id}]},
+        {"_id": 0, "link_key": 1, "file_ids": 1, "caption": 1}
+    )
+
+async def remember_file_id(channel_id, message_id, file_key, file_id):
+    """Store (or replace a stale) file_id for one bot after a copy_message fallback."""
+    await tmdb_files_col.update_one(
+        {"channel_id": channel_id, "message_id": message_id},
+        {"$set": {f"file_ids.{file_key}": file_id, "link_key": make_link_key(channel_id, message_id)}}
+    )
+
+# =========================
+# Release Filters
+# =========================
+
+async def refresh_title_filters(titles):
+    """
+    Recompute the filter arrays (resolutions, qualities, codecs, seasons) of
+    (tmdb_type, tmdb_id) titles from their remaining files. Ingest only adds
+    values, so this runs after files are removed or re-parsed.
+    """
+    titles = list(dict.fromkeys(titles))
+    if not titles:
+        return
+    releases = {title: [] for title in titles}
+    cursor = tmdb_files_col.find(
+        {"$or": [{"tmdb_type": tmdb_type, "tmdb_id": tmdb_id} for tmdb_type, tmdb_id in titles]},
+        {"_id": 0, "tmdb_type": 1, "tmdb_id": 1, **{field: 1 for field in RELEASE_FIELDS}}
+    )
+    async for doc in cursor:
+        releases.setdefault((doc.get("tmdb_type"), doc.get("tmdb_id")), []).append(doc)
+    await files_col.bulk_write([
+        UpdateOne({"tmdb_type": tmdb_type, "tmdb_id": tmdb_id}, {"$set": title_filter_values(docs)})
+        for (tmdb_type, tmdb_id), docs in releases.items()
+    ], ordered=False)
+
+# =========================
+# Catalog Deletes
+# =========================
+
+async def delete_indexed_file(channel_id, message_id):
+    """Delete one file by its indexed (channel_id, message_id) key. Returns True if it existed."""
+    entry = await tmdb_files_col.find_one_and_delete(
+        {"channel_id": channel_id, "message_id": message_id},
+        {"tmdb_type": 1, "tmdb_id": 1, "file_name": 1}
+    )
+    if not entry:
+        return False
+    if entry.get("file_name"):
+        await release_file_name(entry["file_name"])  # The name may be posted again
+    tmdb_type, tmdb_id = entry.get("tmdb_type"), entry.get("tmdb_id")
+    # The title may have lost its only 720p file, season 2, ...
+    await refresh_title_filters([(tmdb_type, tmdb_id)])
+    await change_log.record([
+        title_change("upsert", tmdb_type, tmdb_id),
+        file_change("delete", channel_id, message_id, tmdb_type, tmdb_id),
+    ])
+    await asyncio.to_thread(invalidate_caches, *CATALOG_CACHES)
+    return True
+
+async def delete_tmdb_entry(tmdb_type, tmdb_id):
+    """Delete a TMDB title and all files linked to it. Returns True if the title existed."""
+    async with title_lock(tmdb_type, tmdb_id):
+        entry = await files_col.find_one_and_delete({"tmdb_type": tmdb_type, "tmdb_id": tmdb_id})
+        if entry:
+            await apply_facet_delta(entry, None)
+    if not entry:
+        return False
+    query = {"tmdb_type": tmdb_type, "tmdb_id": tmdb_id}
+    files = await tmdb_files_col.find(query, {"_id": 0, "channel_id": 1, "message_id": 1}).to_list(length=None)
+    await tmdb_files_col.delete_many(query)
+    await change_log.record(
+        [title_change("delete", tmdb_type, tmdb_id)]
+        + [file_change("delete", f["channel_id"], f["message_id"], tmdb_type, tmdb_id) for f in files]
+    )
+    await asyncio.to_thread(invalidate_caches, *CATALOG_CACHES)
+    return True